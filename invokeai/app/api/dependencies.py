@@ -2,6 +2,7 @@
 
 from logging import Logger
 
+from invokeai.backend.model_management.model_cache import GIG
 from invokeai.backend.util.logging import InvokeAILogger
 from invokeai.version.invokeai_version import __version__
 
@@ -14,20 +15,25 @@ from ..services.image_files.image_files_disk import DiskImageFileStorage
 from ..services.image_records.image_records_sqlite import SqliteImageRecordStorage
 from ..services.images.images_default import ImageService
 from ..services.invocation_cache.invocation_cache_memory import MemoryInvocationCache
+from ..services.invocation_cache.invocation_cache_sqlite import SqliteInvocationCache
 from ..services.invocation_processor.invocation_processor_default import DefaultInvocationProcessor
 from ..services.invocation_queue.invocation_queue_memory import MemoryInvocationQueue
 from ..services.invocation_services import InvocationServices
 from ..services.invocation_stats.invocation_stats_default import InvocationStatsService
 from ..services.invoker import Invoker
+from ..services.item_storage.graph_execution_state_sqlite import SqliteGraphExecutionStateStorage
 from ..services.item_storage.item_storage_sqlite import SqliteItemStorage
+from ..services.latents_reclaimer.latents_reclaimer_default import DiskLatentsReclaimer
 from ..services.latents_storage.latents_storage_disk import DiskLatentsStorage
 from ..services.latents_storage.latents_storage_forward_cache import ForwardCacheLatentsStorage
+from ..services.latents_storage.latents_storage_mmap import MmapLatentsStorage
 from ..services.model_manager.model_manager_default import ModelManagerService
+from ..services.model_prefetcher.model_prefetcher_default import DefaultModelPrefetcher
 from ..services.names.names_default import SimpleNameService
 from ..services.session_processor.session_processor_default import DefaultSessionProcessor
 from ..services.session_queue.session_queue_sqlite import SqliteSessionQueue
 from ..services.shared.default_graphs import create_system_graphs
-from ..services.shared.graph import GraphExecutionState, LibraryGraph
+from ..services.shared.graph import LibraryGraph
 from ..services.shared.sqlite import SqliteDatabase
 from ..services.urls.urls_default import LocalUrlService
 from .events import FastAPIEventService
@@ -56,6 +62,7 @@ class ApiDependencies:
     """Contains and initializes all dependencies for the API"""
 
     invoker: Invoker
+    db: SqliteDatabase
 
     @staticmethod
     def initialize(config: InvokeAIAppConfig, event_handler_id: int, logger: Logger = logger):
@@ -75,19 +82,40 @@ class ApiDependencies:
         board_records = SqliteBoardRecordStorage(db=db)
         boards = BoardService()
         events = FastAPIEventService(event_handler_id)
-        graph_execution_manager = SqliteItemStorage[GraphExecutionState](db=db, table_name="graph_executions")
+        graph_execution_manager = SqliteGraphExecutionStateStorage(db=db, table_name="graph_executions")
         graph_library = SqliteItemStorage[LibraryGraph](db=db, table_name="graphs")
-        image_files = DiskImageFileStorage(f"{output_folder}/images")
+        image_files = DiskImageFileStorage(f"{output_folder}/images", max_cache_size=int(config.image_cache_size * GIG))
         image_records = SqliteImageRecordStorage(db=db)
         images = ImageService()
-        invocation_cache = MemoryInvocationCache(max_cache_size=config.node_cache_size)
-        latents = ForwardCacheLatentsStorage(DiskLatentsStorage(f"{output_folder}/latents"))
+        memory_invocation_cache = MemoryInvocationCache(max_cache_size=config.node_cache_size)
+        invocation_cache = (
+            SqliteInvocationCache(db, memory_invocation_cache, max_disk_size=int(config.node_cache_disk_size * GIG))
+            if config.node_cache_disk_size > 0 and not config.use_memory_db
+            else memory_invocation_cache
+        )
+        latents_disk_storage = (
+            MmapLatentsStorage(f"{output_folder}/latents")
+            if config.latents_storage == "mmap"
+            else DiskLatentsStorage(f"{output_folder}/latents")
+        )
+        latents = ForwardCacheLatentsStorage(
+            latents_disk_storage,
+            max_cache_size=int(config.latents_cache_size * GIG),
+            write_behind=config.latents_write_behind,
+            max_pending_writes=config.latents_max_pending_writes,
+        )
+        latents_reclaimer = DiskLatentsReclaimer(f"{output_folder}/latents", enabled=config.reclaim_latents)
         model_manager = ModelManagerService(config, logger)
+        model_prefetcher = DefaultModelPrefetcher(lookahead=config.prefetch_models)
         names = SimpleNameService()
         performance_statistics = InvocationStatsService()
-        processor = DefaultInvocationProcessor()
+        processor = DefaultInvocationProcessor(
+            workers=(config.session_workers + config.cpu_session_workers) * config.node_workers
+        )
         queue = MemoryInvocationQueue()
-        session_processor = DefaultSessionProcessor()
+        session_processor = DefaultSessionProcessor(
+            workers=config.session_workers, cpu_workers=config.cpu_session_workers
+        )
         session_queue = SqliteSessionQueue(db=db)
         urls = LocalUrlService()
 
@@ -105,8 +133,10 @@ class ApiDependencies:
             images=images,
             invocation_cache=invocation_cache,
             latents=latents,
+            latents_reclaimer=latents_reclaimer,
             logger=logger,
             model_manager=model_manager,
+            model_prefetcher=model_prefetcher,
             names=names,
             performance_statistics=performance_statistics,
             processor=processor,
@@ -119,6 +149,7 @@ class ApiDependencies:
         create_system_graphs(services.graph_library)
 
         ApiDependencies.invoker = Invoker(services)
+        ApiDependencies.db = db
 
         db.clean()
 
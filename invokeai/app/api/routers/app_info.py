@@ -7,7 +7,10 @@ from fastapi.routing import APIRouter
 from pydantic import BaseModel, Field
 
 from invokeai.app.invocations.upscale import ESRGAN_MODELS
+from invokeai.app.services.image_files.image_files_common import ImageFileCacheStatus
 from invokeai.app.services.invocation_cache.invocation_cache_common import InvocationCacheStatus
+from invokeai.app.services.latents_reclaimer.latents_reclaimer_common import LatentsReclaimerStatus
+from invokeai.app.services.shared.sqlite import SqliteDatabaseStatus
 from invokeai.backend.image_util.invisible_watermark import InvisibleWatermark
 from invokeai.backend.image_util.patchmatch import PatchMatch
 from invokeai.backend.image_util.safety_checker import SafetyChecker
@@ -144,3 +147,33 @@ async def disable_invocation_cache() -> None:
 async def get_invocation_cache_status() -> InvocationCacheStatus:
     """Clears the invocation cache"""
     return ApiDependencies.invoker.services.invocation_cache.get_status()
+
+
+@app_router.get(
+    "/image_cache/status",
+    operation_id="get_image_cache_status",
+    responses={200: {"model": ImageFileCacheStatus}},
+)
+async def get_image_cache_status() -> ImageFileCacheStatus:
+    """Gets the status of the decoded image cache"""
+    return ApiDependencies.invoker.services.image_files.get_cache_status()
+
+
+@app_router.get(
+    "/latents_reclaimer/status",
+    operation_id="get_latents_reclaimer_status",
+    responses={200: {"model": LatentsReclaimerStatus}},
+)
+async def get_latents_reclaimer_status() -> LatentsReclaimerStatus:
+    """Gets the size of the latents directory and how much has been reclaimed from it"""
+    return ApiDependencies.invoker.services.latents_reclaimer.get_status()
+
+
+@app_router.get(
+    "/db/status",
+    operation_id="get_db_status",
+    responses={200: {"model": SqliteDatabaseStatus}},
+)
+async def get_db_status() -> SqliteDatabaseStatus:
+    """Gets lock contention and write batching statistics of the database"""
+    return ApiDependencies.db.get_status()
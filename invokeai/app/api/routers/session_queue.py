@@ -3,11 +3,14 @@ from typing import Optional
 from fastapi import Body, Path, Query
 from fastapi.routing import APIRouter
 from pydantic import BaseModel
+from starlette.exceptions import HTTPException
 
 from invokeai.app.services.session_processor.session_processor_common import SessionProcessorStatus
 from invokeai.app.services.session_queue.session_queue_common import (
     QUEUE_ITEM_STATUS,
     Batch,
+    BatchIdExistsError,
+    BatchPlan,
     BatchStatus,
     CancelByBatchIDsResult,
     ClearResult,
@@ -55,6 +58,7 @@ async def enqueue_graph(
     operation_id="enqueue_batch",
     responses={
         201: {"model": EnqueueBatchResult},
+        409: {"description": "A batch with this id, whose queue items use a different graph, is queued"},
     },
 )
 async def enqueue_batch(
@@ -64,7 +68,28 @@ async def enqueue_batch(
 ) -> EnqueueBatchResult:
     """Processes a batch and enqueues the output graphs for execution."""
 
-    return ApiDependencies.invoker.services.session_queue.enqueue_batch(queue_id=queue_id, batch=batch, prepend=prepend)
+    try:
+        return ApiDependencies.invoker.services.session_queue.enqueue_batch(
+            queue_id=queue_id, batch=batch, prepend=prepend
+        )
+    except BatchIdExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@session_queue_router.post(
+    "/{queue_id}/plan_batch",
+    operation_id="plan_batch",
+    responses={
+        200: {"model": BatchPlan},
+    },
+)
+async def plan_batch(
+    queue_id: str = Path(description="The queue id to perform this operation on"),
+    batch: Batch = Body(description="Batch to plan", embed=True),
+) -> BatchPlan:
+    """Calculates how many queue items a batch would create, and how many of them the queue has room for"""
+
+    return ApiDependencies.invoker.services.session_queue.plan_batch(queue_id=queue_id, batch=batch)
 
 
 @session_queue_router.get(
@@ -135,9 +160,8 @@ async def cancel_by_batch_ids(
 async def clear(
     queue_id: str = Path(description="The queue id to perform this operation on"),
 ) -> ClearResult:
-    """Clears the queue entirely, immediately canceling the currently-executing session"""
-    queue_item = ApiDependencies.invoker.services.session_queue.get_current(queue_id)
-    if queue_item is not None:
+    """Clears the queue entirely, immediately canceling the currently-executing sessions"""
+    for queue_item in ApiDependencies.invoker.services.session_queue.get_in_progress(queue_id):
         ApiDependencies.invoker.services.session_queue.cancel_queue_item(queue_item.item_id)
     clear_result = ApiDependencies.invoker.services.session_queue.clear(queue_id)
     return clear_result
@@ -306,7 +306,7 @@ def invoke_cli():
         queue=MemoryInvocationQueue(),
         graph_library=SqliteItemStorage[LibraryGraph](conn=db_conn, table_name="graphs"),
         graph_execution_manager=graph_execution_manager,
-        processor=DefaultInvocationProcessor(),
+        processor=DefaultInvocationProcessor(workers=config.node_workers),
         performance_statistics=InvocationStatsService(graph_execution_manager),
         logger=logger,
         configuration=config,
@@ -99,14 +99,16 @@ class CompelInvocation(BaseInvocation):
                 # print(traceback.format_exc())
                 print(f'Warn: trigger: "{trigger}" not found')
 
+        # The text encoder is shared by the nodes executing at the same time, so it is patched only once its context
+        # is entered, which keeps the others from using it until the patches are undone
         with (
-            ModelPatcher.apply_lora_text_encoder(text_encoder_info.context.model, _lora_loader()),
-            ModelPatcher.apply_ti(tokenizer_info.context.model, text_encoder_info.context.model, ti_list) as (
+            text_encoder_info as text_encoder,
+            ModelPatcher.apply_lora_text_encoder(text_encoder, _lora_loader()),
+            ModelPatcher.apply_ti(tokenizer_info.context.model, text_encoder, ti_list) as (
                 tokenizer,
                 ti_manager,
             ),
-            ModelPatcher.apply_clip_skip(text_encoder_info.context.model, self.clip.skipped_layers),
-            text_encoder_info as text_encoder,
+            ModelPatcher.apply_clip_skip(text_encoder, self.clip.skipped_layers),
         ):
             compel = Compel(
                 tokenizer=tokenizer,
@@ -214,14 +216,15 @@ class SDXLPromptInvocationBase:
                 # print(traceback.format_exc())
                 print(f'Warn: trigger: "{trigger}" not found')
 
+        # Patched only once its context is entered, as in CompelInvocation
         with (
-            ModelPatcher.apply_lora(text_encoder_info.context.model, _lora_loader(), lora_prefix),
-            ModelPatcher.apply_ti(tokenizer_info.context.model, text_encoder_info.context.model, ti_list) as (
+            text_encoder_info as text_encoder,
+            ModelPatcher.apply_lora(text_encoder, _lora_loader(), lora_prefix),
+            ModelPatcher.apply_ti(tokenizer_info.context.model, text_encoder, ti_list) as (
                 tokenizer,
                 ti_manager,
             ),
-            ModelPatcher.apply_clip_skip(text_encoder_info.context.model, clip_field.skipped_layers),
-            text_encoder_info as text_encoder,
+            ModelPatcher.apply_clip_skip(text_encoder, clip_field.skipped_layers),
         ):
             compel = Compel(
                 tokenizer=tokenizer,
@@ -652,11 +652,13 @@ class DenoiseLatentsInvocation(BaseInvocation):
                 **self.unet.unet.dict(),
                 context=context,
             )
+            # The UNet is shared by the nodes executing at the same time, so it is patched only once its context is
+            # entered, which keeps the others from using it until the patches are undone
             with (
                 ExitStack() as exit_stack,
-                ModelPatcher.apply_lora_unet(unet_info.context.model, _lora_loader()),
-                set_seamless(unet_info.context.model, self.unet.seamless_axes),
                 unet_info as unet,
+                ModelPatcher.apply_lora_unet(unet, _lora_loader()),
+                set_seamless(unet, self.unet.seamless_axes),
             ):
                 latents = latents.to(device=unet.device, dtype=unet.dtype)
                 if noise is not None:
@@ -758,7 +760,8 @@ class LatentsToImageInvocation(BaseInvocation):
             context=context,
         )
 
-        with set_seamless(vae_info.context.model, self.vae.seamless_axes), vae_info as vae:
+        # Patched only once its context is entered, as in DenoiseLatentsInvocation
+        with vae_info as vae, set_seamless(vae, self.vae.seamless_axes):
             latents = latents.to(vae.device)
             if self.fp32:
                 vae.to(dtype=torch.float32)
@@ -1,21 +1,22 @@
 import sqlite3
-import threading
 from typing import Optional, cast
 
 from invokeai.app.services.image_records.image_records_common import ImageRecord, deserialize_image_record
 from invokeai.app.services.shared.pagination import OffsetPaginatedResults
-from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.app.services.shared.sqlite import InstrumentedLock, SqliteDatabase
 
 from .board_image_records_base import BoardImageRecordStorageBase
 
 
 class SqliteBoardImageRecordStorage(BoardImageRecordStorageBase):
+    _db: SqliteDatabase
     _conn: sqlite3.Connection
     _cursor: sqlite3.Cursor
-    _lock: threading.Lock
+    _lock: InstrumentedLock
 
     def __init__(self, db: SqliteDatabase) -> None:
         super().__init__()
+        self._db = db
         self._lock = db.lock
         self._conn = db.conn
         self._cursor = self._conn.cursor()
@@ -126,9 +127,9 @@ class SqliteBoardImageRecordStorage(BoardImageRecordStorageBase):
         limit: int = 10,
     ) -> OffsetPaginatedResults[ImageRecord]:
         # TODO: this isn't paginated yet?
-        try:
-            self._lock.acquire()
-            self._cursor.execute(
+        with self._db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
                 """--sql
                 SELECT images.*
                 FROM board_images
@@ -138,27 +139,22 @@ class SqliteBoardImageRecordStorage(BoardImageRecordStorageBase):
                 """,
                 (board_id,),
             )
-            result = cast(list[sqlite3.Row], self._cursor.fetchall())
+            result = cast(list[sqlite3.Row], cursor.fetchall())
             images = list(map(lambda r: deserialize_image_record(dict(r)), result))
 
-            self._cursor.execute(
+            cursor.execute(
                 """--sql
                 SELECT COUNT(*) FROM images WHERE 1=1;
                 """
             )
-            count = cast(int, self._cursor.fetchone()[0])
+            count = cast(int, cursor.fetchone()[0])
 
-        except sqlite3.Error as e:
-            self._conn.rollback()
-            raise e
-        finally:
-            self._lock.release()
         return OffsetPaginatedResults(items=images, offset=offset, limit=limit, total=count)
 
     def get_all_board_image_names_for_board(self, board_id: str) -> list[str]:
-        try:
-            self._lock.acquire()
-            self._cursor.execute(
+        with self._db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
                 """--sql
                 SELECT image_name
                 FROM board_images
@@ -166,22 +162,17 @@ class SqliteBoardImageRecordStorage(BoardImageRecordStorageBase):
                 """,
                 (board_id,),
             )
-            result = cast(list[sqlite3.Row], self._cursor.fetchall())
+            result = cast(list[sqlite3.Row], cursor.fetchall())
             image_names = list(map(lambda r: r[0], result))
             return image_names
-        except sqlite3.Error as e:
-            self._conn.rollback()
-            raise e
-        finally:
-            self._lock.release()
 
     def get_board_for_image(
         self,
         image_name: str,
     ) -> Optional[str]:
-        try:
-            self._lock.acquire()
-            self._cursor.execute(
+        with self._db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
                 """--sql
                 SELECT board_id
                 FROM board_images
@@ -189,29 +180,19 @@ class SqliteBoardImageRecordStorage(BoardImageRecordStorageBase):
                 """,
                 (image_name,),
             )
-            result = self._cursor.fetchone()
+            result = cursor.fetchone()
             if result is None:
                 return None
             return cast(str, result[0])
-        except sqlite3.Error as e:
-            self._conn.rollback()
-            raise e
-        finally:
-            self._lock.release()
 
     def get_image_count_for_board(self, board_id: str) -> int:
-        try:
-            self._lock.acquire()
-            self._cursor.execute(
+        with self._db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
                 """--sql
                 SELECT COUNT(*) FROM board_images WHERE board_id = ?;
                 """,
                 (board_id,),
             )
-            count = cast(int, self._cursor.fetchone()[0])
+            count = cast(int, cursor.fetchone()[0])
             return count
-        except sqlite3.Error as e:
-            self._conn.rollback()
-            raise e
-        finally:
-            self._lock.release()
@@ -1,9 +1,8 @@
 import sqlite3
-import threading
 from typing import Union, cast
 
 from invokeai.app.services.shared.pagination import OffsetPaginatedResults
-from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.app.services.shared.sqlite import InstrumentedLock, SqliteDatabase
 from invokeai.app.util.misc import uuid_string
 
 from .board_records_base import BoardRecordStorageBase
@@ -18,12 +17,14 @@ from .board_records_common import (
 
 
 class SqliteBoardRecordStorage(BoardRecordStorageBase):
+    _db: SqliteDatabase
     _conn: sqlite3.Connection
     _cursor: sqlite3.Cursor
-    _lock: threading.Lock
+    _lock: InstrumentedLock
 
     def __init__(self, db: SqliteDatabase) -> None:
         super().__init__()
+        self._db = db
         self._lock = db.lock
         self._conn = db.conn
         self._cursor = self._conn.cursor()
@@ -121,22 +122,20 @@ class SqliteBoardRecordStorage(BoardRecordStorageBase):
         board_id: str,
     ) -> BoardRecord:
         try:
-            self._lock.acquire()
-            self._cursor.execute(
-                """--sql
-                SELECT *
-                FROM boards
-                WHERE board_id = ?;
-                """,
-                (board_id,),
-            )
+            with self._db.read() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """--sql
+                    SELECT *
+                    FROM boards
+                    WHERE board_id = ?;
+                    """,
+                    (board_id,),
+                )
 
-            result = cast(Union[sqlite3.Row, None], self._cursor.fetchone())
+                result = cast(Union[sqlite3.Row, None], cursor.fetchone())
         except sqlite3.Error as e:
-            self._conn.rollback()
             raise BoardRecordNotFoundException from e
-        finally:
-            self._lock.release()
         if result is None:
             raise BoardRecordNotFoundException
         return BoardRecord(**dict(result))
@@ -184,11 +183,11 @@ class SqliteBoardRecordStorage(BoardRecordStorageBase):
         offset: int = 0,
         limit: int = 10,
     ) -> OffsetPaginatedResults[BoardRecord]:
-        try:
-            self._lock.acquire()
+        with self._db.read() as conn:
+            cursor = conn.cursor()
 
             # Get all the boards
-            self._cursor.execute(
+            cursor.execute(
                 """--sql
                 SELECT *
                 FROM boards
@@ -198,11 +197,11 @@ class SqliteBoardRecordStorage(BoardRecordStorageBase):
                 (limit, offset),
             )
 
-            result = cast(list[sqlite3.Row], self._cursor.fetchall())
+            result = cast(list[sqlite3.Row], cursor.fetchall())
             boards = list(map(lambda r: deserialize_board_record(dict(r)), result))
 
             # Get the total number of boards
-            self._cursor.execute(
+            cursor.execute(
                 """--sql
                 SELECT COUNT(*)
                 FROM boards
@@ -210,24 +209,18 @@ class SqliteBoardRecordStorage(BoardRecordStorageBase):
                 """
             )
 
-            count = cast(int, self._cursor.fetchone()[0])
+            count = cast(int, cursor.fetchone()[0])
 
             return OffsetPaginatedResults[BoardRecord](items=boards, offset=offset, limit=limit, total=count)
 
-        except sqlite3.Error as e:
-            self._conn.rollback()
-            raise e
-        finally:
-            self._lock.release()
-
     def get_all(
         self,
     ) -> list[BoardRecord]:
-        try:
-            self._lock.acquire()
+        with self._db.read() as conn:
+            cursor = conn.cursor()
 
             # Get all the boards
-            self._cursor.execute(
+            cursor.execute(
                 """--sql
                 SELECT *
                 FROM boards
@@ -235,13 +228,7 @@ class SqliteBoardRecordStorage(BoardRecordStorageBase):
                 """
             )
 
-            result = cast(list[sqlite3.Row], self._cursor.fetchall())
+            result = cast(list[sqlite3.Row], cursor.fetchall())
             boards = list(map(lambda r: deserialize_board_record(dict(r)), result))
 
             return boards
-
-        except sqlite3.Error as e:
-            self._conn.rollback()
-            raise e
-        finally:
-            self._lock.release()
@@ -45,6 +45,19 @@ InvokeAI:
     ram: 13.5
     vram: 0.25
     lazy_offload: true
+    prefetch_models: 2
+    model_cache_eviction: lru
+  Storage:
+    image_cache_size: 0.5
+    latents_storage: torch
+    latents_cache_size: 0.25
+    reclaim_latents: true
+    latents_write_behind: false
+    latents_max_pending_writes: 20
+    db_cache_size: 64
+    db_mmap_size: 256
+    db_busy_timeout: 5.0
+    db_read_connections: 4
   Device:
     device: auto
     precision: auto
@@ -244,6 +257,18 @@ class InvokeAIAppConfig(InvokeAISettings):
     ram                 : float = Field(default=7.5, gt=0, description="Maximum memory amount used by model cache for rapid switching (floating point number, GB)", category="Model Cache", )
     vram                : float = Field(default=0.25, ge=0, description="Amount of VRAM reserved for model storage (floating point number, GB)", category="Model Cache", )
     lazy_offload        : bool = Field(default=True, description="Keep models in VRAM until their space is needed", category="Model Cache", )
+    prefetch_models     : int = Field(default=2, ge=0, description="Number of pending queue items whose models are loaded into the model cache ahead of time, if they fit in its free room. Set to 0 to disable", category="Model Cache", )
+    model_cache_eviction: Literal["lru", "greedy_dual"] = Field(default="lru", description="Which models to unload from the model cache first when it is full: the least recently used, or (greedy_dual) those that are quickest to load again per GB and least often used", category="Model Cache", )
+    image_cache_size    : float = Field(default=0.5, ge=0, description="Maximum memory used to keep recently used images decoded (floating point number, GB). Set to 0 to disable", category="Storage", )
+    latents_storage     : Literal["torch", "mmap"] = Field(default="torch", description='How intermediate latents are written to disk. "torch" pickles them with torch.save; "mmap" uses a flat safetensors-style layout that is memory-mapped on load', category="Storage", )
+    latents_cache_size  : float = Field(default=0.25, ge=0, description="Maximum memory used to keep recently used latents and conditioning tensors in RAM (floating point number, GB)", category="Storage", )
+    reclaim_latents     : bool = Field(default=True, description="Delete a session's intermediate latents once its queue item is finished, unless the node cache still refers to them. At startup, also deletes every latents file the persistent node cache does not refer to, including those of sessions run outside the queue (the legacy /sessions API)", category="Storage", )
+    latents_write_behind: bool = Field(default=False, description="Write intermediate latents to disk on a background thread instead of blocking the node that produced them", category="Storage", )
+    latents_max_pending_writes: int = Field(default=20, gt=0, description="Maximum number of latents waiting to be written when latents_write_behind is enabled", category="Storage", )
+    db_cache_size       : int = Field(default=64, ge=0, description="Size of the SQLite page cache of each database connection (MB)", category="Storage", )
+    db_mmap_size        : int = Field(default=256, ge=0, description="How much of the database file SQLite may memory-map for reads (MB). Set to 0 to disable", category="Storage", )
+    db_busy_timeout     : float = Field(default=5.0, ge=0, description="How long a database connection waits for a lock held by another connection before failing (seconds)", category="Storage", )
+    db_read_connections : int = Field(default=4, ge=0, description="Number of read-only database connections, which let reads proceed while a write is in progress. Set to 0 to do all reads on the read-write connection", category="Storage", )
 
     # DEVICE
     device              : Literal["auto", "cpu", "cuda", "cuda:1", "mps"] = Field(default="auto", description="Generation device", category="Device", )
@@ -259,11 +284,15 @@ class InvokeAIAppConfig(InvokeAISettings):
 
     # QUEUE
     max_queue_size      : int = Field(default=10000, gt=0, description="Maximum number of items in the session queue", category="Queue", )
+    session_workers     : int = Field(default=1, gt=0, description="Number of queue items to process at the same time, so that a session that only needs the CPU does not wait for one that is generating. The workers share the model cache, so each needs room for its own models, and take turns to use (and patch) the models on the execution device", category="Queue", )
+    cpu_session_workers : int = Field(default=0, ge=0, description="Number of additional workers that only process queue items whose sessions don't use the execution device (no model, e.g. image processing), so that these don't wait for the session_workers", category="Queue", )
 
     # NODES
     allow_nodes         : Optional[List[str]] = Field(default=None, description="List of nodes to allow. Omit to allow all.", category="Nodes")
     deny_nodes          : Optional[List[str]] = Field(default=None, description="List of nodes to deny. Omit to deny none.", category="Nodes")
     node_cache_size     : int = Field(default=512, description="How many cached nodes to keep in memory", category="Nodes", )
+    node_workers        : int = Field(default=1, gt=0, description="Number of independent nodes of a session to execute at the same time. Nodes using (or patching) a model on the execution device still take turns", category="Nodes", )
+    node_cache_disk_size: float = Field(default=0.0, ge=0, description="Maximum disk space used to persist cached node outputs in the database, so they survive restarts (floating point number, GB). Set to 0 to keep the node cache in memory only", category="Nodes", )
 
     # DEPRECATED FIELDS - STILL HERE IN ORDER TO OBTAN VALUES FROM PRE-3.1 CONFIG FILES
     always_use_cpu      : bool = Field(default=False, description="If true, use the CPU for rendering even if a GPU is available.", category='Memory/Performance')
@@ -3,6 +3,8 @@ from typing import Optional
 
 from PIL.Image import Image as PILImageType
 
+from .image_files_common import ImageFileCacheStatus
+
 
 class ImageFileStorageBase(ABC):
     """Low-level service responsible for storing and retrieving image files."""
@@ -40,3 +42,8 @@ class ImageFileStorageBase(ABC):
     def delete(self, image_name: str) -> None:
         """Deletes an image and its thumbnail (if one exists)."""
         pass
+
+    @abstractmethod
+    def get_cache_status(self) -> ImageFileCacheStatus:
+        """Returns the status of the decoded image cache."""
+        pass
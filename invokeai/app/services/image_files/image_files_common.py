@@ -1,3 +1,15 @@
+from pydantic import BaseModel, Field
+
+
+class ImageFileCacheStatus(BaseModel):
+    size: int = Field(description="The number of decoded images in the cache")
+    bytes: int = Field(description="The approximate memory used by the cached images, in bytes")
+    max_bytes: int = Field(description="The maximum memory the cache may use, in bytes")
+    hits: int = Field(description="The number of cache hits")
+    misses: int = Field(description="The number of cache misses")
+    evictions: int = Field(description="The number of images evicted to make room for others")
+
+
 # TODO: Should these excpetions subclass existing python exceptions?
 class ImageFileNotFoundException(Exception):
     """Raised when an image file is not found in storage."""
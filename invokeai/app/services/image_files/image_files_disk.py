@@ -1,8 +1,9 @@
 # Copyright (c) 2022 Kyle Schouviller (https://github.com/kyle0654) and the InvokeAI Team
 import json
+from collections import OrderedDict
 from pathlib import Path
-from queue import Queue
-from typing import Dict, Optional, Union
+from threading import Lock
+from typing import Optional, Union
 
 from PIL import Image, PngImagePlugin
 from PIL.Image import Image as PILImageType
@@ -12,22 +13,49 @@ from invokeai.app.services.invoker import Invoker
 from invokeai.app.util.thumbnails import get_thumbnail_name, make_thumbnail
 
 from .image_files_base import ImageFileStorageBase
-from .image_files_common import ImageFileDeleteException, ImageFileNotFoundException, ImageFileSaveException
+from .image_files_common import (
+    ImageFileCacheStatus,
+    ImageFileDeleteException,
+    ImageFileNotFoundException,
+    ImageFileSaveException,
+)
+
+# Bytes per band for PIL modes that are not 8 bits per band
+MODE_BAND_SIZES = {"I": 4, "F": 4, "I;16": 2, "I;16B": 2, "I;16L": 2, "I;16N": 2}
+
+
+def get_image_size_bytes(image: PILImageType) -> int:
+    """Approximates the in-memory size of a decoded image"""
+    return image.width * image.height * len(image.getbands()) * MODE_BAND_SIZES.get(image.mode, 1)
 
 
 class DiskImageFileStorage(ImageFileStorageBase):
-    """Stores images on disk"""
+    """Stores images on disk, keeping recently used decoded images in a byte-bounded LRU cache"""
 
     __output_folder: Path
-    __cache_ids: Queue  # TODO: this is an incredibly naive cache
-    __cache: Dict[Path, PILImageType]
+    __cache: OrderedDict[Path, PILImageType]
+    __cache_sizes: dict[Path, int]
+    __cache_lock: Lock
     __max_cache_size: int
+    __current_cache_size: int
+    __hits: int
+    __misses: int
+    __evictions: int
     __invoker: Invoker
 
-    def __init__(self, output_folder: Union[str, Path]):
-        self.__cache = dict()
-        self.__cache_ids = Queue()
-        self.__max_cache_size = 10  # TODO: get this from config
+    def __init__(self, output_folder: Union[str, Path], max_cache_size: int = 0):
+        """
+        :param output_folder: The folder in which images and thumbnails are stored
+        :param max_cache_size: Maximum size of the decoded image cache, in bytes. 0 disables the cache.
+        """
+        self.__cache = OrderedDict()
+        self.__cache_sizes = dict()
+        self.__cache_lock = Lock()
+        self.__max_cache_size = max_cache_size
+        self.__current_cache_size = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
 
         self.__output_folder: Path = output_folder if isinstance(output_folder, Path) else Path(output_folder)
         self.__thumbnails_folder = self.__output_folder / "thumbnails"
@@ -45,7 +73,9 @@ class DiskImageFileStorage(ImageFileStorageBase):
             if cache_item:
                 return cache_item
 
-            image = Image.open(image_path)
+            # Decode the whole image up front so we do not hold an open file handle in the cache
+            with Image.open(image_path) as image:
+                image.load()
             self.__set_cache(image_path, image)
             return image
         except FileNotFoundError as e:
@@ -92,8 +122,8 @@ class DiskImageFileStorage(ImageFileStorageBase):
             thumbnail_image = make_thumbnail(image, thumbnail_size)
             thumbnail_image.save(thumbnail_path)
 
+            # Thumbnails are served straight from disk and never read through `get()`, so only cache the image
             self.__set_cache(image_path, image)
-            self.__set_cache(thumbnail_path, thumbnail_image)
         except Exception as e:
             raise ImageFileSaveException from e
 
@@ -103,16 +133,13 @@ class DiskImageFileStorage(ImageFileStorageBase):
 
             if image_path.exists():
                 send2trash(image_path)
-            if image_path in self.__cache:
-                del self.__cache[image_path]
+            self.__delete_cache(image_path)
 
             thumbnail_name = get_thumbnail_name(image_name)
             thumbnail_path = self.get_path(thumbnail_name, True)
 
             if thumbnail_path.exists():
                 send2trash(thumbnail_path)
-            if thumbnail_path in self.__cache:
-                del self.__cache[thumbnail_path]
         except Exception as e:
             raise ImageFileDeleteException from e
 
@@ -137,14 +164,47 @@ class DiskImageFileStorage(ImageFileStorageBase):
         for folder in folders:
             folder.mkdir(parents=True, exist_ok=True)
 
-    def __get_cache(self, image_name: Path) -> Optional[PILImageType]:
-        return None if image_name not in self.__cache else self.__cache[image_name]
-
-    def __set_cache(self, image_name: Path, image: PILImageType):
-        if image_name not in self.__cache:
-            self.__cache[image_name] = image
-            self.__cache_ids.put(image_name)  # TODO: this should refresh position for LRU cache
-            if len(self.__cache) > self.__max_cache_size:
-                cache_id = self.__cache_ids.get()
-                if cache_id in self.__cache:
-                    del self.__cache[cache_id]
+    def get_cache_status(self) -> ImageFileCacheStatus:
+        with self.__cache_lock:
+            return ImageFileCacheStatus(
+                size=len(self.__cache),
+                bytes=self.__current_cache_size,
+                max_bytes=self.__max_cache_size,
+                hits=self.__hits,
+                misses=self.__misses,
+                evictions=self.__evictions,
+            )
+
+    def __get_cache(self, image_path: Path) -> Optional[PILImageType]:
+        with self.__cache_lock:
+            image = self.__cache.get(image_path, None)
+            if image is None:
+                self.__misses += 1
+                return None
+            self.__hits += 1
+            self.__cache.move_to_end(image_path)
+            return image
+
+    def __set_cache(self, image_path: Path, image: PILImageType) -> None:
+        size = get_image_size_bytes(image)
+        with self.__cache_lock:
+            self.__delete_cache_item(image_path)
+            # Images larger than the whole cache would only flush everything else out
+            if size > self.__max_cache_size:
+                return
+            while self.__current_cache_size + size > self.__max_cache_size:
+                oldest_path, _ = self.__cache.popitem(last=False)
+                self.__current_cache_size -= self.__cache_sizes.pop(oldest_path)
+                self.__evictions += 1
+            self.__cache[image_path] = image
+            self.__cache_sizes[image_path] = size
+            self.__current_cache_size += size
+
+    def __delete_cache(self, image_path: Path) -> None:
+        with self.__cache_lock:
+            self.__delete_cache_item(image_path)
+
+    def __delete_cache_item(self, image_path: Path) -> None:
+        if image_path in self.__cache:
+            del self.__cache[image_path]
+            self.__current_cache_size -= self.__cache_sizes.pop(image_path)
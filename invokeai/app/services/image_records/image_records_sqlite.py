@@ -1,11 +1,10 @@
 import json
 import sqlite3
-import threading
 from datetime import datetime
 from typing import Optional, cast
 
 from invokeai.app.services.shared.pagination import OffsetPaginatedResults
-from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.app.services.shared.sqlite import InstrumentedLock, SqliteDatabase
 
 from .image_records_base import ImageRecordStorageBase
 from .image_records_common import (
@@ -22,12 +21,14 @@ from .image_records_common import (
 
 
 class SqliteImageRecordStorage(ImageRecordStorageBase):
+    _db: SqliteDatabase
     _conn: sqlite3.Connection
     _cursor: sqlite3.Cursor
-    _lock: threading.Lock
+    _lock: InstrumentedLock
 
     def __init__(self, db: SqliteDatabase) -> None:
         super().__init__()
+        self._db = db
         self._lock = db.lock
         self._conn = db.conn
         self._cursor = self._conn.cursor()
@@ -119,22 +120,19 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
 
     def get(self, image_name: str) -> Optional[ImageRecord]:
         try:
-            self._lock.acquire()
-
-            self._cursor.execute(
-                f"""--sql
-                SELECT {IMAGE_DTO_COLS} FROM images
-                WHERE image_name = ?;
-                """,
-                (image_name,),
-            )
+            with self._db.read() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"""--sql
+                    SELECT {IMAGE_DTO_COLS} FROM images
+                    WHERE image_name = ?;
+                    """,
+                    (image_name,),
+                )
 
-            result = cast(Optional[sqlite3.Row], self._cursor.fetchone())
+                result = cast(Optional[sqlite3.Row], cursor.fetchone())
         except sqlite3.Error as e:
-            self._conn.rollback()
             raise ImageRecordNotFoundException from e
-        finally:
-            self._lock.release()
 
         if not result:
             raise ImageRecordNotFoundException
@@ -143,25 +141,23 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
 
     def get_metadata(self, image_name: str) -> Optional[dict]:
         try:
-            self._lock.acquire()
-
-            self._cursor.execute(
-                """--sql
-                SELECT images.metadata FROM images
-                WHERE image_name = ?;
-                """,
-                (image_name,),
-            )
+            with self._db.read() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """--sql
+                    SELECT images.metadata FROM images
+                    WHERE image_name = ?;
+                    """,
+                    (image_name,),
+                )
 
-            result = cast(Optional[sqlite3.Row], self._cursor.fetchone())
-            if not result or not result[0]:
-                return None
-            return json.loads(result[0])
+                result = cast(Optional[sqlite3.Row], cursor.fetchone())
         except sqlite3.Error as e:
-            self._conn.rollback()
             raise ImageRecordNotFoundException from e
-        finally:
-            self._lock.release()
+
+        if not result or not result[0]:
+            return None
+        return json.loads(result[0])
 
     def update(
         self,
@@ -230,94 +226,89 @@ class SqliteImageRecordStorage(ImageRecordStorageBase):
         is_intermediate: Optional[bool] = None,
         board_id: Optional[str] = None,
     ) -> OffsetPaginatedResults[ImageRecord]:
-        try:
-            self._lock.acquire()
-
-            # Manually build two queries - one for the count, one for the records
-            count_query = """--sql
-            SELECT COUNT(*)
-            FROM images
-            LEFT JOIN board_images ON board_images.image_name = images.image_name
-            WHERE 1=1
-            """
-
-            images_query = f"""--sql
-            SELECT {IMAGE_DTO_COLS}
-            FROM images
-            LEFT JOIN board_images ON board_images.image_name = images.image_name
-            WHERE 1=1
+        # Manually build two queries - one for the count, one for the records
+        count_query = """--sql
+        SELECT COUNT(*)
+        FROM images
+        LEFT JOIN board_images ON board_images.image_name = images.image_name
+        WHERE 1=1
+        """
+
+        images_query = f"""--sql
+        SELECT {IMAGE_DTO_COLS}
+        FROM images
+        LEFT JOIN board_images ON board_images.image_name = images.image_name
+        WHERE 1=1
+        """
+
+        query_conditions = ""
+        query_params = []
+
+        if image_origin is not None:
+            query_conditions += """--sql
+            AND images.image_origin = ?
             """
+            query_params.append(image_origin.value)
 
-            query_conditions = ""
-            query_params = []
+        if categories is not None:
+            # Convert the enum values to unique list of strings
+            category_strings = list(map(lambda c: c.value, set(categories)))
+            # Create the correct length of placeholders
+            placeholders = ",".join("?" * len(category_strings))
 
-            if image_origin is not None:
-                query_conditions += """--sql
-                AND images.image_origin = ?
-                """
-                query_params.append(image_origin.value)
-
-            if categories is not None:
-                # Convert the enum values to unique list of strings
-                category_strings = list(map(lambda c: c.value, set(categories)))
-                # Create the correct length of placeholders
-                placeholders = ",".join("?" * len(category_strings))
+            query_conditions += f"""--sql
+            AND images.image_category IN ( {placeholders} )
+            """
 
-                query_conditions += f"""--sql
-                AND images.image_category IN ( {placeholders} )
-                """
+            # Unpack the included categories into the query params
+            for c in category_strings:
+                query_params.append(c)
 
-                # Unpack the included categories into the query params
-                for c in category_strings:
-                    query_params.append(c)
+        if is_intermediate is not None:
+            query_conditions += """--sql
+            AND images.is_intermediate = ?
+            """
 
-            if is_intermediate is not None:
-                query_conditions += """--sql
-                AND images.is_intermediate = ?
-                """
+            query_params.append(is_intermediate)
 
-                query_params.append(is_intermediate)
+        # board_id of "none" is reserved for images without a board
+        if board_id == "none":
+            query_conditions += """--sql
+            AND board_images.board_id IS NULL
+            """
+        elif board_id is not None:
+            query_conditions += """--sql
+            AND board_images.board_id = ?
+            """
+            query_params.append(board_id)
 
-            # board_id of "none" is reserved for images without a board
-            if board_id == "none":
-                query_conditions += """--sql
-                AND board_images.board_id IS NULL
-                """
-            elif board_id is not None:
-                query_conditions += """--sql
-                AND board_images.board_id = ?
-                """
-                query_params.append(board_id)
+        query_pagination = """--sql
+        ORDER BY images.starred DESC, images.created_at DESC LIMIT ? OFFSET ?
+        """
 
-            query_pagination = """--sql
-            ORDER BY images.starred DESC, images.created_at DESC LIMIT ? OFFSET ?
-            """
+        # Final images query with pagination
+        images_query += query_conditions + query_pagination + ";"
+        # Add all the parameters
+        images_params = query_params.copy()
 
-            # Final images query with pagination
-            images_query += query_conditions + query_pagination + ";"
-            # Add all the parameters
-            images_params = query_params.copy()
+        if limit is not None:
+            images_params.append(limit)
+        if offset is not None:
+            images_params.append(offset)
 
-            if limit is not None:
-                images_params.append(limit)
-            if offset is not None:
-                images_params.append(offset)
+        # Set up the count query, without pagination
+        count_query += query_conditions + ";"
+        count_params = query_params.copy()
 
+        with self._db.read() as conn:
+            cursor = conn.cursor()
             # Build the list of images, deserializing each row
-            self._cursor.execute(images_query, images_params)
-            result = cast(list[sqlite3.Row], self._cursor.fetchall())
+            cursor.execute(images_query, images_params)
+            result = cast(list[sqlite3.Row], cursor.fetchall())
             images = list(map(lambda r: deserialize_image_record(dict(r)), result))
 
-            # Set up and execute the count query, without pagination
-            count_query += query_conditions + ";"
-            count_params = query_params.copy()
-            self._cursor.execute(count_query, count_params)
-            count = cast(int, self._cursor.fetchone()[0])
-        except sqlite3.Error as e:
-            self._conn.rollback()
-            raise e
-        finally:
-            self._lock.release()
+            cursor.execute(count_query, count_params)
+            count = cast(int, cursor.fetchone()[0])
 
         return OffsetPaginatedResults(items=images, offset=offset, limit=limit, total=count)
 
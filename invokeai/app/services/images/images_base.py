@@ -19,10 +19,12 @@ class ImageServiceABC(ABC):
 
     _on_changed_callbacks: list[Callable[[ImageDTO], None]]
     _on_deleted_callbacks: list[Callable[[str], None]]
+    _on_deleted_many_callbacks: list[Callable[[list[str]], None]]
 
     def __init__(self) -> None:
         self._on_changed_callbacks = list()
         self._on_deleted_callbacks = list()
+        self._on_deleted_many_callbacks = list()
 
     def on_changed(self, on_changed: Callable[[ImageDTO], None]) -> None:
         """Register a callback for when an image is changed"""
@@ -32,13 +34,23 @@ class ImageServiceABC(ABC):
         """Register a callback for when an image is deleted"""
         self._on_deleted_callbacks.append(on_deleted)
 
+    def on_deleted_many(self, on_deleted_many: Callable[[list[str]], None]) -> None:
+        """Register a callback for when images are deleted, called once per batch of deleted images"""
+        self._on_deleted_many_callbacks.append(on_deleted_many)
+
     def _on_changed(self, item: ImageDTO) -> None:
         for callback in self._on_changed_callbacks:
             callback(item)
 
     def _on_deleted(self, item_id: str) -> None:
-        for callback in self._on_deleted_callbacks:
-            callback(item_id)
+        self._on_deleted_many([item_id])
+
+    def _on_deleted_many(self, item_ids: list[str]) -> None:
+        for item_id in item_ids:
+            for callback in self._on_deleted_callbacks:
+                callback(item_id)
+        for many_callback in self._on_deleted_many_callbacks:
+            many_callback(item_ids)
 
     @abstractmethod
     def create(
@@ -255,8 +255,7 @@ class ImageService(ImageServiceABC):
             for image_name in image_names:
                 self.__invoker.services.image_files.delete(image_name)
             self.__invoker.services.image_records.delete_many(image_names)
-            for image_name in image_names:
-                self._on_deleted(image_name)
+            self._on_deleted_many(image_names)
         except ImageRecordDeleteException:
             self.__invoker.services.logger.error("Failed to delete image records")
             raise
@@ -273,7 +272,7 @@ class ImageService(ImageServiceABC):
             count = len(image_names)
             for image_name in image_names:
                 self.__invoker.services.image_files.delete(image_name)
-                self._on_deleted(image_name)
+            self._on_deleted_many(image_names)
             return count
         except ImageRecordDeleteException:
             self.__invoker.services.logger.error("Failed to delete image records")
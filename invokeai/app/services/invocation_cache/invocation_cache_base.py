@@ -36,14 +36,22 @@ class InvocationCacheBase(ABC):
         """Deletes an invocation output from the cache"""
         pass
 
+    @abstractmethod
+    def references(self, name: str) -> bool:
+        """Whether any cached invocation output references the named image or latents"""
+        pass
+
     @abstractmethod
     def clear(self) -> None:
         """Clears the cache"""
         pass
 
     @abstractmethod
-    def create_key(self, invocation: BaseInvocation) -> int:
-        """Gets the key for the invocation's cache item"""
+    def create_key(self, invocation: BaseInvocation) -> str:
+        """
+        Gets the key for the invocation's cache item. Keys must be deterministic across processes, so that they can
+        be persisted or shared between workers.
+        """
         pass
 
     @abstractmethod
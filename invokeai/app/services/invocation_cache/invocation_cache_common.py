@@ -1,3 +1,8 @@
+import struct
+from enum import Enum
+from hashlib import blake2b
+from typing import Any, Callable
+
 from pydantic import BaseModel, Field
 
 
@@ -7,3 +12,76 @@ class InvocationCacheStatus(BaseModel):
     misses: int = Field(description="The number of cache misses")
     enabled: bool = Field(description="Whether the invocation cache is enabled")
     max_size: int = Field(description="The maximum size of the invocation cache")
+    disk_size: int = Field(default=0, description="The number of outputs persisted to the database")
+    disk_bytes: int = Field(default=0, description="The size of the outputs persisted to the database, in bytes")
+    max_disk_bytes: int = Field(default=0, description="The maximum size of the persisted outputs, in bytes")
+
+
+def create_content_key(model: BaseModel, exclude: frozenset[str] = frozenset({"id"})) -> str:
+    """
+    Computes a deterministic digest of a pydantic model's field values, excluding the given top-level fields.
+
+    Values are fed to blake2b in a canonical, type-tagged and length-prefixed encoding, with fields sorted by name,
+    so the digest is stable across processes and restarts, and does not need the model to be serialized to JSON.
+    """
+    digest = blake2b(digest_size=32)
+    _encode_model(digest.update, model, exclude)
+    return digest.hexdigest()
+
+
+def _encode_bytes(update: Callable[[bytes], None], tag: bytes, data: bytes) -> None:
+    update(tag)
+    update(struct.pack("<Q", len(data)))
+    update(data)
+
+
+def _encode_model(update: Callable[[bytes], None], model: BaseModel, exclude: frozenset[str] = frozenset()) -> None:
+    fields = sorted((item for item in model.__dict__.items() if item[0] not in exclude), key=lambda item: item[0])
+    _encode_bytes(update, b"M", type(model).__name__.encode("utf-8"))
+    update(struct.pack("<Q", len(fields)))
+    for name, value in fields:
+        _encode_bytes(update, b"K", name.encode("utf-8"))
+        _encode_value(update, value)
+
+
+def _encode_value(update: Callable[[bytes], None], value: Any) -> None:
+    # bool must be checked before int, and Enum before its str/int mixin type
+    if value is None:
+        update(b"N")
+    elif isinstance(value, bool):
+        update(b"T" if value else b"F")
+    elif isinstance(value, Enum):
+        _encode_value(update, value.value)
+    elif isinstance(value, int):
+        _encode_bytes(update, b"I", str(value).encode("ascii"))
+    elif isinstance(value, float):
+        _encode_bytes(update, b"D", value.hex().encode("ascii"))
+    elif isinstance(value, str):
+        _encode_bytes(update, b"S", value.encode("utf-8"))
+    elif isinstance(value, BaseModel):
+        _encode_model(update, value)
+    elif isinstance(value, (list, tuple)):
+        update(b"L")
+        update(struct.pack("<Q", len(value)))
+        for item in value:
+            _encode_value(update, item)
+    elif isinstance(value, (set, frozenset)):
+        # Iteration order depends on string hash randomization, so the elements are ordered by their encoding
+        elements = []
+        for item in value:
+            encoded: list[bytes] = []
+            _encode_value(encoded.append, item)
+            elements.append(b"".join(encoded))
+        update(b"E")
+        update(struct.pack("<Q", len(elements)))
+        for element in sorted(elements):
+            update(element)
+    elif isinstance(value, dict):
+        update(b"O")
+        update(struct.pack("<Q", len(value)))
+        for key in sorted(value, key=str):
+            _encode_value(update, str(key))
+            _encode_value(update, value[key])
+    else:
+        # Anything else (e.g. paths, datetimes) is encoded by its string representation, as json.dumps would
+        _encode_bytes(update, b"X", str(value).encode("utf-8"))
@@ -1,22 +1,39 @@
 from collections import OrderedDict
 from dataclasses import dataclass, field
 from threading import Lock
-from typing import Optional, Union
+from typing import Any, Iterable, Optional, Union
 
 from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
 from invokeai.app.services.invocation_cache.invocation_cache_base import InvocationCacheBase
-from invokeai.app.services.invocation_cache.invocation_cache_common import InvocationCacheStatus
+from invokeai.app.services.invocation_cache.invocation_cache_common import InvocationCacheStatus, create_content_key
 from invokeai.app.services.invoker import Invoker
 
 
 @dataclass(order=True)
 class CachedItem:
     invocation_output: BaseInvocationOutput = field(compare=False)
-    invocation_output_json: str = field(compare=False)
+    referenced_names: set[str] = field(compare=False)
+
+
+def get_referenced_names(value: Any) -> set[str]:
+    """Collects the strings in an invocation output's fields, which include any image or latents names"""
+    names: set[str] = set()
+    if isinstance(value, str):
+        names.add(value)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            # Every output has a constant `type`, which would put every cache entry under the same few names
+            if key != "type":
+                names |= get_referenced_names(item)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            names |= get_referenced_names(item)
+    return names
 
 
 class MemoryInvocationCache(InvocationCacheBase):
     _cache: OrderedDict[Union[int, str], CachedItem]
+    _references: dict[str, set[Union[int, str]]]
     _max_cache_size: int
     _disabled: bool
     _hits: int
@@ -26,6 +43,8 @@ class MemoryInvocationCache(InvocationCacheBase):
 
     def __init__(self, max_cache_size: int = 0) -> None:
         self._cache = OrderedDict()
+        # Reverse index of image/latents name => keys of the cached outputs that reference it
+        self._references = dict()
         self._max_cache_size = max_cache_size
         self._disabled = False
         self._hits = 0
@@ -36,7 +55,7 @@ class MemoryInvocationCache(InvocationCacheBase):
         self._invoker = invoker
         if self._max_cache_size == 0:
             return
-        self._invoker.services.images.on_deleted(self._delete_by_match)
+        self._invoker.services.images.on_deleted_many(self._delete_by_matches)
         self._invoker.services.latents.on_deleted(self._delete_by_match)
 
     def get(self, key: Union[int, str]) -> Optional[BaseInvocationOutput]:
@@ -58,34 +77,55 @@ class MemoryInvocationCache(InvocationCacheBase):
             # If the cache is full, we need to remove the least used
             number_to_delete = len(self._cache) + 1 - self._max_cache_size
             self._delete_oldest_access(number_to_delete)
-            self._cache[key] = CachedItem(invocation_output, invocation_output.json())
+            referenced_names = get_referenced_names(invocation_output.dict())
+            self._cache[key] = CachedItem(invocation_output, referenced_names)
+            for name in referenced_names:
+                self._references.setdefault(name, set()).add(key)
 
     def _delete_oldest_access(self, number_to_delete: int) -> None:
         number_to_delete = min(number_to_delete, len(self._cache))
         for _ in range(number_to_delete):
-            self._cache.popitem(last=False)
+            key, cached_item = self._cache.popitem(last=False)
+            self._unindex(key, cached_item)
 
     def _delete(self, key: Union[int, str]) -> None:
         if self._max_cache_size == 0:
             return
-        if key in self._cache:
-            del self._cache[key]
+        cached_item = self._cache.pop(key, None)
+        if cached_item is not None:
+            self._unindex(key, cached_item)
+
+    def _unindex(self, key: Union[int, str], cached_item: CachedItem) -> None:
+        for name in cached_item.referenced_names:
+            keys = self._references.get(name)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self._references[name]
 
     def delete(self, key: Union[int, str]) -> None:
         with self._lock:
             return self._delete(key)
 
+    def references(self, name: str) -> bool:
+        with self._lock:
+            if self._max_cache_size == 0:
+                return False
+            return name in self._references
+
     def clear(self, *args, **kwargs) -> None:
         with self._lock:
             if self._max_cache_size == 0:
                 return
             self._cache.clear()
+            self._references.clear()
             self._misses = 0
             self._hits = 0
 
     @staticmethod
-    def create_key(invocation: BaseInvocation) -> int:
-        return hash(invocation.json(exclude={"id"}))
+    def create_key(invocation: BaseInvocation) -> str:
+        return create_content_key(invocation)
 
     def disable(self) -> None:
         with self._lock:
@@ -110,17 +150,17 @@ class MemoryInvocationCache(InvocationCacheBase):
             )
 
     def _delete_by_match(self, to_match: str) -> None:
+        self._delete_by_matches([to_match])
+
+    def _delete_by_matches(self, to_match: Iterable[str]) -> None:
         with self._lock:
             if self._max_cache_size == 0:
                 return
-            keys_to_delete = set()
-            for key, cached_item in self._cache.items():
-                if to_match in cached_item.invocation_output_json:
-                    keys_to_delete.add(key)
+            keys_to_delete: set[Union[int, str]] = set()
+            for name in to_match:
+                keys_to_delete |= self._references.get(name, set())
             if not keys_to_delete:
                 return
             for key in keys_to_delete:
                 self._delete(key)
-            self._invoker.services.logger.debug(
-                f"Deleted {len(keys_to_delete)} cached invocation outputs for {to_match}"
-            )
+            self._invoker.services.logger.debug(f"Deleted {len(keys_to_delete)} cached invocation outputs")
@@ -0,0 +1,337 @@
+import json
+import sqlite3
+from typing import Iterable, Optional, Type, Union
+
+from pydantic import ValidationError
+
+from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
+from invokeai.app.services.invocation_cache.invocation_cache_base import InvocationCacheBase
+from invokeai.app.services.invocation_cache.invocation_cache_common import InvocationCacheStatus, create_content_key
+from invokeai.app.services.invocation_cache.invocation_cache_memory import MemoryInvocationCache, get_referenced_names
+from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.shared.sqlite import InstrumentedLock, SqliteDatabase
+from invokeai.version import __version__
+
+
+def get_output_type(output_type: str) -> Optional[Type[BaseInvocationOutput]]:
+    """Looks up an invocation output class by its `type`, e.g. "image_output" """
+    for output_class in BaseInvocationOutput.get_all_subclasses_tuple():
+        if output_class.__fields__["type"].default == output_type:
+            return output_class
+    return None
+
+
+class SqliteInvocationCache(InvocationCacheBase):
+    """
+    A two-tier invocation cache. Recently used outputs are kept in a `MemoryInvocationCache`, and every output is
+    also persisted to the database, so the cache survives restarts.
+
+    Outputs found in the database are promoted to the memory tier. The database tier is bounded by `max_disk_size`
+    bytes of serialized outputs, evicting the least recently used first. Outputs saved by a different version of
+    InvokeAI are dropped at startup, as the nodes that produced them may have changed.
+    """
+
+    _memory: MemoryInvocationCache
+    _conn: sqlite3.Connection
+    _cursor: sqlite3.Cursor
+    _lock: InstrumentedLock
+    _max_disk_size: int
+    _disk_size: int
+    _disabled: bool
+    _hits: int
+    _misses: int
+    _invoker: Invoker
+
+    def __init__(self, db: SqliteDatabase, memory_cache: MemoryInvocationCache, max_disk_size: int) -> None:
+        self._memory = memory_cache
+        self._lock = db.lock
+        self._conn = db.conn
+        self._cursor = self._conn.cursor()
+        self._max_disk_size = max_disk_size
+        self._disk_size = 0
+        self._disabled = False
+        self._hits = 0
+        self._misses = 0
+        self._create_tables()
+
+    def _create_tables(self) -> None:
+        try:
+            self._lock.acquire()
+            self._cursor.execute(
+                """--sql
+                CREATE TABLE IF NOT EXISTS invocation_cache (
+                    key TEXT NOT NULL PRIMARY KEY,
+                    output TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    version TEXT NOT NULL,
+                    accessed_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'))
+                );
+                """
+            )
+            self._cursor.execute(
+                """--sql
+                CREATE INDEX IF NOT EXISTS idx_invocation_cache_accessed_at ON invocation_cache(accessed_at);
+                """
+            )
+            # Reverse index of image/latents name => keys of the cached outputs that reference it
+            self._cursor.execute(
+                """--sql
+                CREATE TABLE IF NOT EXISTS invocation_cache_references (
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    PRIMARY KEY (name, key),
+                    FOREIGN KEY (key) REFERENCES invocation_cache (key) ON DELETE CASCADE
+                );
+                """
+            )
+            self._cursor.execute(
+                """--sql
+                CREATE INDEX IF NOT EXISTS idx_invocation_cache_references_key ON invocation_cache_references(key);
+                """
+            )
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            self._lock.release()
+
+    def start(self, invoker: Invoker) -> None:
+        self._invoker = invoker
+        self._memory.start(invoker)
+        if not self._is_enabled():
+            return
+        try:
+            self._lock.acquire()
+            self._cursor.execute("""DELETE FROM invocation_cache WHERE version != ?;""", (__version__,))
+            dropped = self._cursor.rowcount
+            self._conn.commit()
+            self._cursor.execute("""SELECT COALESCE(SUM(size), 0) FROM invocation_cache;""")
+            self._disk_size = self._cursor.fetchone()[0]
+            self._evict()
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            self._lock.release()
+        if dropped > 0:
+            self._invoker.services.logger.info(f"Dropped {dropped} cached invocation outputs from another version")
+        self._invoker.services.images.on_deleted_many(self._delete_by_matches)
+        self._invoker.services.latents.on_deleted(self._delete_by_match)
+
+    def _is_enabled(self) -> bool:
+        return self._max_disk_size > 0 and self._memory.get_status().max_size > 0
+
+    def get(self, key: Union[int, str]) -> Optional[BaseInvocationOutput]:
+        if not self._is_enabled() or self._disabled:
+            return self._memory.get(key)
+        invocation_output = self._memory.get(key)
+        if invocation_output is None:
+            invocation_output = self._get_from_disk(str(key))
+            if invocation_output is not None:
+                self._memory.save(key, invocation_output)
+        with self._lock:
+            if invocation_output is not None:
+                self._hits += 1
+            else:
+                self._misses += 1
+        return invocation_output
+
+    def _get_from_disk(self, key: str) -> Optional[BaseInvocationOutput]:
+        try:
+            self._lock.acquire()
+            self._cursor.execute("""SELECT output FROM invocation_cache WHERE key = ?;""", (key,))
+            result = self._cursor.fetchone()
+            if result is not None:
+                self._cursor.execute(
+                    """--sql
+                    UPDATE invocation_cache
+                    SET accessed_at = STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')
+                    WHERE key = ?;
+                    """,
+                    (key,),
+                )
+                self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            self._lock.release()
+        if result is None:
+            return None
+        try:
+            return self._parse_output(result[0])
+        except (ValidationError, ValueError) as e:
+            # The output's node may have been uninstalled, or its schema changed
+            self._invoker.services.logger.debug(f"Dropping unreadable cached invocation output {key}: {e}")
+            self.delete(key)
+            return None
+
+    @staticmethod
+    def _parse_output(output: str) -> BaseInvocationOutput:
+        # Outputs are only discriminated by `type`, so parse with the matching class rather than a plain union
+        output_type = json.loads(output).get("type", None)
+        output_class = get_output_type(output_type) if isinstance(output_type, str) else None
+        if output_class is None:
+            raise ValueError(f"Unknown invocation output type {output_type}")
+        return output_class.parse_raw(output)
+
+    def save(self, key: Union[int, str], invocation_output: BaseInvocationOutput) -> None:
+        self._memory.save(key, invocation_output)
+        if not self._is_enabled() or self._disabled:
+            return
+        output = invocation_output.json()
+        size = len(output.encode("utf-8"))
+        # Outputs larger than the whole tier would only flush everything else out
+        if size > self._max_disk_size:
+            return
+        referenced_names = get_referenced_names(invocation_output.dict())
+        try:
+            self._lock.acquire()
+            self._delete_from_disk([str(key)])
+            self._cursor.execute(
+                """--sql
+                INSERT INTO invocation_cache (key, output, size, version) VALUES (?, ?, ?, ?);
+                """,
+                (str(key), output, size, __version__),
+            )
+            self._cursor.executemany(
+                """--sql
+                INSERT INTO invocation_cache_references (name, key) VALUES (?, ?);
+                """,
+                [(name, str(key)) for name in referenced_names],
+            )
+            self._disk_size += size
+            self._evict()
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            self._lock.release()
+
+    def _evict(self) -> None:
+        """Deletes the least recently used outputs until the tier fits in `max_disk_size`. Caller must hold the lock."""
+        excess = self._disk_size - self._max_disk_size
+        if excess <= 0:
+            return
+        self._cursor.execute("""SELECT key, size FROM invocation_cache ORDER BY accessed_at, rowid;""")
+        keys: list[str] = []
+        for key, size in self._cursor:
+            keys.append(key)
+            excess -= size
+            if excess <= 0:
+                break
+        self._delete_from_disk(keys)
+
+    def _delete_from_disk(self, keys: list[str]) -> int:
+        """Deletes the given keys, returning how many were deleted. Caller must hold the lock."""
+        deleted = 0
+        for key in keys:
+            self._cursor.execute("""SELECT size FROM invocation_cache WHERE key = ?;""", (key,))
+            result = self._cursor.fetchone()
+            if result is None:
+                continue
+            # References are deleted by the foreign key cascade
+            self._cursor.execute("""DELETE FROM invocation_cache WHERE key = ?;""", (key,))
+            self._disk_size -= result[0]
+            deleted += 1
+        return deleted
+
+    def delete(self, key: Union[int, str]) -> None:
+        self._memory.delete(key)
+        try:
+            self._lock.acquire()
+            self._delete_from_disk([str(key)])
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            self._lock.release()
+
+    def references(self, name: str) -> bool:
+        if self._memory.references(name):
+            return True
+        if not self._is_enabled():
+            return False
+        try:
+            self._lock.acquire()
+            self._cursor.execute(
+                """--sql
+                SELECT 1 FROM invocation_cache_references WHERE name = ? LIMIT 1;
+                """,
+                (name,),
+            )
+            return self._cursor.fetchone() is not None
+        finally:
+            self._lock.release()
+
+    def clear(self, *args, **kwargs) -> None:
+        self._memory.clear()
+        try:
+            self._lock.acquire()
+            self._cursor.execute("""DELETE FROM invocation_cache;""")
+            self._disk_size = 0
+            self._hits = 0
+            self._misses = 0
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def create_key(invocation: BaseInvocation) -> str:
+        return create_content_key(invocation)
+
+    def disable(self) -> None:
+        self._memory.disable()
+        with self._lock:
+            self._disabled = True
+
+    def enable(self) -> None:
+        self._memory.enable()
+        with self._lock:
+            self._disabled = False
+
+    def get_status(self) -> InvocationCacheStatus:
+        status = self._memory.get_status()
+        if not self._is_enabled():
+            return status
+        try:
+            self._lock.acquire()
+            self._cursor.execute("""SELECT COUNT(*) FROM invocation_cache;""")
+            status.disk_size = self._cursor.fetchone()[0]
+            status.disk_bytes = self._disk_size
+            status.max_disk_bytes = self._max_disk_size
+            # A hit in either tier is a hit; the memory tier's misses include outputs found on disk
+            status.hits = self._hits
+            status.misses = self._misses
+        finally:
+            self._lock.release()
+        return status
+
+    def _delete_by_match(self, to_match: str) -> None:
+        self._delete_by_matches([to_match])
+
+    def _delete_by_matches(self, to_match: Iterable[str]) -> None:
+        # The memory tier registers its own handlers, so only the database tier is handled here
+        names = list(to_match)
+        try:
+            self._lock.acquire()
+            keys: set[str] = set()
+            for name in names:
+                self._cursor.execute("""SELECT key FROM invocation_cache_references WHERE name = ?;""", (name,))
+                keys.update(row[0] for row in self._cursor.fetchall())
+            deleted = self._delete_from_disk(list(keys))
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        finally:
+            self._lock.release()
+        if deleted > 0:
+            self._invoker.services.logger.debug(f"Deleted {deleted} persisted invocation outputs")
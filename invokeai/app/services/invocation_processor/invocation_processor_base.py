@@ -1,5 +1,26 @@
 from abc import ABC
+from typing import Callable
+
+from invokeai.app.services.invocation_queue.invocation_queue_common import InvocationQueueItem
+from invokeai.app.services.shared.graph import GraphExecutionState
 
 
 class InvocationProcessorABC(ABC):
-    pass
+    _on_session_complete_callbacks: list[Callable[[InvocationQueueItem, GraphExecutionState], None]]
+
+    def __init__(self) -> None:
+        self._on_session_complete_callbacks = list()
+
+    def on_session_complete(
+        self, on_session_complete: Callable[[InvocationQueueItem, GraphExecutionState], None]
+    ) -> None:
+        """
+        Register a callback for when a session has completed all invocations, with or without errors. It is called
+        from the processor's thread, with the last invocation's queue item, right after the
+        graph_execution_state_complete event is emitted and long before that event is handled.
+        """
+        self._on_session_complete_callbacks.append(on_session_complete)
+
+    def _on_session_complete(self, queue_item: InvocationQueueItem, graph_execution_state: GraphExecutionState) -> None:
+        for callback in self._on_session_complete_callbacks:
+            callback(queue_item, graph_execution_state)
@@ -1,38 +1,88 @@
 import time
 import traceback
-from threading import BoundedSemaphore, Event, Thread
+from threading import BoundedSemaphore, Event, Lock, Thread
 from typing import Optional
 
 import invokeai.backend.util.logging as logger
 from invokeai.app.invocations.baseinvocation import InvocationContext
 from invokeai.app.services.invocation_queue.invocation_queue_common import InvocationQueueItem
+from invokeai.app.services.shared.graph import GraphExecutionState
 
 from ..invoker import Invoker
 from .invocation_processor_base import InvocationProcessorABC
 from .invocation_processor_common import CanceledException
 
 
+class ExecutingSession:
+    """
+    The state of a session whose nodes are being invoked. Independent nodes of a session may be invoked on several
+    threads at once, which share this state and take turns to update it.
+    """
+
+    def __init__(self, graph_execution_state: GraphExecutionState) -> None:
+        self.graph_execution_state = graph_execution_state
+        self.lock = Lock()
+        # Whether the session's completion was handled, so that nodes still executing don't handle it again
+        self.is_finished = False
+
+
 class DefaultInvocationProcessor(InvocationProcessorABC):
-    __invoker_thread: Thread
+    __invoker_threads: list[Thread]
     __stop_event: Event
     __invoker: Invoker
     __threadLimit: BoundedSemaphore
+    __sessions: dict[str, ExecutingSession]
+    __sessions_lock: Lock
+
+    def __init__(self, workers: int = 1) -> None:
+        """
+        :param workers: The number of threads invoking nodes. Each executes one node at a time, of any session, so
+        this should allow for every session that executes at the same time to execute as many nodes as it may.
+        """
+        super().__init__()
+        self.__workers = workers
 
     def start(self, invoker) -> None:
-        # if we do want multithreading at some point, we could make this configurable
-        self.__threadLimit = BoundedSemaphore(1)
+        self.__threadLimit = BoundedSemaphore(self.__workers)
         self.__invoker = invoker
         self.__stop_event = Event()
-        self.__invoker_thread = Thread(
-            name="invoker_processor",
-            target=self.__process,
-            kwargs=dict(stop_event=self.__stop_event),
-        )
-        self.__invoker_thread.daemon = True  # TODO: make async and do not use threads
-        self.__invoker_thread.start()
+        self.__sessions = dict()
+        self.__sessions_lock = Lock()
+        self.__invoker_threads = list()
+        for worker_id in range(self.__workers):
+            invoker_thread = Thread(
+                name=f"invoker_processor_{worker_id}",
+                target=self.__process,
+                kwargs=dict(stop_event=self.__stop_event),
+            )
+            invoker_thread.daemon = True  # TODO: make async and do not use threads
+            invoker_thread.start()
+            self.__invoker_threads.append(invoker_thread)
 
     def stop(self, *args, **kwargs) -> None:
         self.__stop_event.set()
+        # The invoker wakes one thread when it stops, so wake the others
+        for _ in range(self.__workers - 1):
+            self.__invoker.services.queue.put(None)
+
+    def __get_session(self, graph_execution_state_id: str) -> ExecutingSession:
+        """Gets the state of a session that is being executed, retrieving it if none of its nodes were yet"""
+        with self.__sessions_lock:
+            session = self.__sessions.get(graph_execution_state_id)
+            if session is None:
+                graph_execution_state = self.__invoker.services.graph_execution_manager.get(graph_execution_state_id)
+                if graph_execution_state is None:
+                    raise ValueError(f"Session {graph_execution_state_id} not found")
+                session = ExecutingSession(graph_execution_state)
+                self.__sessions[graph_execution_state_id] = session
+            return session
+
+    def __drop_session(self, session: ExecutingSession) -> None:
+        """Forgets a session that is no longer executing, so that it is retrieved again if it is ever resumed"""
+        with self.__sessions_lock:
+            graph_execution_state_id = session.graph_execution_state.id
+            if self.__sessions.get(graph_execution_state_id) is session:
+                del self.__sessions[graph_execution_state_id]
 
     def __process(self, stop_event: Event):
         try:
@@ -50,9 +100,7 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                     time.sleep(0.5)
                     continue
                 try:
-                    graph_execution_state = self.__invoker.services.graph_execution_manager.get(
-                        queue_item.graph_execution_state_id
-                    )
+                    session = self.__get_session(queue_item.graph_execution_state_id)
                 except Exception as e:
                     self.__invoker.services.logger.error("Exception while retrieving session:\n%s" % e)
                     self.__invoker.services.events.emit_session_retrieval_error(
@@ -64,24 +112,31 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                         error=traceback.format_exc(),
                     )
                     continue
+                graph_execution_state = session.graph_execution_state
 
-                try:
-                    invocation = graph_execution_state.execution_graph.get_node(queue_item.invocation_id)
-                except Exception as e:
-                    self.__invoker.services.logger.error("Exception while retrieving invocation:\n%s" % e)
-                    self.__invoker.services.events.emit_invocation_retrieval_error(
-                        queue_batch_id=queue_item.session_queue_batch_id,
-                        queue_item_id=queue_item.session_queue_item_id,
-                        queue_id=queue_item.session_queue_id,
-                        graph_execution_state_id=queue_item.graph_execution_state_id,
-                        node_id=queue_item.invocation_id,
-                        error_type=e.__class__.__name__,
-                        error=traceback.format_exc(),
-                    )
-                    continue
+                with session.lock:
+                    # Skip the nodes that were still queued when another node of the session failed
+                    if session.is_finished or graph_execution_state.is_complete():
+                        self.__drop_session(session)
+                        continue
+
+                    try:
+                        invocation = graph_execution_state.execution_graph.get_node(queue_item.invocation_id)
+                    except Exception as e:
+                        self.__invoker.services.logger.error("Exception while retrieving invocation:\n%s" % e)
+                        self.__invoker.services.events.emit_invocation_retrieval_error(
+                            queue_batch_id=queue_item.session_queue_batch_id,
+                            queue_item_id=queue_item.session_queue_item_id,
+                            queue_id=queue_item.session_queue_id,
+                            graph_execution_state_id=queue_item.graph_execution_state_id,
+                            node_id=queue_item.invocation_id,
+                            error_type=e.__class__.__name__,
+                            error=traceback.format_exc(),
+                        )
+                        continue
 
-                # get the source node id to provide to clients (the prepared node id is not as useful)
-                source_node_id = graph_execution_state.prepared_source_mapping[invocation.id]
+                    # get the source node id to provide to clients (the prepared node id is not as useful)
+                    source_node_id = graph_execution_state.prepared_source_mapping[invocation.id]
 
                 # Send starting event
                 self.__invoker.services.events.emit_invocation_started(
@@ -93,7 +148,7 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                     source_node_id=source_node_id,
                 )
 
-                # Invoke
+                # Invoke, without holding the session's lock, so that its other nodes can be invoked meanwhile
                 try:
                     graph_id = graph_execution_state.id
                     with self.__invoker.services.performance_statistics.collect_stats(invocation, graph_id):
@@ -113,13 +168,15 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
 
                         # Check queue to see if this is canceled, and skip if so
                         if self.__invoker.services.queue.is_canceled(graph_execution_state.id):
+                            self.__drop_session(session)
                             continue
 
-                        # Save outputs and history
-                        graph_execution_state.complete(invocation.id, outputs)
+                        with session.lock:
+                            # Save outputs and history
+                            graph_execution_state.complete(invocation.id, outputs)
 
-                        # Save the state changes
-                        self.__invoker.services.graph_execution_manager.set(graph_execution_state)
+                            # Save the state changes
+                            self.__invoker.services.graph_execution_manager.set(graph_execution_state)
 
                         # Send complete event
                         self.__invoker.services.events.emit_invocation_complete(
@@ -144,11 +201,12 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
                     error = traceback.format_exc()
                     logger.error(error)
 
-                    # Save error
-                    graph_execution_state.set_node_error(invocation.id, error)
+                    with session.lock:
+                        # Save error
+                        graph_execution_state.set_node_error(invocation.id, error)
 
-                    # Save the state changes
-                    self.__invoker.services.graph_execution_manager.set(graph_execution_state)
+                        # Save the state changes
+                        self.__invoker.services.graph_execution_manager.set(graph_execution_state)
 
                     self.__invoker.services.logger.error("Error while invoking:\n%s" % e)
                     # Send error event
@@ -167,38 +225,54 @@ class DefaultInvocationProcessor(InvocationProcessorABC):
 
                 # Check queue to see if this is canceled, and skip if so
                 if self.__invoker.services.queue.is_canceled(graph_execution_state.id):
+                    self.__drop_session(session)
                     continue
 
-                # Queue any further commands if invoking all
-                is_complete = graph_execution_state.is_complete()
-                if queue_item.invoke_all and not is_complete:
-                    try:
-                        self.__invoker.invoke(
-                            session_queue_batch_id=queue_item.session_queue_batch_id,
-                            session_queue_item_id=queue_item.session_queue_item_id,
-                            session_queue_id=queue_item.session_queue_id,
-                            graph_execution_state=graph_execution_state,
-                            invoke_all=True,
-                        )
-                    except Exception as e:
-                        self.__invoker.services.logger.error("Error while invoking:\n%s" % e)
-                        self.__invoker.services.events.emit_invocation_error(
-                            queue_batch_id=queue_item.session_queue_batch_id,
-                            queue_item_id=queue_item.session_queue_item_id,
-                            queue_id=queue_item.session_queue_id,
-                            graph_execution_state_id=graph_execution_state.id,
-                            node=invocation.dict(),
-                            source_node_id=source_node_id,
-                            error_type=e.__class__.__name__,
-                            error=traceback.format_exc(),
-                        )
-                elif is_complete:
-                    self.__invoker.services.events.emit_graph_execution_complete(
-                        queue_batch_id=queue_item.session_queue_batch_id,
-                        queue_item_id=queue_item.session_queue_item_id,
-                        queue_id=queue_item.session_queue_id,
-                        graph_execution_state_id=graph_execution_state.id,
-                    )
+                with session.lock:
+                    # Queue any further commands if invoking all. Other nodes of the session may still be executing,
+                    # in which case the last of them to finish completes the session.
+                    is_complete = graph_execution_state.is_complete()
+                    if not is_complete:
+                        if queue_item.invoke_all:
+                            try:
+                                self.__invoker.invoke(
+                                    session_queue_batch_id=queue_item.session_queue_batch_id,
+                                    session_queue_item_id=queue_item.session_queue_item_id,
+                                    session_queue_id=queue_item.session_queue_id,
+                                    graph_execution_state=graph_execution_state,
+                                    invoke_all=True,
+                                )
+                            except Exception as e:
+                                self.__invoker.services.logger.error("Error while invoking:\n%s" % e)
+                                self.__invoker.services.events.emit_invocation_error(
+                                    queue_batch_id=queue_item.session_queue_batch_id,
+                                    queue_item_id=queue_item.session_queue_item_id,
+                                    queue_id=queue_item.session_queue_id,
+                                    graph_execution_state_id=graph_execution_state.id,
+                                    node=invocation.dict(),
+                                    source_node_id=source_node_id,
+                                    error_type=e.__class__.__name__,
+                                    error=traceback.format_exc(),
+                                )
+                        if not graph_execution_state.executing:
+                            # Nothing is left to execute for now. The session is retrieved again if it is invoked.
+                            self.__drop_session(session)
+                        continue
+                    if session.is_finished:
+                        continue
+                    session.is_finished = True
+                    self.__drop_session(session)
+
+                self.__invoker.services.events.emit_graph_execution_complete(
+                    queue_batch_id=queue_item.session_queue_batch_id,
+                    queue_item_id=queue_item.session_queue_item_id,
+                    queue_id=queue_item.session_queue_id,
+                    graph_execution_state_id=graph_execution_state.id,
+                )
+                try:
+                    self._on_session_complete(queue_item, graph_execution_state)
+                except Exception as e:
+                    self.__invoker.services.logger.error("Error while handling session completion:\n%s" % e)
 
         except KeyboardInterrupt:
             pass  # Log something? KeyboardInterrupt is probably not going to be seen by the processor
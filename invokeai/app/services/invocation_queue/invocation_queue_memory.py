@@ -26,10 +26,11 @@ class MemoryInvocationQueue(InvocationQueueABC):
         ):
             item = self.__queue.get()
 
-        # Clear old items
-        for graph_execution_state_id in list(self.__cancellations.keys()):
-            if self.__cancellations[graph_execution_state_id] < item.timestamp:
-                del self.__cancellations[graph_execution_state_id]
+        # Clear old items. Several processor threads may get items at once, so an old item may already be cleared.
+        if item is not None:
+            for graph_execution_state_id, canceled_at in list(self.__cancellations.items()):
+                if canceled_at < item.timestamp:
+                    self.__cancellations.pop(graph_execution_state_id, None)
 
         return item
 
@@ -20,8 +20,10 @@ if TYPE_CHECKING:
     from .invocation_queue.invocation_queue_base import InvocationQueueABC
     from .invocation_stats.invocation_stats_base import InvocationStatsServiceBase
     from .item_storage.item_storage_base import ItemStorageABC
+    from .latents_reclaimer.latents_reclaimer_base import LatentsReclaimerBase
     from .latents_storage.latents_storage_base import LatentsStorageBase
     from .model_manager.model_manager_base import ModelManagerServiceBase
+    from .model_prefetcher.model_prefetcher_base import ModelPrefetcherBase
     from .names.names_base import NameServiceBase
     from .session_processor.session_processor_base import SessionProcessorBase
     from .session_queue.session_queue_base import SessionQueueBase
@@ -45,8 +47,10 @@ class InvocationServices:
     image_records: "ImageRecordStorageBase"
     image_files: "ImageFileStorageBase"
     latents: "LatentsStorageBase"
+    latents_reclaimer: "LatentsReclaimerBase"
     logger: "Logger"
     model_manager: "ModelManagerServiceBase"
+    model_prefetcher: "ModelPrefetcherBase"
     processor: "InvocationProcessorABC"
     performance_statistics: "InvocationStatsServiceBase"
     queue: "InvocationQueueABC"
@@ -70,8 +74,10 @@ class InvocationServices:
         image_files: "ImageFileStorageBase",
         image_records: "ImageRecordStorageBase",
         latents: "LatentsStorageBase",
+        latents_reclaimer: "LatentsReclaimerBase",
         logger: "Logger",
         model_manager: "ModelManagerServiceBase",
+        model_prefetcher: "ModelPrefetcherBase",
         processor: "InvocationProcessorABC",
         performance_statistics: "InvocationStatsServiceBase",
         queue: "InvocationQueueABC",
@@ -93,8 +99,10 @@ class InvocationServices:
         self.image_files = image_files
         self.image_records = image_records
         self.latents = latents
+        self.latents_reclaimer = latents_reclaimer
         self.logger = logger
         self.model_manager = model_manager
+        self.model_prefetcher = model_prefetcher
         self.processor = processor
         self.performance_statistics = performance_statistics
         self.queue = queue
@@ -33,6 +33,7 @@ from contextlib import AbstractContextManager
 from typing import Dict
 
 from invokeai.app.invocations.baseinvocation import BaseInvocation
+from invokeai.app.services.latents_storage.latents_storage_common import LatentsCacheStats
 from invokeai.backend.model_management.model_cache import CacheStats
 
 from .invocation_stats_common import NodeLog
@@ -44,6 +45,7 @@ class InvocationStatsServiceBase(ABC):
     # {graph_id => NodeLog}
     _stats: Dict[str, NodeLog]
     _cache_stats: Dict[str, CacheStats]
+    _latents_cache_stats: Dict[str, LatentsCacheStats]
     ram_used: float
     ram_changed: float
 
@@ -7,6 +7,8 @@ import torch
 import invokeai.backend.util.logging as logger
 from invokeai.app.invocations.baseinvocation import BaseInvocation
 from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.latents_storage.latents_storage_base import LatentsStorageBase
+from invokeai.app.services.latents_storage.latents_storage_common import LatentsCacheStats
 from invokeai.app.services.model_manager.model_manager_base import ModelManagerServiceBase
 from invokeai.backend.model_management.model_cache import CacheStats
 
@@ -24,6 +26,7 @@ class InvocationStatsService(InvocationStatsServiceBase):
         # {graph_id => NodeLog}
         self._stats: Dict[str, NodeLog] = {}
         self._cache_stats: Dict[str, CacheStats] = {}
+        self._latents_cache_stats: Dict[str, LatentsCacheStats] = {}
         self.ram_used: float = 0.0
         self.ram_changed: float = 0.0
 
@@ -39,12 +42,14 @@ class InvocationStatsService(InvocationStatsServiceBase):
         start_time: float
         ram_used: int
         model_manager: ModelManagerServiceBase
+        latents: LatentsStorageBase
 
         def __init__(
             self,
             invocation: BaseInvocation,
             graph_id: str,
             model_manager: ModelManagerServiceBase,
+            latents: LatentsStorageBase,
             collector: "InvocationStatsServiceBase",
         ):
             """Initialize statistics for this run."""
@@ -54,6 +59,7 @@ class InvocationStatsService(InvocationStatsServiceBase):
             self.start_time = 0.0
             self.ram_used = 0
             self.model_manager = model_manager
+            self.latents = latents
 
         def __enter__(self):
             self.start_time = time.time()
@@ -62,6 +68,8 @@ class InvocationStatsService(InvocationStatsServiceBase):
             self.ram_used = psutil.Process().memory_info().rss
             if self.model_manager:
                 self.model_manager.collect_cache_stats(self.collector._cache_stats[self.graph_id])
+            if self.latents:
+                self.latents.collect_cache_stats(self.collector._latents_cache_stats[self.graph_id])
 
         def __exit__(self, *args):
             """Called on exit from the context."""
@@ -85,7 +93,14 @@ class InvocationStatsService(InvocationStatsServiceBase):
         if not self._stats.get(graph_execution_state_id):  # first time we're seeing this
             self._stats[graph_execution_state_id] = NodeLog()
             self._cache_stats[graph_execution_state_id] = CacheStats()
-        return self.StatsContext(invocation, graph_execution_state_id, self._invoker.services.model_manager, self)
+            self._latents_cache_stats[graph_execution_state_id] = LatentsCacheStats()
+        return self.StatsContext(
+            invocation,
+            graph_execution_state_id,
+            self._invoker.services.model_manager,
+            self._invoker.services.latents,
+            self,
+        )
 
     def reset_all_stats(self):
         """Zero all statistics"""
@@ -122,7 +137,8 @@ class InvocationStatsService(InvocationStatsServiceBase):
     def log_stats(self):
         completed = set()
         errored = set()
-        for graph_id, node_log in self._stats.items():
+        # Sessions may execute on several threads, which add their graphs' stats while these are logged
+        for graph_id, node_log in list(self._stats.items()):
             try:
                 current_graph_state = self._invoker.services.graph_execution_manager.get(graph_id)
             except Exception:
@@ -135,7 +151,7 @@ class InvocationStatsService(InvocationStatsServiceBase):
             total_time = 0
             logger.info(f"Graph stats: {graph_id}")
             logger.info(f"{'Node':>30} {'Calls':>7}{'Seconds':>9} {'VRAM Used':>10}")
-            for node_type, stats in self._stats[graph_id].nodes.items():
+            for node_type, stats in list(node_log.nodes.items()):
                 logger.info(f"{node_type:>30}  {stats.calls:>4}   {stats.time_used:7.3f}s     {stats.max_vram:4.3f}G")
                 total_time += stats.time_used
 
@@ -156,12 +172,24 @@ class InvocationStatsService(InvocationStatsServiceBase):
             logger.info(f"   Models cleared from cache: {cache_stats.cleared}")
             logger.info(f"   Cache high water mark: {hwm:4.2f}/{tot:4.2f}G")
 
+            latents_stats = self._latents_cache_stats[graph_id]
+            logger.info("Latents cache statistics:")
+            logger.info(f"   Latents cache hits: {latents_stats.hits}")
+            logger.info(f"   Latents cache misses: {latents_stats.misses}")
+            logger.info(f"   Latents cached: {latents_stats.in_cache}")
+            logger.info(f"   Latents evicted from cache: {latents_stats.evicted}")
+            logger.info(
+                f"   Cache high water mark: {latents_stats.high_watermark / GIG:4.3f}/{latents_stats.cache_size / GIG:4.3f}G"
+            )
+
             completed.add(graph_id)
 
         for graph_id in completed:
-            del self._stats[graph_id]
-            del self._cache_stats[graph_id]
+            self._stats.pop(graph_id, None)
+            self._cache_stats.pop(graph_id, None)
+            self._latents_cache_stats.pop(graph_id, None)
 
         for graph_id in errored:
-            del self._stats[graph_id]
-            del self._cache_stats[graph_id]
+            self._stats.pop(graph_id, None)
+            self._cache_stats.pop(graph_id, None)
+            self._latents_cache_stats.pop(graph_id, None)
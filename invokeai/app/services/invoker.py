@@ -2,6 +2,7 @@
 
 from typing import Optional
 
+from ..invocations.baseinvocation import BaseInvocation
 from .invocation_queue.invocation_queue_common import InvocationQueueItem
 from .invocation_services import InvocationServices
 from .shared.graph import Graph, GraphExecutionState
@@ -24,30 +25,38 @@ class Invoker:
         graph_execution_state: GraphExecutionState,
         invoke_all: bool = False,
     ) -> Optional[str]:
-        """Determines the next node to invoke and enqueues it, preparing if needed.
-        Returns the id of the queued node, or `None` if there are no nodes left to enqueue."""
-
-        # Get the next invocation
-        invocation = graph_execution_state.next()
-        if not invocation:
+        """Determines the next node to invoke and enqueues it, preparing if needed. When invoking all, every node
+        that is ready is enqueued, up to `node_workers` executing at once, so that independent nodes execute at the
+        same time. Returns the id of the first queued node, or `None` if there are no nodes left to enqueue."""
+
+        # Get the next invocations
+        max_executing = self.services.configuration.node_workers if invoke_all else 1
+        invocations: list[BaseInvocation] = []
+        while len(invocations) == 0 or len(graph_execution_state.executing) < max_executing:
+            invocation = graph_execution_state.next()
+            if not invocation:
+                break
+            invocations.append(invocation)
+        if not invocations:
             return None
 
         # Save the execution state
         self.services.graph_execution_manager.set(graph_execution_state)
 
-        # Queue the invocation
-        self.services.queue.put(
-            InvocationQueueItem(
-                session_queue_id=session_queue_id,
-                session_queue_item_id=session_queue_item_id,
-                session_queue_batch_id=session_queue_batch_id,
-                graph_execution_state_id=graph_execution_state.id,
-                invocation_id=invocation.id,
-                invoke_all=invoke_all,
+        # Queue the invocations
+        for invocation in invocations:
+            self.services.queue.put(
+                InvocationQueueItem(
+                    session_queue_id=session_queue_id,
+                    session_queue_item_id=session_queue_item_id,
+                    session_queue_batch_id=session_queue_batch_id,
+                    graph_execution_state_id=graph_execution_state.id,
+                    invocation_id=invocation.id,
+                    invoke_all=invoke_all,
+                )
             )
-        )
 
-        return invocation.id
+        return invocations[0].id
 
     def create_execution_state(self, graph: Optional[Graph] = None) -> GraphExecutionState:
         """Creates a new execution state for the given graph"""
@@ -0,0 +1,191 @@
+import itertools
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from invokeai.app.services.shared.graph import GraphExecutionState, GraphExecutionStateDelta
+from invokeai.app.services.shared.pagination import PaginatedResults
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+
+from .item_storage_sqlite import SqliteItemStorage
+
+
+@dataclass
+class StoredSessionLog:
+    """What is stored of a session: the revision last stored, and the sizes of its snapshot and the deltas since"""
+
+    revision: int
+    snapshot_size: int
+    log_size: int
+    # The revision last committed to the database, which is behind `revision` while that is being written
+    committed_revision: Optional[int] = None
+
+
+class SqliteGraphExecutionStateStorage(SqliteItemStorage[GraphExecutionState]):
+    """
+    Stores graph execution states as a snapshot, plus a log of the changes made since.
+
+    A state that was stored (or retrieved) tracks its changes, so that storing it again only appends them to the log,
+    which does not get slower as the graph grows. Retrieving a state does not change the revision stored, so the copy
+    being executed still appends its changes when the state is retrieved in the meantime (e.g. to log its stats). Once
+    the log is as large as the snapshot, or the state completes, the snapshot is rewritten and the log cleared, so the
+    cost of the snapshots is proportional to the changes, and a state is rebuilt from at most twice its own size.
+    States are rebuilt from their snapshot and log when retrieved.
+
+    The snapshot is also rewritten if the state's changes cannot be appended: if it did not track them, the graph was
+    changed, or another copy of it was stored since.
+    """
+
+    _logs: dict[str, StoredSessionLog]
+    _logs_lock: threading.Lock
+
+    def __init__(self, db: SqliteDatabase, table_name: str = "graph_executions"):
+        self._log_table_name = f"{table_name}_log"
+        super().__init__(db=db, table_name=table_name)
+        self._logs = dict()
+        self._logs_lock = threading.Lock()
+        self._revisions = itertools.count()
+
+    def _create_table(self):
+        super()._create_table()
+        try:
+            self._lock.acquire()
+            self._cursor.execute(f"""CREATE TABLE IF NOT EXISTS {self._log_table_name} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                delta TEXT NOT NULL);""")
+            self._cursor.execute(f"""CREATE INDEX IF NOT EXISTS {self._log_table_name}_session_id
+                ON {self._log_table_name}(session_id, id);""")
+        finally:
+            self._lock.release()
+
+    def _parse_item(self, item: str) -> GraphExecutionState:
+        return GraphExecutionState.parse_raw(item)
+
+    def set(self, item: GraphExecutionState):
+        revision, delta = item.take_changes()
+        serialized_delta: Optional[str] = None
+        serialized_item: Optional[str] = None
+        # Serialize before queueing the write, so that large items don't hold up other writers
+        with self._logs_lock:
+            log = self._logs.get(item.id)
+            if delta is not None and log is not None and log.revision == revision and not item.is_complete():
+                serialized_delta = delta.json()
+                if log.log_size + len(serialized_delta) >= log.snapshot_size:
+                    serialized_delta = None
+
+            new_revision = next(self._revisions)
+            if serialized_delta is not None and log is not None:
+                log.revision = new_revision
+                log.log_size += len(serialized_delta)
+            else:
+                serialized_item = item.json()
+                if item.is_complete():
+                    # Complete states are not executed further, so there is nothing to track
+                    self._logs.pop(item.id, None)
+                else:
+                    committed_revision = log.committed_revision if log is not None else None
+                    self._logs[item.id] = StoredSessionLog(new_revision, len(serialized_item), 0, committed_revision)
+
+        if serialized_delta is not None:
+            self._db.write(
+                lambda cursor: cursor.execute(
+                    f"""INSERT INTO {self._log_table_name} (session_id, delta) VALUES (?, ?);""",
+                    (item.id, serialized_delta),
+                )
+            )
+        else:
+
+            def write_snapshot(cursor: sqlite3.Cursor) -> None:
+                cursor.execute(f"""DELETE FROM {self._log_table_name} WHERE session_id = ?;""", (item.id,))
+                cursor.execute(f"""INSERT OR REPLACE INTO {self._table_name} (item) VALUES (?);""", (serialized_item,))
+
+            self._db.write(write_snapshot)
+
+        with self._logs_lock:
+            log = self._logs.get(item.id)
+            if log is not None and log.revision == new_revision:
+                log.committed_revision = new_revision
+
+        if not item.is_complete():
+            item.track_changes(new_revision)
+        self._on_changed(item)
+
+    def get(self, id: str) -> Optional[GraphExecutionState]:
+        # The revision read is only known if none is being written
+        with self._logs_lock:
+            log = self._logs.get(str(id))
+            revision = log.revision if log is not None and log.committed_revision == log.revision else None
+
+        with self._db.read() as conn:
+            result = conn.execute(f"""SELECT item FROM {self._table_name} WHERE id = ?;""", (str(id),)).fetchone()
+            if not result:
+                return None
+            deltas = self._get_deltas(conn, str(id))
+
+        item = self._rebuild_item(result[0], deltas)
+        if not item.is_complete():
+            with self._logs_lock:
+                log = self._logs.get(item.id)
+                if log is None:
+                    revision = next(self._revisions)
+                    log_size = sum(len(d) for d in deltas)
+                    self._logs[item.id] = StoredSessionLog(revision, len(result[0]), log_size, revision)
+                elif log.revision != revision or log.committed_revision != revision:
+                    # Stored again while being read, so the item may be behind; storing it rewrites the snapshot
+                    revision = None
+            if revision is not None:
+                item.track_changes(revision)
+        return item
+
+    def get_raw(self, id: str) -> Optional[str]:
+        with self._db.read() as conn:
+            result = conn.execute(f"""SELECT item FROM {self._table_name} WHERE id = ?;""", (str(id),)).fetchone()
+            if not result:
+                return None
+            deltas = self._get_deltas(conn, str(id))
+
+        if len(deltas) == 0:
+            return result[0]
+        return self._rebuild_item(result[0], deltas).json()
+
+    def delete(self, id: str):
+        def delete_session(cursor: sqlite3.Cursor) -> None:
+            cursor.execute(f"""DELETE FROM {self._log_table_name} WHERE session_id = ?;""", (str(id),))
+            cursor.execute(f"""DELETE FROM {self._table_name} WHERE id = ?;""", (str(id),))
+
+        self._db.write(delete_session)
+        with self._logs_lock:
+            self._logs.pop(str(id), None)
+        self._on_deleted(id)
+
+    def _get_deltas(self, conn: sqlite3.Connection, session_id: str) -> list[str]:
+        result = conn.execute(
+            f"""SELECT delta FROM {self._log_table_name} WHERE session_id = ? ORDER BY id;""", (session_id,)
+        ).fetchall()
+        return [r[0] for r in result]
+
+    def _rebuild_item(self, serialized_item: str, deltas: list[str]) -> GraphExecutionState:
+        item = self._parse_item(serialized_item)
+        for delta in deltas:
+            item.apply_delta(GraphExecutionStateDelta.parse_raw(delta))
+        return item
+
+    def _apply_deltas(self, items: list[GraphExecutionState]) -> list[GraphExecutionState]:
+        with self._db.read() as conn:
+            for item in items:
+                for delta in self._get_deltas(conn, item.id):
+                    item.apply_delta(GraphExecutionStateDelta.parse_raw(delta))
+        return items
+
+    def list(self, page: int = 0, per_page: int = 10) -> PaginatedResults[GraphExecutionState]:
+        results = super().list(page, per_page)
+        results.items = self._apply_deltas(results.items)
+        return results
+
+    def search(self, query: str, page: int = 0, per_page: int = 10) -> PaginatedResults[GraphExecutionState]:
+        # Only the snapshots are searched
+        results = super().search(query, page, per_page)
+        results.items = self._apply_deltas(results.items)
+        return results
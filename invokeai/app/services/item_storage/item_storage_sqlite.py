@@ -1,11 +1,10 @@
 import sqlite3
-import threading
 from typing import Generic, Optional, TypeVar, get_args
 
 from pydantic import BaseModel, parse_raw_as
 
 from invokeai.app.services.shared.pagination import PaginatedResults
-from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.app.services.shared.sqlite import InstrumentedLock, SqliteDatabase
 
 from .item_storage_base import ItemStorageABC
 
@@ -14,14 +13,16 @@ T = TypeVar("T", bound=BaseModel)
 
 class SqliteItemStorage(ItemStorageABC, Generic[T]):
     _table_name: str
+    _db: SqliteDatabase
     _conn: sqlite3.Connection
     _cursor: sqlite3.Cursor
     _id_field: str
-    _lock: threading.Lock
+    _lock: InstrumentedLock
 
     def __init__(self, db: SqliteDatabase, table_name: str, id_field: str = "id"):
         super().__init__()
 
+        self._db = db
         self._lock = db.lock
         self._conn = db.conn
         self._table_name = table_name
@@ -50,24 +51,19 @@ class SqliteItemStorage(ItemStorageABC, Generic[T]):
         return parse_raw_as(item_type, item)
 
     def set(self, item: T):
-        try:
-            self._lock.acquire()
-            self._cursor.execute(
+        # Serialize before queueing the write, so that large items don't hold up other writers
+        serialized_item = item.json()
+        self._db.write(
+            lambda cursor: cursor.execute(
                 f"""INSERT OR REPLACE INTO {self._table_name} (item) VALUES (?);""",
-                (item.json(),),
+                (serialized_item,),
             )
-            self._conn.commit()
-        finally:
-            self._lock.release()
+        )
         self._on_changed(item)
 
     def get(self, id: str) -> Optional[T]:
-        try:
-            self._lock.acquire()
-            self._cursor.execute(f"""SELECT item FROM {self._table_name} WHERE id = ?;""", (str(id),))
-            result = self._cursor.fetchone()
-        finally:
-            self._lock.release()
+        with self._db.read() as conn:
+            result = conn.execute(f"""SELECT item FROM {self._table_name} WHERE id = ?;""", (str(id),)).fetchone()
 
         if not result:
             return None
@@ -75,12 +71,8 @@ class SqliteItemStorage(ItemStorageABC, Generic[T]):
         return self._parse_item(result[0])
 
     def get_raw(self, id: str) -> Optional[str]:
-        try:
-            self._lock.acquire()
-            self._cursor.execute(f"""SELECT item FROM {self._table_name} WHERE id = ?;""", (str(id),))
-            result = self._cursor.fetchone()
-        finally:
-            self._lock.release()
+        with self._db.read() as conn:
+            result = conn.execute(f"""SELECT item FROM {self._table_name} WHERE id = ?;""", (str(id),)).fetchone()
 
         if not result:
             return None
@@ -88,52 +80,43 @@ class SqliteItemStorage(ItemStorageABC, Generic[T]):
         return result[0]
 
     def delete(self, id: str):
-        try:
-            self._lock.acquire()
-            self._cursor.execute(f"""DELETE FROM {self._table_name} WHERE id = ?;""", (str(id),))
-            self._conn.commit()
-        finally:
-            self._lock.release()
+        self._db.write(lambda cursor: cursor.execute(f"""DELETE FROM {self._table_name} WHERE id = ?;""", (str(id),)))
         self._on_deleted(id)
 
     def list(self, page: int = 0, per_page: int = 10) -> PaginatedResults[T]:
-        try:
-            self._lock.acquire()
-            self._cursor.execute(
+        with self._db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
                 f"""SELECT item FROM {self._table_name} LIMIT ? OFFSET ?;""",
                 (per_page, page * per_page),
             )
-            result = self._cursor.fetchall()
+            result = cursor.fetchall()
 
             items = list(map(lambda r: self._parse_item(r[0]), result))
 
-            self._cursor.execute(f"""SELECT count(*) FROM {self._table_name};""")
-            count = self._cursor.fetchone()[0]
-        finally:
-            self._lock.release()
+            cursor.execute(f"""SELECT count(*) FROM {self._table_name};""")
+            count = cursor.fetchone()[0]
 
         pageCount = int(count / per_page) + 1
 
         return PaginatedResults[T](items=items, page=page, pages=pageCount, per_page=per_page, total=count)
 
     def search(self, query: str, page: int = 0, per_page: int = 10) -> PaginatedResults[T]:
-        try:
-            self._lock.acquire()
-            self._cursor.execute(
+        with self._db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
                 f"""SELECT item FROM {self._table_name} WHERE item LIKE ? LIMIT ? OFFSET ?;""",
                 (f"%{query}%", per_page, page * per_page),
             )
-            result = self._cursor.fetchall()
+            result = cursor.fetchall()
 
             items = list(map(lambda r: self._parse_item(r[0]), result))
 
-            self._cursor.execute(
+            cursor.execute(
                 f"""SELECT count(*) FROM {self._table_name} WHERE item LIKE ?;""",
                 (f"%{query}%",),
             )
-            count = self._cursor.fetchone()[0]
-        finally:
-            self._lock.release()
+            count = cursor.fetchone()[0]
 
         pageCount = int(count / per_page) + 1
 
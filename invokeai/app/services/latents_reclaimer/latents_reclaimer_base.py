@@ -0,0 +1,27 @@
+from abc import ABC, abstractmethod
+
+from invokeai.app.services.latents_reclaimer.latents_reclaimer_common import LatentsReclaimerStatus
+
+
+class LatentsReclaimerBase(ABC):
+    """
+    Base class for latents reclaimers.
+
+    Every latents-producing invocation writes its output to the latents storage, named after the session that
+    produced it. The reclaimer tracks which latents each session produced, and deletes them in bulk once the
+    session's queue item is finished, except for latents still referenced by a cached invocation output.
+
+    Nothing is in progress at startup, so the reclaimer then deletes every file in the latents storage that the
+    persistent invocation cache does not refer to. That includes the latents of sessions that ran outside the session
+    queue (through the legacy `/sessions` API), which are not reclaimed while the app runs, as they have no queue item.
+    """
+
+    @abstractmethod
+    def reclaim_session(self, session_id: str) -> None:
+        """Schedules the latents produced by a finished session for deletion"""
+        pass
+
+    @abstractmethod
+    def get_status(self) -> LatentsReclaimerStatus:
+        """Gets the status of the reclaimer"""
+        pass
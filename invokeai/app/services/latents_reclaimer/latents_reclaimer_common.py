@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+
+
+class LatentsReclaimerStatus(BaseModel):
+    enabled: bool = Field(description="Whether finished sessions' latents are reclaimed")
+    tracked_sessions: int = Field(description="The number of sessions with latents that have not been reclaimed")
+    tracked_latents: int = Field(description="The number of latents belonging to those sessions")
+    retained_latents: int = Field(description="The number of finished sessions' latents kept for the invocation cache")
+    reclaimed_latents: int = Field(description="The number of latents reclaimed since startup")
+    reclaimed_bytes: int = Field(description="The disk space reclaimed since startup, in bytes")
+    directory_files: int = Field(description="The number of files in the latents directory, when it was last scanned")
+    directory_bytes: int = Field(description="The size of the latents directory in bytes, when it was last scanned")
+    directory_scanned_at: float = Field(description="When the latents directory was last scanned, as a Unix time")
@@ -0,0 +1,198 @@
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from queue import Queue
+from threading import Lock, Thread
+from typing import Dict, Optional, Set, Union
+
+from fastapi_events.handlers.local import local_handler
+from fastapi_events.typing import Event as FastAPIEvent
+
+from invokeai.app.services.events.events_base import EventServiceBase
+from invokeai.app.services.invoker import Invoker
+
+from .latents_reclaimer_base import LatentsReclaimerBase
+from .latents_reclaimer_common import LatentsReclaimerStatus
+
+# Number of finished session ids to remember, so that latents saved by a session after it was reclaimed (e.g. by a
+# node that was still running when its queue item was canceled) are reclaimed as well
+MAX_FINISHED_SESSIONS = 1000
+FINISHED_STATUSES = ["completed", "failed", "canceled"]
+# Queued instead of a session id to reclaim everything left over from previous runs
+SWEEP = ""
+# How often the latents directory may be scanned for the status, in seconds, as it may hold millions of files
+DIRECTORY_SCAN_INTERVAL = 60.0
+
+
+def get_session_id(latents_name: str) -> str:
+    """
+    Latents are named `{session_id}__{node_id}` or `{session_id}_{node_id}_conditioning`. Session ids are UUIDs,
+    which never contain underscores.
+    """
+    return latents_name.split("_", 1)[0]
+
+
+class DiskLatentsReclaimer(LatentsReclaimerBase):
+    """Reclaims latents stored in a folder on disk, deleting them on a background thread"""
+
+    __invoker: Invoker
+    __latents_folder: Path
+    __enabled: bool
+    __lock: Lock
+    __session_latents: Dict[str, Set[str]]
+    __retained: Set[str]
+    __finished_sessions: OrderedDict[str, None]
+    __reclaim_queue: "Queue[Optional[str]]"
+    __thread: Optional[Thread]
+    __reclaimed_latents: int
+    __reclaimed_bytes: int
+    __scan_lock: Lock
+    __directory_files: int
+    __directory_bytes: int
+    __directory_scanned_at: float
+
+    def __init__(self, latents_folder: Union[str, Path], enabled: bool = True):
+        self.__latents_folder = latents_folder if isinstance(latents_folder, Path) else Path(latents_folder)
+        self.__enabled = enabled
+        self.__lock = Lock()
+        self.__session_latents = dict()
+        self.__retained = set()
+        self.__finished_sessions = OrderedDict()
+        self.__reclaim_queue = Queue()
+        self.__thread = None
+        self.__reclaimed_latents = 0
+        self.__reclaimed_bytes = 0
+        self.__scan_lock = Lock()
+        self.__directory_files = 0
+        self.__directory_bytes = 0
+        self.__directory_scanned_at = 0.0
+
+    def start(self, invoker: Invoker) -> None:
+        self.__invoker = invoker
+        if not self.__enabled:
+            return
+        self.__invoker.services.latents.on_saved(self._on_latents_saved)
+        local_handler.register(event_name=EventServiceBase.queue_event, _func=self._on_queue_event)
+        self.__thread = Thread(name="latents_reclaimer", target=self.__process, daemon=True)
+        self.__thread.start()
+        # Nothing is in progress at startup, so anything on disk was left behind by a previous run
+        self.__reclaim_queue.put(SWEEP)
+
+    def stop(self, *args, **kwargs) -> None:
+        if self.__thread is not None:
+            self.__reclaim_queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+
+    def reclaim_session(self, session_id: str) -> None:
+        if not self.__enabled:
+            return
+        with self.__lock:
+            self.__finished_sessions[session_id] = None
+            self.__finished_sessions.move_to_end(session_id)
+            if len(self.__finished_sessions) > MAX_FINISHED_SESSIONS:
+                self.__finished_sessions.popitem(last=False)
+        self.__reclaim_queue.put(session_id)
+
+    def get_status(self) -> LatentsReclaimerStatus:
+        with self.__scan_lock:
+            if time.time() - self.__directory_scanned_at >= DIRECTORY_SCAN_INTERVAL:
+                self.__scan_directory()
+            directory_files = self.__directory_files
+            directory_bytes = self.__directory_bytes
+            directory_scanned_at = self.__directory_scanned_at
+        with self.__lock:
+            return LatentsReclaimerStatus(
+                enabled=self.__enabled,
+                tracked_sessions=len(self.__session_latents),
+                tracked_latents=sum(len(names) for names in self.__session_latents.values()),
+                retained_latents=len(self.__retained),
+                reclaimed_latents=self.__reclaimed_latents,
+                reclaimed_bytes=self.__reclaimed_bytes,
+                directory_files=directory_files,
+                directory_bytes=directory_bytes,
+                directory_scanned_at=directory_scanned_at,
+            )
+
+    def __scan_directory(self) -> None:
+        """Measures the latents directory. Caller must hold the scan lock."""
+        directory_files = 0
+        directory_bytes = 0
+        if self.__latents_folder.exists():
+            with os.scandir(self.__latents_folder) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        directory_files += 1
+                        directory_bytes += entry.stat().st_size
+        self.__directory_files = directory_files
+        self.__directory_bytes = directory_bytes
+        self.__directory_scanned_at = time.time()
+
+    def _on_latents_saved(self, name: str) -> None:
+        session_id = get_session_id(name)
+        with self.__lock:
+            self.__session_latents.setdefault(session_id, set()).add(name)
+            finished = session_id in self.__finished_sessions
+        if finished:
+            self.__reclaim_queue.put(session_id)
+
+    async def _on_queue_event(self, event: FastAPIEvent) -> None:
+        if event[1]["event"] != "queue_item_status_changed":
+            return
+        queue_item = event[1]["data"]["queue_item"]
+        if queue_item["status"] in FINISHED_STATUSES:
+            self.reclaim_session(queue_item["session_id"])
+
+    def __process(self) -> None:
+        while True:
+            session_id = self.__reclaim_queue.get()
+            if session_id is None:
+                return
+            try:
+                if session_id == SWEEP:
+                    names = self.__list_latents()
+                else:
+                    with self.__lock:
+                        names = self.__session_latents.pop(session_id, set())
+                self.__reclaim(names)
+            except Exception as e:
+                self.__invoker.services.logger.error(f"Error reclaiming latents: {e}")
+
+    def __list_latents(self) -> Set[str]:
+        with self.__lock:
+            active = set(self.__session_latents.keys())
+        with os.scandir(self.__latents_folder) as entries:
+            return {entry.name for entry in entries if entry.is_file() and get_session_id(entry.name) not in active}
+
+    def __reclaim(self, names: Set[str]) -> None:
+        """Deletes the given latents, along with previously retained latents the cache no longer refers to"""
+        with self.__lock:
+            names = names | self.__retained
+            self.__retained = set()
+        invocation_cache = self.__invoker.services.invocation_cache
+        retained: Set[str] = set()
+        reclaimed_latents = 0
+        reclaimed_bytes = 0
+        for name in names:
+            if invocation_cache.references(name):
+                retained.add(name)
+                continue
+            try:
+                size = (self.__latents_folder / name).stat().st_size
+            except FileNotFoundError:
+                size = 0
+            try:
+                self.__invoker.services.latents.delete(name)
+            except FileNotFoundError:
+                continue
+            reclaimed_latents += 1
+            reclaimed_bytes += size
+        with self.__lock:
+            self.__retained |= retained
+            self.__reclaimed_latents += reclaimed_latents
+            self.__reclaimed_bytes += reclaimed_bytes
+        if reclaimed_latents:
+            self.__invoker.services.logger.debug(
+                f"Reclaimed {reclaimed_latents} latents ({reclaimed_bytes} bytes), retained {len(retained)}"
+            )
@@ -5,16 +5,20 @@ from typing import Callable
 
 import torch
 
+from .latents_storage_common import LatentsCacheStats
+
 
 class LatentsStorageBase(ABC):
     """Responsible for storing and retrieving latents."""
 
     _on_changed_callbacks: list[Callable[[torch.Tensor], None]]
     _on_deleted_callbacks: list[Callable[[str], None]]
+    _on_saved_callbacks: list[Callable[[str], None]]
 
     def __init__(self) -> None:
         self._on_changed_callbacks = list()
         self._on_deleted_callbacks = list()
+        self._on_saved_callbacks = list()
 
     @abstractmethod
     def get(self, name: str) -> torch.Tensor:
@@ -28,6 +32,13 @@ class LatentsStorageBase(ABC):
     def delete(self, name: str) -> None:
         pass
 
+    def collect_cache_stats(self, cache_stats: LatentsCacheStats) -> None:
+        """
+        Reports cache hits, misses and usage into `cache_stats` from now on.
+        Storages without an in-memory cache have nothing to report.
+        """
+        pass
+
     def on_changed(self, on_changed: Callable[[torch.Tensor], None]) -> None:
         """Register a callback for when an item is changed"""
         self._on_changed_callbacks.append(on_changed)
@@ -36,6 +47,10 @@ class LatentsStorageBase(ABC):
         """Register a callback for when an item is deleted"""
         self._on_deleted_callbacks.append(on_deleted)
 
+    def on_saved(self, on_saved: Callable[[str], None]) -> None:
+        """Register a callback for when an item is saved, called with the item's name"""
+        self._on_saved_callbacks.append(on_saved)
+
     def _on_changed(self, item: torch.Tensor) -> None:
         for callback in self._on_changed_callbacks:
             callback(item)
@@ -43,3 +58,7 @@ class LatentsStorageBase(ABC):
     def _on_deleted(self, item_id: str) -> None:
         for callback in self._on_deleted_callbacks:
             callback(item_id)
+
+    def _on_saved(self, name: str) -> None:
+        for callback in self._on_saved_callbacks:
+            callback(name)
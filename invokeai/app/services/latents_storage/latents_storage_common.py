@@ -0,0 +1,13 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class LatentsCacheStats:
+    """Class for tracking the performance of an in-memory latents cache"""
+
+    hits: int = 0  # cache hits
+    misses: int = 0  # cache misses
+    evicted: int = 0  # number of latents evicted to make space
+    in_cache: int = 0  # number of latents in cache
+    high_watermark: int = 0  # bytes used by cached latents
+    cache_size: int = 0  # maximum size of cache, in bytes
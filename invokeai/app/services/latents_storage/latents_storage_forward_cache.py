@@ -1,54 +1,210 @@
 # Copyright (c) 2023 Kyle Schouviller (https://github.com/kyle0654)
 
+import dataclasses
+from collections import OrderedDict
 from queue import Queue
-from typing import Dict, Optional
+from threading import Condition, Thread
+from typing import Any, Dict, Optional
 
 import torch
 
+from invokeai.app.services.invoker import Invoker
+
 from .latents_storage_base import LatentsStorageBase
+from .latents_storage_common import LatentsCacheStats
+
+
+def get_latents_size_bytes(data: Any) -> int:
+    """Returns the memory used by the tensors in `data`, which may be a tensor or e.g. `ConditioningFieldData`"""
+    if isinstance(data, torch.Tensor):
+        return data.numel() * data.element_size()
+    if isinstance(data, (list, tuple)):
+        return sum(get_latents_size_bytes(item) for item in data)
+    if isinstance(data, dict):
+        return sum(get_latents_size_bytes(item) for item in data.values())
+    if dataclasses.is_dataclass(data):
+        return sum(get_latents_size_bytes(getattr(data, f.name)) for f in dataclasses.fields(data))
+    return 0
 
 
 class ForwardCacheLatentsStorage(LatentsStorageBase):
-    """Caches the latest N latents in memory, writing-thorugh to and reading from underlying storage"""
+    """
+    Caches recently used latents in memory, writing-thorugh to and reading from underlying storage.
+
+    The cache is a LRU bounded by `max_cache_size` bytes of tensor data, so one large SDXL latent can displace many
+    small conditioning tensors.
+
+    In write-behind mode, `save` returns as soon as the latents are cached and a background thread writes them to
+    the underlying storage. Latents waiting to be written are served from memory, deleting them cancels the write,
+    and pending writes are flushed when the service is stopped. At most `max_pending_writes` latents may be waiting;
+    `save` blocks when that limit is reached.
+    """
 
-    __cache: Dict[str, torch.Tensor]
-    __cache_ids: Queue
+    __cache: OrderedDict[str, torch.Tensor]
+    __cache_sizes: Dict[str, int]
+    __current_cache_size: int
     __max_cache_size: int
+    __stats: Optional[LatentsCacheStats]
     __underlying_storage: LatentsStorageBase
+    __write_behind: bool
+    __pending_writes: Dict[str, torch.Tensor]
+    __write_queue: "Queue[Optional[str]]"
+    __writing: Optional[str]
+    __writer_thread: Optional[Thread]
+    __lock: Condition
+    __invoker: Optional[Invoker]
 
-    def __init__(self, underlying_storage: LatentsStorageBase, max_cache_size: int = 20):
+    def __init__(
+        self,
+        underlying_storage: LatentsStorageBase,
+        max_cache_size: int = 256 * 2**20,
+        write_behind: bool = False,
+        max_pending_writes: int = 20,
+    ):
         super().__init__()
         self.__underlying_storage = underlying_storage
-        self.__cache = dict()
-        self.__cache_ids = Queue()
+        self.__cache = OrderedDict()
+        self.__cache_sizes = dict()
+        self.__current_cache_size = 0
         self.__max_cache_size = max_cache_size
+        self.__stats = None
+        self.__write_behind = write_behind
+        self.__pending_writes = dict()
+        self.__write_queue = Queue(maxsize=max_pending_writes)
+        self.__writing = None
+        self.__writer_thread = None
+        self.__lock = Condition()
+        self.__invoker = None
+
+    def start(self, invoker: Invoker) -> None:
+        self.__invoker = invoker
+        start_op = getattr(self.__underlying_storage, "start", None)
+        if callable(start_op):
+            start_op(invoker)
+        if self.__write_behind:
+            self.__writer_thread = Thread(name="latents_writer", target=self.__process_writes, daemon=True)
+            self.__writer_thread.start()
+
+    def stop(self, invoker: Invoker) -> None:
+        self.flush()
+        if self.__writer_thread is not None:
+            self.__write_queue.put(None)
+            self.__writer_thread.join()
+            self.__writer_thread = None
+        stop_op = getattr(self.__underlying_storage, "stop", None)
+        if callable(stop_op):
+            stop_op(invoker)
+
+    def collect_cache_stats(self, cache_stats: LatentsCacheStats) -> None:
+        with self.__lock:
+            self.__stats = cache_stats
+            self.__stats.cache_size = self.__max_cache_size
+
+    def flush(self) -> None:
+        """Blocks until all pending writes have reached the underlying storage"""
+        if self.__writer_thread is not None:
+            self.__write_queue.join()
 
     def get(self, name: str) -> torch.Tensor:
-        cache_item = self.__get_cache(name)
-        if cache_item is not None:
-            return cache_item
+        with self.__lock:
+            cache_item = self.__get_cache(name)
+            if cache_item is None:
+                cache_item = self.__pending_writes.get(name, None)
+            if self.__stats:
+                if cache_item is not None:
+                    self.__stats.hits += 1
+                else:
+                    self.__stats.misses += 1
+            if cache_item is not None:
+                return cache_item
 
         latent = self.__underlying_storage.get(name)
-        self.__set_cache(name, latent)
+        with self.__lock:
+            self.__set_cache(name, latent)
         return latent
 
     def save(self, name: str, data: torch.Tensor) -> None:
-        self.__underlying_storage.save(name, data)
-        self.__set_cache(name, data)
+        # Announce the name before it reaches the underlying storage, so that anything tracking saved latents
+        # knows about a file as soon as it exists
+        self._on_saved(name)
+        if self.__writer_thread is None:
+            self.__underlying_storage.save(name, data)
+            with self.__lock:
+                self.__set_cache(name, data)
+        else:
+            with self.__lock:
+                self.__pending_writes[name] = data
+                self.__set_cache(name, data)
+            # Outside the lock: this blocks while the writer is behind, and the writer needs the lock to catch up
+            self.__write_queue.put(name)
         self._on_changed(data)
 
     def delete(self, name: str) -> None:
-        self.__underlying_storage.delete(name)
-        if name in self.__cache:
-            del self.__cache[name]
+        with self.__lock:
+            cancelled = self.__pending_writes.pop(name, None) is not None
+            # If the latents are being written right now, let the write finish so we don't leave a stray file
+            self.__lock.wait_for(lambda: self.__writing != name)
+            self.__delete_cache(name)
+        try:
+            self.__underlying_storage.delete(name)
+        except FileNotFoundError:
+            # A cancelled write may never have reached the underlying storage
+            if not cancelled:
+                raise
         self._on_deleted(name)
 
+    def __process_writes(self) -> None:
+        while True:
+            name = self.__write_queue.get()
+            try:
+                if name is None:
+                    return
+                with self.__lock:
+                    data = self.__pending_writes.get(name, None)
+                    if data is None:
+                        # Deleted before we got to it, or already written by an earlier queue entry
+                        continue
+                    self.__writing = name
+                try:
+                    self.__underlying_storage.save(name, data)
+                except Exception as e:
+                    if self.__invoker is not None:
+                        self.__invoker.services.logger.error(f"Error writing latents {name}: {e}")
+                finally:
+                    with self.__lock:
+                        self.__writing = None
+                        # Only drop the pending entry if it was not replaced by a newer save while we were writing
+                        if self.__pending_writes.get(name, None) is data:
+                            del self.__pending_writes[name]
+                        self.__lock.notify_all()
+            finally:
+                self.__write_queue.task_done()
+
     def __get_cache(self, name: str) -> Optional[torch.Tensor]:
-        return None if name not in self.__cache else self.__cache[name]
+        cache_item = self.__cache.get(name, None)
+        if cache_item is not None:
+            self.__cache.move_to_end(name)
+        return cache_item
 
     def __set_cache(self, name: str, data: torch.Tensor):
-        if name not in self.__cache:
-            self.__cache[name] = data
-            self.__cache_ids.put(name)
-            if self.__cache_ids.qsize() > self.__max_cache_size:
-                self.__cache.pop(self.__cache_ids.get())
+        size = get_latents_size_bytes(data)
+        self.__delete_cache(name)
+        # Latents larger than the whole cache would only flush everything else out
+        if size > self.__max_cache_size:
+            return
+        while self.__current_cache_size + size > self.__max_cache_size:
+            oldest_name, _ = self.__cache.popitem(last=False)
+            self.__current_cache_size -= self.__cache_sizes.pop(oldest_name)
+            if self.__stats:
+                self.__stats.evicted += 1
+        self.__cache[name] = data
+        self.__cache_sizes[name] = size
+        self.__current_cache_size += size
+        if self.__stats:
+            self.__stats.in_cache = len(self.__cache)
+            self.__stats.high_watermark = max(self.__stats.high_watermark, self.__current_cache_size)
+
+    def __delete_cache(self, name: str) -> None:
+        if name in self.__cache:
+            del self.__cache[name]
+            self.__current_cache_size -= self.__cache_sizes.pop(name)
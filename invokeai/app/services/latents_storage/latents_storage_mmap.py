@@ -0,0 +1,136 @@
+# Copyright (c) 2023 Kyle Schouviller (https://github.com/kyle0654) and the InvokeAI Team
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any, Optional, Union
+
+import torch
+
+from .latents_storage_base import LatentsStorageBase
+
+# Tensors are stored in the safetensors layout: an 8-byte little-endian header length, a JSON header describing
+# dtype, shape and byte offsets of each tensor, then the raw tensor bytes. Only plain tensors use this layout;
+# anything else (e.g. `ConditioningFieldData`) falls back to `torch.save`.
+TENSOR_KEY = "latents"
+HEADER_ALIGNMENT = 8
+MAX_HEADER_SIZE = 100 * 1024 * 1024
+
+DTYPE_TO_NAME: dict[torch.dtype, str] = {
+    torch.float64: "F64",
+    torch.float32: "F32",
+    torch.float16: "F16",
+    torch.bfloat16: "BF16",
+    torch.int64: "I64",
+    torch.int32: "I32",
+    torch.int16: "I16",
+    torch.int8: "I8",
+    torch.uint8: "U8",
+    torch.bool: "BOOL",
+}
+NAME_TO_DTYPE: dict[str, torch.dtype] = {v: k for k, v in DTYPE_TO_NAME.items()}
+
+
+class MmapLatentsStorage(LatentsStorageBase):
+    """
+    Stores latents in a folder on disk, in a flat safetensors-style layout that is read back through `mmap`.
+
+    Loaded tensors share memory with a private (copy-on-write) mapping of the file, so `get` does not copy or
+    deserialize the data. Objects that are not plain tensors, and files written by `DiskLatentsStorage`, are
+    handled with `torch.save`/`torch.load`.
+
+    Windows does not allow a file to be replaced or deleted while it is mapped, which the tensors handed out (and
+    kept by the forward cache) would prevent, so there `get` reads the data into memory instead.
+    """
+
+    __output_folder: Path
+    __map_files: bool
+
+    def __init__(self, output_folder: Union[str, Path], map_files: bool = os.name != "nt"):
+        super().__init__()
+        self.__output_folder = output_folder if isinstance(output_folder, Path) else Path(output_folder)
+        self.__map_files = map_files
+        self.__output_folder.mkdir(parents=True, exist_ok=True)
+
+    def get(self, name: str) -> torch.Tensor:
+        latent_path = self.get_path(name)
+        with open(latent_path, "rb") as f:
+            header_size = self.__read_header_size(f.read(HEADER_ALIGNMENT + 1))
+            if header_size is None:
+                f.seek(0)
+                return torch.load(f)
+            f.seek(HEADER_ALIGNMENT)
+            header = json.loads(f.read(header_size))
+            info = header[TENSOR_KEY]
+            dtype = NAME_TO_DTYPE[info["dtype"]]
+            shape = info["shape"]
+            begin, end = info["data_offsets"]
+            if begin == end:
+                return torch.empty(shape, dtype=dtype)
+            offset = HEADER_ALIGNMENT + header_size + begin
+            buffer: Union[mmap.mmap, bytearray]
+            if self.__map_files:
+                # ACCESS_COPY gives a private mapping: pages are read lazily from the file, and callers that modify
+                # the tensor in place get their own copy of the touched pages instead of writing to the file.
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            else:
+                f.seek(offset)
+                buffer = bytearray(end - begin)
+                f.readinto(buffer)
+                offset = 0
+        count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+        return torch.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+
+    def save(self, name: str, data: Any) -> None:
+        self.__output_folder.mkdir(parents=True, exist_ok=True)
+        latent_path = self.get_path(name)
+        # Write to a temporary file and swap it in, so that tensors still mapped from a previous version of the
+        # file keep seeing the old contents. Where files are not mapped, nothing keeps the file open.
+        tmp_path = latent_path.with_name(f"{latent_path.name}.tmp")
+        with open(tmp_path, "wb") as f:
+            if isinstance(data, torch.Tensor) and data.dtype in DTYPE_TO_NAME:
+                self.__write_tensor(f, data)
+            else:
+                torch.save(data, f)
+        os.replace(tmp_path, latent_path)
+
+    def delete(self, name: str) -> None:
+        latent_path = self.get_path(name)
+        latent_path.unlink()
+
+    def get_path(self, name: str) -> Path:
+        return self.__output_folder / name
+
+    @staticmethod
+    def __write_tensor(f: Any, tensor: torch.Tensor) -> None:
+        tensor = tensor.detach().to("cpu").contiguous()
+        nbytes = tensor.numel() * tensor.element_size()
+        header = json.dumps(
+            {
+                TENSOR_KEY: {
+                    "dtype": DTYPE_TO_NAME[tensor.dtype],
+                    "shape": list(tensor.shape),
+                    "data_offsets": [0, nbytes],
+                }
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        # Pad the header with spaces so that the tensor data is aligned, as safetensors does
+        header += b" " * (-len(header) % HEADER_ALIGNMENT)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        if nbytes > 0:
+            # Viewing as bytes lets numpy expose the tensor's memory without a copy, whatever its dtype
+            f.write(tensor.reshape(-1).view(torch.uint8).numpy().data)
+
+    @staticmethod
+    def __read_header_size(prefix: bytes) -> Optional[int]:
+        """Returns the header size if the prefix looks like our layout, otherwise None"""
+        if len(prefix) < HEADER_ALIGNMENT + 1 or prefix[HEADER_ALIGNMENT : HEADER_ALIGNMENT + 1] != b"{":
+            return None
+        (header_size,) = struct.unpack("<Q", prefix[:HEADER_ALIGNMENT])
+        if header_size > MAX_HEADER_SIZE:
+            return None
+        return header_size
@@ -57,6 +57,19 @@ class ModelManagerServiceBase(ABC):
         of a diffusers pipeline."""
         pass
 
+    @abstractmethod
+    def prefetch_model(
+        self,
+        model_name: str,
+        base_model: BaseModelType,
+        model_type: ModelType,
+        submodel: Optional[SubModelType] = None,
+    ) -> bool:
+        """Load the indicated model into the RAM cache ahead of the
+        session that needs it, if it fits in the cache's free room.
+        Returns whether the model was loaded."""
+        pass
+
     @property
     @abstractmethod
     def logger(self):
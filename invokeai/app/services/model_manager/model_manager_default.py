@@ -128,6 +128,19 @@ class ModelManagerService(ModelManagerServiceBase):
 
         return model_info
 
+    def prefetch_model(
+        self,
+        model_name: str,
+        base_model: BaseModelType,
+        model_type: ModelType,
+        submodel: Optional[SubModelType] = None,
+    ) -> bool:
+        """
+        Load the indicated model into the RAM cache ahead of the session that needs it, if it fits in the cache's free
+        room. Returns whether the model was loaded.
+        """
+        return self.mgr.prefetch_model(model_name, base_model, model_type, submodel)
+
     def model_exists(
         self,
         model_name: str,
@@ -0,0 +1,16 @@
+from abc import ABC, abstractmethod
+
+
+class ModelPrefetcherBase(ABC):
+    """
+    Base class for model prefetchers.
+
+    The models a queue item needs are named in its session's graph. The prefetcher loads the models of the next pending
+    queue items into the RAM model cache while the current session executes, so that they are not loaded from disk
+    when the next session's nodes ask for them.
+    """
+
+    @abstractmethod
+    def prefetch(self) -> None:
+        """Schedules the models of the next pending queue items to be prefetched"""
+        pass
@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from pydantic import BaseModel
+
+from invokeai.app.invocations.controlnet_image_processors import ControlNetModelField
+from invokeai.app.invocations.ip_adapter import IPAdapterModelField
+from invokeai.app.invocations.model import LoRAModelField, MainModelField, VAEModelField
+from invokeai.app.invocations.t2i_adapter import T2IAdapterModelField
+from invokeai.app.services.shared.graph import Graph
+from invokeai.backend.model_management.models import BaseModelType, ModelType, SubModelType
+
+# The types of the models named by node fields other than main models, whose fields name their type
+MODEL_FIELD_TYPES: dict[type[BaseModel], ModelType] = {
+    LoRAModelField: ModelType.Lora,
+    VAEModelField: ModelType.Vae,
+    ControlNetModelField: ModelType.ControlNet,
+    T2IAdapterModelField: ModelType.T2IAdapter,
+    IPAdapterModelField: ModelType.IPAdapter,
+}
+
+
+@dataclass(frozen=True)
+class PrefetchModel:
+    """A model (or submodel) to load into the model cache"""
+
+    model_name: str
+    base_model: BaseModelType
+    model_type: ModelType
+    submodel: Optional[SubModelType] = None
+
+
+def get_main_submodels(base_model: BaseModelType) -> list[SubModelType]:
+    """Gets the submodels of a main model that take time to load, as the model loader nodes output them"""
+    if base_model == BaseModelType.StableDiffusionXL:
+        return [SubModelType.UNet, SubModelType.TextEncoder, SubModelType.TextEncoder2, SubModelType.Vae]
+    if base_model == BaseModelType.StableDiffusionXLRefiner:
+        return [SubModelType.UNet, SubModelType.TextEncoder2, SubModelType.Vae]
+    return [SubModelType.UNet, SubModelType.TextEncoder, SubModelType.Vae]
+
+
+def get_graph_models(graph: Graph) -> list[PrefetchModel]:
+    """Gets the models named by the fields of a graph's nodes, in the order of the nodes"""
+    models: list[PrefetchModel] = []
+    for node in graph.nodes.values():
+        for field_name in node.__fields__:
+            value = getattr(node, field_name)
+            if isinstance(value, MainModelField):
+                # Other types of model (i.e. ONNX) are not split into these submodels
+                if value.model_type == ModelType.Main:
+                    models.extend(
+                        PrefetchModel(value.model_name, value.base_model, value.model_type, submodel)
+                        for submodel in get_main_submodels(value.base_model)
+                    )
+            elif type(value) in MODEL_FIELD_TYPES:
+                models.append(PrefetchModel(value.model_name, value.base_model, MODEL_FIELD_TYPES[type(value)]))
+    return models
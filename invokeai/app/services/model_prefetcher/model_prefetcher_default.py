@@ -0,0 +1,91 @@
+from threading import Event as ThreadEvent
+from threading import Thread
+from typing import Optional
+
+from fastapi_events.handlers.local import local_handler
+from fastapi_events.typing import Event as FastAPIEvent
+
+from invokeai.app.services.events.events_base import EventServiceBase
+from invokeai.app.services.invoker import Invoker
+
+from .model_prefetcher_base import ModelPrefetcherBase
+from .model_prefetcher_common import PrefetchModel, get_graph_models
+
+
+class DefaultModelPrefetcher(ModelPrefetcherBase):
+    """
+    Prefetches models on a background thread whenever a queue item starts or a batch is enqueued.
+
+    The models of the next `lookahead` pending queue items are loaded in the order the items are dequeued, so that the
+    next item's models get the room first. Models are only loaded into the model cache's free room: nothing is unloaded
+    for them, so prefetching never displaces a model that the current session uses.
+    """
+
+    __invoker: Invoker
+    __lookahead: int
+    __prefetch_event: ThreadEvent
+    __stop_event: ThreadEvent
+    __thread: Optional[Thread]
+
+    def __init__(self, lookahead: int = 2):
+        self.__lookahead = lookahead
+        self.__prefetch_event = ThreadEvent()
+        self.__stop_event = ThreadEvent()
+        self.__thread = None
+
+    def start(self, invoker: Invoker) -> None:
+        self.__invoker = invoker
+        if self.__lookahead == 0:
+            return
+        local_handler.register(event_name=EventServiceBase.queue_event, _func=self._on_queue_event)
+        self.__stop_event.clear()
+        self.__thread = Thread(name="model_prefetcher", target=self.__process, daemon=True)
+        self.__thread.start()
+
+    def stop(self, *args, **kwargs) -> None:
+        if self.__thread is not None:
+            self.__stop_event.set()
+            self.__prefetch_event.set()
+            self.__thread.join()
+            self.__thread = None
+
+    def prefetch(self) -> None:
+        self.__prefetch_event.set()
+
+    async def _on_queue_event(self, event: FastAPIEvent) -> None:
+        event_name = event[1]["event"]
+        if event_name == "batch_enqueued":
+            self.prefetch()
+        elif event_name == "queue_item_status_changed" and event[1]["data"]["queue_item"]["status"] == "in_progress":
+            self.prefetch()
+
+    def __process(self) -> None:
+        while True:
+            self.__prefetch_event.wait()
+            self.__prefetch_event.clear()
+            if self.__stop_event.is_set():
+                return
+            try:
+                self.__prefetch_pending()
+            except Exception as e:
+                self.__invoker.services.logger.error(f"Error prefetching models: {e}")
+
+    def __prefetch_pending(self) -> None:
+        graphs = self.__invoker.services.session_queue.get_pending_graphs(self.__lookahead)
+        # Each model once, in the order they are first needed
+        models: dict[PrefetchModel, None] = dict()
+        for graph in graphs:
+            models.update(dict.fromkeys(get_graph_models(graph)))
+        for model in models:
+            if self.__stop_event.is_set():
+                return
+            try:
+                self.__invoker.services.model_manager.prefetch_model(
+                    model_name=model.model_name,
+                    base_model=model.base_model,
+                    model_type=model.model_type,
+                    submodel=model.submodel,
+                )
+            except Exception as e:
+                # The session that needs the model reports the error, if it can't be loaded then either
+                self.__invoker.services.logger.debug(f"Could not prefetch model {model.model_name}: {e}")
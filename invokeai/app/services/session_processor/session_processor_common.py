@@ -1,6 +1,35 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
+class SessionProcessorWorkerStatus(BaseModel):
+    worker_id: int = Field(description="The ID of the worker")
+    cpu_only: bool = Field(default=False, description="Whether the worker only processes sessions that use the CPU")
+    is_processing: bool = Field(description="Whether the worker is processing a session")
+    queue_item_id: Optional[int] = Field(default=None, description="The ID of the queue item the worker is processing")
+    items_started: int = Field(default=0, description="The number of queue items the worker started")
+    idle_time: float = Field(
+        default=0.0,
+        description="Total time between the worker finishing a queue item and starting the next one, while the queue was not empty (seconds)",
+    )
+    max_idle_time: float = Field(
+        default=0.0, description="Longest time between two of the worker's queue items (seconds)"
+    )
+
+
 class SessionProcessorStatus(BaseModel):
     is_started: bool = Field(description="Whether the session processor is started")
     is_processing: bool = Field(description="Whether a session is being processed")
+    items_started: int = Field(default=0, description="The number of queue items started")
+    idle_time: float = Field(
+        default=0.0,
+        description="Total time between a queue item finishing and the next one starting, while the queue was not empty (seconds)",
+    )
+    last_idle_time: float = Field(
+        default=0.0, description="Time between the last queue item starting and the one before it finishing (seconds)"
+    )
+    max_idle_time: float = Field(default=0.0, description="Longest time between two queue items (seconds)")
+    workers: list[SessionProcessorWorkerStatus] = Field(
+        default_factory=list, description="The status of each of the workers processing queue items"
+    )
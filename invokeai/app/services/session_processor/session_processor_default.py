@@ -1,49 +1,146 @@
+import time
 import traceback
-from threading import BoundedSemaphore
 from threading import Event as ThreadEvent
-from threading import Thread
+from threading import Lock, Thread
 from typing import Optional
 
 from fastapi_events.handlers.local import local_handler
 from fastapi_events.typing import Event as FastAPIEvent
 
 from invokeai.app.services.events.events_base import EventServiceBase
+from invokeai.app.services.invocation_queue.invocation_queue_common import InvocationQueueItem
 from invokeai.app.services.session_queue.session_queue_common import SessionQueueItem
+from invokeai.app.services.shared.graph import GraphExecutionState
 
 from ..invoker import Invoker
 from .session_processor_base import SessionProcessorBase
-from .session_processor_common import SessionProcessorStatus
+from .session_processor_common import SessionProcessorStatus, SessionProcessorWorkerStatus
 
 POLLING_INTERVAL = 1
-THREAD_LIMIT = 1
+
+
+class SessionWorker:
+    """
+    A worker of the session processor, which executes one queue item at a time on its own thread. A CPU-only worker
+    only executes the items whose sessions don't use the execution device.
+    """
+
+    def __init__(self, worker_id: int, cpu_only: bool = False) -> None:
+        self.worker_id = worker_id
+        self.cpu_only = cpu_only
+        self.queue_item: Optional[SessionQueueItem] = None
+        self.poll_now_event = ThreadEvent()
+
+        # When the last queue item finished, if the queue has not run dry since, for measuring the idle time
+        self.finished_at: Optional[float] = None
+        self.items_started = 0
+        self.idle_time = 0.0
+        self.max_idle_time = 0.0
+
+    def get_status(self) -> SessionProcessorWorkerStatus:
+        queue_item = self.queue_item
+        return SessionProcessorWorkerStatus(
+            worker_id=self.worker_id,
+            cpu_only=self.cpu_only,
+            is_processing=queue_item is not None,
+            queue_item_id=queue_item.item_id if queue_item is not None else None,
+            items_started=self.items_started,
+            idle_time=self.idle_time,
+            max_idle_time=self.max_idle_time,
+        )
 
 
 class DefaultSessionProcessor(SessionProcessorBase):
+    """
+    Executes the session queue's items, one at a time on each of its workers.
+
+    A worker dequeues its next item as soon as its current one's session completes: the invocation processor hands off
+    to us directly from its thread, rather than through the events, which are only handled on the event loop. The
+    events still finish items that don't complete (e.g. canceled ones) and signal new work, and the queue is polled
+    as a fallback.
+
+    Workers claim items atomically from the session queue and share the invocation processor's threads, so it must
+    have enough for every worker's session to execute its nodes. They also share the model cache, so each extra worker
+    needs room for its own models. Nodes patch the cached models they use in place (e.g. with LoRAs), which is only
+    safe because they do so inside the model's context, where the cache has them take turns: sessions using the same
+    model must never see each other's patches.
+
+    CPU-only workers only dequeue the items whose sessions use no model and no other node that uses the execution
+    device, e.g. image processing, so that these don't wait behind generation. The other workers dequeue any item.
+    """
+
+    def __init__(self, workers: int = 1, cpu_workers: int = 0) -> None:
+        self.__worker_count = workers
+        self.__cpu_worker_count = cpu_workers
+
     def start(self, invoker: Invoker) -> None:
         self.__invoker: Invoker = invoker
-        self.__queue_item: Optional[SessionQueueItem] = None
+        self.__workers = [SessionWorker(worker_id) for worker_id in range(self.__worker_count)]
+        self.__workers.extend(
+            SessionWorker(worker_id, cpu_only=True)
+            for worker_id in range(self.__worker_count, self.__worker_count + self.__cpu_worker_count)
+        )
+        self.__queue_item_lock = Lock()
+        self.__last_idle_time = 0.0
 
         self.__resume_event = ThreadEvent()
         self.__stop_event = ThreadEvent()
-        self.__poll_now_event = ThreadEvent()
 
         local_handler.register(event_name=EventServiceBase.queue_event, _func=self._on_queue_event)
+        self.__invoker.services.processor.on_session_complete(self._on_session_complete)
 
-        self.__threadLimit = BoundedSemaphore(THREAD_LIMIT)
-        self.__thread = Thread(
-            name="session_processor",
-            target=self.__process,
-            kwargs=dict(
-                stop_event=self.__stop_event, poll_now_event=self.__poll_now_event, resume_event=self.__resume_event
-            ),
-        )
-        self.__thread.start()
+        self.__stop_event.clear()
+        self.__resume_event.set()
+        for worker in self.__workers:
+            Thread(
+                name=f"session_processor_{worker.worker_id}",
+                target=self.__process,
+                kwargs=dict(worker=worker, stop_event=self.__stop_event, resume_event=self.__resume_event),
+            ).start()
 
     def stop(self, *args, **kwargs) -> None:
         self.__stop_event.set()
 
     def _poll_now(self) -> None:
-        self.__poll_now_event.set()
+        for worker in self.__workers:
+            worker.poll_now_event.set()
+
+    def __find_worker(self, item_id: int) -> Optional[SessionWorker]:
+        for worker in self.__workers:
+            queue_item = worker.queue_item
+            if queue_item is not None and queue_item.item_id == item_id:
+                return worker
+        return None
+
+    def _finish_queue_item(self, item_id: Optional[int] = None) -> bool:
+        """
+        Clears the worker's current queue item, if it is `item_id` (or every worker's, if None), and has the worker
+        poll for its next one. Events for an item may arrive after it was handed off, so must not clear its successor.
+        """
+        finished = False
+        with self.__queue_item_lock:
+            for worker in self.__workers:
+                if worker.queue_item is None or (item_id is not None and worker.queue_item.item_id != item_id):
+                    continue
+                worker.queue_item = None
+                worker.finished_at = time.perf_counter()
+                worker.poll_now_event.set()
+                finished = True
+        return finished
+
+    def _on_session_complete(self, queue_item: InvocationQueueItem, graph_execution_state: GraphExecutionState) -> None:
+        worker = self.__find_worker(queue_item.session_queue_item_id)
+        current_queue_item = worker.queue_item if worker is not None else None
+        if current_queue_item is None:
+            return
+        # Finish the queue item here, rather than when the session queue handles the events, so that its status is
+        # up to date when the next one starts
+        session_queue = self.__invoker.services.session_queue
+        if graph_execution_state.has_error():
+            session_queue.fail_queue_item(current_queue_item.item_id, "\n".join(graph_execution_state.errors.values()))
+        else:
+            session_queue.complete_queue_item(current_queue_item.item_id)
+        self._finish_queue_item(current_queue_item.item_id)
 
     async def _on_queue_event(self, event: FastAPIEvent) -> None:
         event_name = event[1]["event"]
@@ -55,19 +152,16 @@ class DefaultSessionProcessor(SessionProcessorBase):
             "session_retrieval_error",
             "invocation_retrieval_error",
         ]:
-            self.__queue_item = None
-            self._poll_now()
-        elif (
-            event_name == "session_canceled"
-            and self.__queue_item is not None
-            and self.__queue_item.session_id == event[1]["data"]["graph_execution_state_id"]
-        ):
-            self.__queue_item = None
-            self._poll_now()
+            self._finish_queue_item(event[1]["data"]["queue_item_id"])
+        elif event_name == "session_canceled":
+            for worker in self.__workers:
+                queue_item = worker.queue_item
+                if queue_item is not None and queue_item.session_id == event[1]["data"]["graph_execution_state_id"]:
+                    self._finish_queue_item(queue_item.item_id)
         elif event_name == "batch_enqueued":
             self._poll_now()
         elif event_name == "queue_cleared":
-            self.__queue_item = None
+            self._finish_queue_item()
             self._poll_now()
 
     def resume(self) -> SessionProcessorStatus:
@@ -78,35 +172,62 @@ class DefaultSessionProcessor(SessionProcessorBase):
     def pause(self) -> SessionProcessorStatus:
         if self.__resume_event.is_set():
             self.__resume_event.clear()
+            # Time spent paused is not idle time
+            for worker in self.__workers:
+                worker.finished_at = None
         return self.get_status()
 
     def get_status(self) -> SessionProcessorStatus:
+        workers = [worker.get_status() for worker in self.__workers]
         return SessionProcessorStatus(
             is_started=self.__resume_event.is_set(),
-            is_processing=self.__queue_item is not None,
+            is_processing=any(worker.is_processing for worker in workers),
+            items_started=sum(worker.items_started for worker in workers),
+            idle_time=sum(worker.idle_time for worker in workers),
+            last_idle_time=self.__last_idle_time,
+            max_idle_time=max((worker.max_idle_time for worker in workers), default=0.0),
+            workers=workers,
+        )
+
+    def __record_idle_time(self, worker: SessionWorker) -> None:
+        worker.items_started += 1
+        finished_at = worker.finished_at
+        if finished_at is None:
+            return
+        idle_time = time.perf_counter() - finished_at
+        worker.idle_time += idle_time
+        worker.max_idle_time = max(worker.max_idle_time, idle_time)
+        self.__last_idle_time = idle_time
+        self.__invoker.services.logger.debug(
+            f"Session processor worker {worker.worker_id} was idle for {idle_time * 1000:.1f}ms"
         )
 
     def __process(
         self,
+        worker: SessionWorker,
         stop_event: ThreadEvent,
-        poll_now_event: ThreadEvent,
         resume_event: ThreadEvent,
     ):
+        poll_now_event = worker.poll_now_event
         try:
-            stop_event.clear()
-            resume_event.set()
-            self.__threadLimit.acquire()
             queue_item: Optional[SessionQueueItem] = None
             while not stop_event.is_set():
                 poll_now_event.clear()
                 try:
-                    # do not dequeue if there is already a session running
-                    if self.__queue_item is None and resume_event.is_set():
-                        queue_item = self.__invoker.services.session_queue.dequeue()
+                    # do not dequeue if this worker already has a session running
+                    if worker.queue_item is None and resume_event.is_set():
+                        # dequeue() claims the item atomically, so no other worker can get it too
+                        queue_item = self.__invoker.services.session_queue.dequeue(cpu_only=worker.cpu_only)
 
-                        if queue_item is not None:
-                            self.__invoker.services.logger.debug(f"Executing queue item {queue_item.item_id}")
-                            self.__queue_item = queue_item
+                        if queue_item is None:
+                            # The queue ran dry, so waiting for the next item is not idle time
+                            worker.finished_at = None
+                        else:
+                            self.__invoker.services.logger.debug(
+                                f"Executing queue item {queue_item.item_id} on worker {worker.worker_id}"
+                            )
+                            self.__record_idle_time(worker)
+                            worker.queue_item = queue_item
                             self.__invoker.services.graph_execution_manager.set(queue_item.session)
                             self.__invoker.invoke(
                                 session_queue_batch_id=queue_item.batch_id,
@@ -133,7 +254,5 @@ class DefaultSessionProcessor(SessionProcessorBase):
             self.__invoker.services.logger.error(f"Fatal Error in session processor: {e}")
             pass
         finally:
-            stop_event.clear()
             poll_now_event.clear()
-            self.__queue_item = None
-            self.__threadLimit.release()
+            worker.queue_item = None
@@ -4,6 +4,7 @@ from typing import Optional
 from invokeai.app.services.session_queue.session_queue_common import (
     QUEUE_ITEM_STATUS,
     Batch,
+    BatchPlan,
     BatchStatus,
     CancelByBatchIDsResult,
     CancelByQueueIDResult,
@@ -25,8 +26,8 @@ class SessionQueueBase(ABC):
     """Base class for session queue"""
 
     @abstractmethod
-    def dequeue(self) -> Optional[SessionQueueItem]:
-        """Dequeues the next session queue item."""
+    def dequeue(self, cpu_only: bool = False) -> Optional[SessionQueueItem]:
+        """Dequeues the next session queue item, or if `cpu_only`, the next whose session doesn't use the device."""
         pass
 
     @abstractmethod
@@ -39,9 +40,19 @@ class SessionQueueBase(ABC):
         """Enqueues all permutations of a batch for execution."""
         pass
 
+    @abstractmethod
+    def plan_batch(self, queue_id: str, batch: Batch) -> BatchPlan:
+        """Calculates how many queue items a batch would create, and how many of them would be enqueued."""
+        pass
+
     @abstractmethod
     def get_current(self, queue_id: str) -> Optional[SessionQueueItem]:
-        """Gets the currently-executing session queue item"""
+        """Gets the currently-executing session queue item, the first to start if several are executing"""
+        pass
+
+    @abstractmethod
+    def get_in_progress(self, queue_id: str) -> list[SessionQueueItem]:
+        """Gets every currently-executing session queue item (one per session processor worker), first started first"""
         pass
 
     @abstractmethod
@@ -49,6 +60,11 @@ class SessionQueueBase(ABC):
         """Gets the next session queue item (does not dequeue it)"""
         pass
 
+    @abstractmethod
+    def get_pending_graphs(self, limit: int) -> list[Graph]:
+        """Gets the graphs of the next pending session queue items, in dequeue order (does not dequeue them)"""
+        pass
+
     @abstractmethod
     def clear(self, queue_id: str) -> ClearResult:
         """Deletes all session queue items"""
@@ -79,6 +95,16 @@ class SessionQueueBase(ABC):
         """Gets the status of a batch"""
         pass
 
+    @abstractmethod
+    def complete_queue_item(self, item_id: int) -> SessionQueueItem:
+        """Marks a session queue item completed, unless it has already finished"""
+        pass
+
+    @abstractmethod
+    def fail_queue_item(self, item_id: int, error: str) -> SessionQueueItem:
+        """Marks a session queue item failed"""
+        pass
+
     @abstractmethod
     def cancel_queue_item(self, item_id: int, error: Optional[str] = None) -> SessionQueueItem:
         """Cancels a session queue item"""
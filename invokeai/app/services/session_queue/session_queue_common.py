@@ -1,7 +1,8 @@
 import datetime
 import json
 from itertools import chain, product
-from typing import Generator, Iterable, Literal, NamedTuple, Optional, TypeAlias, Union, cast
+from math import prod
+from typing import Any, Generator, Iterable, Literal, NamedTuple, Optional, TypeAlias, Union, cast
 
 from pydantic import BaseModel, Field, StrictStr, parse_raw_as, root_validator, validator
 from pydantic.json import pydantic_encoder
@@ -33,6 +34,10 @@ class SessionQueueItemNotFoundError(ValueError):
     """Raise when a queue item is not found."""
 
 
+class BatchIdExistsError(ValueError):
+    """Raise when a batch is enqueued with the id of a batch whose queue items still use a different graph."""
+
+
 # endregion
 
 
@@ -235,11 +240,20 @@ class SessionQueueItem(SessionQueueItemWithoutGraph):
 # region Query Results
 
 
+class SessionQueueCurrentItem(BaseModel):
+    item_id: int = Field(description="The queue item id")
+    batch_id: str = Field(description="The queue item's batch id")
+    session_id: str = Field(description="The queue item's session id")
+
+
 class SessionQueueStatus(BaseModel):
     queue_id: str = Field(..., description="The ID of the queue")
-    item_id: Optional[int] = Field(description="The current queue item id")
+    item_id: Optional[int] = Field(description="The current queue item id (the first to start, if several are)")
     batch_id: Optional[str] = Field(description="The current queue item's batch id")
     session_id: Optional[str] = Field(description="The current queue item's session id")
+    current_items: list[SessionQueueCurrentItem] = Field(
+        default_factory=list, description="Every current queue item, one per session processor worker executing one"
+    )
     pending: int = Field(..., description="Number of queue items with status 'pending'")
     in_progress: int = Field(..., description="Number of queue items with status 'in_progress'")
     completed: int = Field(..., description="Number of queue items with status 'complete'")
@@ -248,6 +262,17 @@ class SessionQueueStatus(BaseModel):
     total: int = Field(..., description="Total number of queue items")
 
 
+class BatchPlan(BaseModel):
+    batch_id: str = Field(..., description="The ID of the batch")
+    requested: int = Field(..., description="The total number of queue items the batch would create")
+    accepted: int = Field(..., description="The number of queue items that would be enqueued, given the queue's size")
+    runs: int = Field(..., description="The number of times the batch is run")
+    sessions_per_run: int = Field(..., description="The number of queue items each run creates")
+    batch_data_sizes: list[int] = Field(..., description="The number of values in each list of zipped batch data")
+    accepted_runs: int = Field(..., description="The number of runs that would be enqueued in full")
+    truncated: bool = Field(..., description="Whether the batch would be cut short because the queue is full")
+
+
 class BatchStatus(BaseModel):
     queue_id: str = Field(..., description="The ID of the queue")
     batch_id: str = Field(..., description="The ID of the batch")
@@ -331,17 +356,11 @@ def populate_graph(graph: Graph, node_field_values: Iterable[NodeFieldValue]) ->
     return graph_clone
 
 
-def create_session_nfv_tuples(
-    batch: Batch, maximum: int
-) -> Generator[tuple[GraphExecutionState, list[NodeFieldValue]], None, None]:
+def create_field_values(batch: Batch, maximum: int) -> Generator[list[NodeFieldValue], None, None]:
     """
-    Create all graph permutations from the given batch data and graph. Yields tuples
-    of the form (graph, batch_data_items) where batch_data_items is the list of BatchDataItems
-    that was applied to the graph.
+    Yields the node field values of each session of the batch, in order, without creating the sessions.
     """
 
-    # TODO: Should this be a class method on Batch?
-
     data: list[list[tuple[NodeFieldValue]]] = []
     batch_data_collection = batch.data if batch.data is not None else []
     for batch_datum_list in batch_data_collection:
@@ -356,42 +375,82 @@ def create_session_nfv_tuples(
             node_field_values_to_zip.append(node_field_values)
         data.append(list(zip(*node_field_values_to_zip)))
 
-    # create generator to yield session,nfv tuples
     count = 0
     for _ in range(batch.runs):
         for d in product(*data):
             if count >= maximum:
                 return
-            flat_node_field_values = list(chain.from_iterable(d))
-            graph = populate_graph(batch.graph, flat_node_field_values)
-            yield (GraphExecutionState(graph=graph), flat_node_field_values)
+            yield list(chain.from_iterable(d))
             count += 1
 
 
+def create_session(graph: Graph, session_id: str, field_values: Optional[list[NodeFieldValue]]) -> GraphExecutionState:
+    """
+    Creates the session of a queue item, populating its batch's graph with the item's field values.
+    """
+    return GraphExecutionState(id=session_id, graph=populate_graph(graph, field_values or []))
+
+
+def create_session_nfv_tuples(
+    batch: Batch, maximum: int
+) -> Generator[tuple[GraphExecutionState, list[NodeFieldValue]], None, None]:
+    """
+    Create all graph permutations from the given batch data and graph. Yields tuples
+    of the form (graph, batch_data_items) where batch_data_items is the list of BatchDataItems
+    that was applied to the graph.
+    """
+
+    # TODO: Should this be a class method on Batch?
+
+    for flat_node_field_values in create_field_values(batch, maximum):
+        graph = populate_graph(batch.graph, flat_node_field_values)
+        yield (GraphExecutionState(graph=graph), flat_node_field_values)
+
+
+def calc_batch_data_sizes(batch: Batch) -> list[int]:
+    """
+    Calculates the number of values in each list of zipped batch data. Zipped batch data must all have the same
+    length, so this is the length of each list's first batch datum.
+    """
+    batch_data_collection = batch.data if batch.data is not None else []
+    return [len(batch_data_list[0].items) if batch_data_list else 0 for batch_data_list in batch_data_collection]
+
+
 def calc_session_count(batch: Batch) -> int:
     """
     Calculates the number of sessions that would be created by the batch, without incurring
     the overhead of actually generating them. Adapted from `create_sessions().
     """
-    # TODO: Should this be a class method on Batch?
-    if not batch.data:
-        return batch.runs
-    data = []
-    for batch_datum_list in batch.data:
-        to_zip = []
-        for batch_datum in batch_datum_list:
-            batch_data_items = range(len(batch_datum.items))
-            to_zip.append(batch_data_items)
-        data.append(list(zip(*to_zip)))
-    data_product = list(product(*data))
-    return len(data_product) * batch.runs
+    # The sessions of a run are the cartesian product of the lists of zipped batch data
+    return prod(calc_batch_data_sizes(batch)) * batch.runs
+
+
+def plan_batch(batch: Batch, max_new_queue_items: int) -> BatchPlan:
+    """
+    Plans the enqueueing of a batch, given how many items the queue has room for. Nothing is generated.
+    """
+    batch_data_sizes = calc_batch_data_sizes(batch)
+    sessions_per_run = prod(batch_data_sizes)
+    requested = sessions_per_run * batch.runs
+    accepted = max(0, min(requested, max_new_queue_items))
+    return BatchPlan(
+        batch_id=batch.batch_id,
+        requested=requested,
+        accepted=accepted,
+        runs=batch.runs,
+        sessions_per_run=sessions_per_run,
+        batch_data_sizes=batch_data_sizes,
+        # Sessions are created run after run, so a truncated batch gets its first runs in full
+        accepted_runs=accepted // sessions_per_run if sessions_per_run > 0 else 0,
+        truncated=accepted < requested,
+    )
 
 
 class SessionQueueValueToInsert(NamedTuple):
     """A tuple of values to insert into the session_queue table"""
 
     queue_id: str  # queue_id
-    session: str  # session json
+    session: Optional[str]  # session json, NULL until the session is created from the batch's graph at dequeue
     session_id: str  # session_id
     batch_id: str  # batch_id
     field_values: Optional[str]  # field_values json
@@ -402,15 +461,17 @@ ValuesToInsert: TypeAlias = list[SessionQueueValueToInsert]
 
 
 def prepare_values_to_insert(queue_id: str, batch: Batch, priority: int, max_new_queue_items: int) -> ValuesToInsert:
+    """
+    Prepares the queue items of a batch. Sessions are not created here: the batch's graph is stored once, and each
+    item's session is created from it and the item's field values when the item is dequeued.
+    """
     values_to_insert: ValuesToInsert = []
-    for session, field_values in create_session_nfv_tuples(batch, max_new_queue_items):
-        # sessions must have unique id
-        session.id = uuid_string()
+    for field_values in create_field_values(batch, max_new_queue_items):
         values_to_insert.append(
             SessionQueueValueToInsert(
                 queue_id,  # queue_id
-                session.json(),  # session (json)
-                session.id,  # session_id
+                None,  # session (json)
+                uuid_string(),  # session_id
                 batch.batch_id,  # batch_id
                 # must use pydantic_encoder bc field_values is a list of models
                 json.dumps(field_values, default=pydantic_encoder) if field_values else None,  # field_values (json)
@@ -420,4 +481,33 @@ def prepare_values_to_insert(queue_id: str, batch: Batch, priority: int, max_new
     return values_to_insert
 
 
+# The types of the nodes that use the execution device without getting a model from the model manager
+EXECUTION_DEVICE_NODE_TYPES = {"noise", "lresize", "lscale", "lblend", "esrgan", "infill_lama", "img_nsfw"}
+
+
+def _names_model(value: Any) -> bool:
+    """Whether a node's field value names a model, e.g. a model field, or a UNet, CLIP or VAE field"""
+    if isinstance(value, Graph):
+        return uses_execution_device(value)
+    if isinstance(value, BaseModel):
+        if hasattr(value, "model_name") and hasattr(value, "base_model"):
+            return True
+        return any(_names_model(getattr(value, field_name, None)) for field_name in value.__fields__)
+    if isinstance(value, (list, tuple)):
+        return any(_names_model(v) for v in value)
+    if isinstance(value, dict):
+        return any(_names_model(v) for v in value.values())
+    return False
+
+
+def uses_execution_device(graph: Graph) -> bool:
+    """
+    Whether the sessions of a graph use the execution device: if any of its nodes names a model, or is of a type that
+    uses the device directly. Batch data can't name a model, so this holds for every session of a batch.
+    """
+    return any(
+        node.get_type() in EXECUTION_DEVICE_NODE_TYPES or _names_model(node) for node in graph.nodes.values()
+    )
+
+
 # endregion Util
@@ -1,5 +1,7 @@
 import sqlite3
 import threading
+import traceback
+from collections import OrderedDict
 from typing import Optional, Union, cast
 
 from fastapi_events.handlers.local import local_handler
@@ -12,6 +14,8 @@ from invokeai.app.services.session_queue.session_queue_common import (
     DEFAULT_QUEUE_ID,
     QUEUE_ITEM_STATUS,
     Batch,
+    BatchIdExistsError,
+    BatchPlan,
     BatchStatus,
     CancelByBatchIDsResult,
     CancelByQueueIDResult,
@@ -21,23 +25,33 @@ from invokeai.app.services.session_queue.session_queue_common import (
     IsEmptyResult,
     IsFullResult,
     PruneResult,
+    SessionQueueCurrentItem,
     SessionQueueItem,
     SessionQueueItemDTO,
     SessionQueueItemNotFoundError,
     SessionQueueStatus,
-    calc_session_count,
+    create_session,
+    get_field_values,
+    plan_batch,
     prepare_values_to_insert,
+    uses_execution_device,
 )
-from invokeai.app.services.shared.graph import Graph
+from invokeai.app.services.shared.graph import Graph, GraphExecutionState
 from invokeai.app.services.shared.pagination import CursorPaginatedResults
-from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.app.services.shared.sqlite import InstrumentedLock, SqliteDatabase
+
+# How many batch graphs to keep parsed, for creating the sessions of their queue items
+MAX_CACHED_BATCH_GRAPHS = 8
 
 
 class SqliteSessionQueue(SessionQueueBase):
     __invoker: Invoker
+    __db: SqliteDatabase
     __conn: sqlite3.Connection
     __cursor: sqlite3.Cursor
-    __lock: threading.Lock
+    __lock: InstrumentedLock
+    __batch_graphs: OrderedDict[str, Graph]
+    __batch_graphs_lock: threading.Lock
 
     def start(self, invoker: Invoker) -> None:
         self.__invoker = invoker
@@ -48,9 +62,12 @@ class SqliteSessionQueue(SessionQueueBase):
 
     def __init__(self, db: SqliteDatabase) -> None:
         super().__init__()
+        self.__db = db
         self.__lock = db.lock
         self.__conn = db.conn
         self.__cursor = self.__conn.cursor()
+        self.__batch_graphs = OrderedDict()
+        self.__batch_graphs_lock = threading.Lock()
         self._create_tables()
 
     def _match_event_name(self, event: FastAPIEvent, match_in: list[str]) -> bool:
@@ -71,12 +88,7 @@ class SqliteSessionQueue(SessionQueueBase):
     async def _handle_complete_event(self, event: FastAPIEvent) -> None:
         try:
             item_id = event[1]["data"]["queue_item_id"]
-            # When a queue item has an error, we get an error event, then a completed event.
-            # Mark the queue item completed only if it isn't already marked completed, e.g.
-            # by a previously-handled error event.
-            queue_item = self.get_queue_item(item_id)
-            if queue_item.status not in ["completed", "failed", "canceled"]:
-                queue_item = self._set_queue_item_status(item_id=queue_item.item_id, status="completed")
+            self.complete_queue_item(item_id)
         except SessionQueueItemNotFoundError:
             return
 
@@ -84,9 +96,7 @@ class SqliteSessionQueue(SessionQueueBase):
         try:
             item_id = event[1]["data"]["queue_item_id"]
             error = event[1]["data"]["error"]
-            queue_item = self.get_queue_item(item_id)
-            # always set to failed if have an error, even if previously the item was marked completed or canceled
-            queue_item = self._set_queue_item_status(item_id=queue_item.item_id, status="failed", error=error)
+            self.fail_queue_item(item_id, error)
         except SessionQueueItemNotFoundError:
             return
 
@@ -111,7 +121,7 @@ class SqliteSessionQueue(SessionQueueBase):
                     queue_id TEXT NOT NULL, -- identifier of the queue this queue item belongs to
                     session_id TEXT NOT NULL UNIQUE, -- duplicated data from the session column, for ease of access
                     field_values TEXT, -- NULL if no values are associated with this queue item
-                    session TEXT NOT NULL, -- the session to be executed
+                    session TEXT, -- the session to be executed, NULL until it is created from the batch's graph at dequeue
                     status TEXT NOT NULL DEFAULT 'pending', -- the status of the queue item, one of 'pending', 'in_progress', 'completed', 'failed', 'canceled'
                     priority INTEGER NOT NULL DEFAULT 0, -- the priority, higher is more important
                     error TEXT, -- any errors associated with this queue item
@@ -125,6 +135,21 @@ class SqliteSessionQueue(SessionQueueBase):
                 """
             )
 
+            self._migrate_nullable_session()
+
+            self.__cursor.execute(
+                """--sql
+                CREATE TABLE IF NOT EXISTS session_queue_batches (
+                    batch_id TEXT NOT NULL PRIMARY KEY,
+                    graph TEXT NOT NULL, -- the graph from which the sessions of the batch's queue items are created
+                    cpu_only BOOLEAN NOT NULL DEFAULT FALSE, -- whether the sessions don't use the execution device, so CPU-only session workers may execute them
+                    created_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'))
+                );
+                """
+            )
+
+            self._migrate_batches_cpu_only()
+
             self.__cursor.execute(
                 """--sql
                 CREATE UNIQUE INDEX IF NOT EXISTS idx_session_queue_item_id ON session_queue(item_id);
@@ -137,21 +162,43 @@ class SqliteSessionQueue(SessionQueueBase):
                 """
             )
 
+            # These single-column indices are superseded by the composite indices below
+            self.__cursor.execute("""DROP INDEX IF EXISTS idx_session_queue_batch_id;""")
+            self.__cursor.execute("""DROP INDEX IF EXISTS idx_session_queue_created_priority;""")
+            self.__cursor.execute("""DROP INDEX IF EXISTS idx_session_queue_created_status;""")
+
+            # The composite indices match the filters and ordering of the hot queries, so they are answered from the
+            # index alone, without reading the rows (and their sessions). Every index has item_id, the rowid.
+
+            # dequeue: the next pending item of any queue
+            self.__cursor.execute(
+                """--sql
+                CREATE INDEX IF NOT EXISTS idx_session_queue_status_priority
+                ON session_queue(status, priority DESC, item_id);
+                """
+            )
+
+            # get_next, get_current, list_queue_items by status, get_queue_status, queue size and highest priority
             self.__cursor.execute(
                 """--sql
-                CREATE INDEX IF NOT EXISTS idx_session_queue_batch_id ON session_queue(batch_id);
+                CREATE INDEX IF NOT EXISTS idx_session_queue_queue_id_status_priority
+                ON session_queue(queue_id, status, priority DESC, item_id);
                 """
             )
 
+            # list_queue_items without a status
             self.__cursor.execute(
                 """--sql
-                CREATE INDEX IF NOT EXISTS idx_session_queue_created_priority ON session_queue(priority);
+                CREATE INDEX IF NOT EXISTS idx_session_queue_queue_id_priority
+                ON session_queue(queue_id, priority DESC, item_id);
                 """
             )
 
+            # get_batch_status, cancel_by_batch_ids, and deleting unused batch graphs
             self.__cursor.execute(
                 """--sql
-                CREATE INDEX IF NOT EXISTS idx_session_queue_created_status ON session_queue(status);
+                CREATE INDEX IF NOT EXISTS idx_session_queue_batch_id_queue_id_status
+                ON session_queue(batch_id, queue_id, status);
                 """
             )
 
@@ -207,6 +254,101 @@ class SqliteSessionQueue(SessionQueueBase):
         finally:
             self.__lock.release()
 
+    def _migrate_nullable_session(self) -> None:
+        """
+        Queues created before batches were stored as a graph plus field values require a session for every queue
+        item. SQLite can't drop a NOT NULL constraint, so the table is rebuilt; its indices and triggers are dropped
+        with the old table, and recreated by `_create_tables`.
+        """
+        self.__cursor.execute("""PRAGMA table_info(session_queue);""")
+        columns = {row["name"]: row for row in self.__cursor.fetchall()}
+        if not columns["session"]["notnull"]:
+            return
+        self.__cursor.execute(
+            """--sql
+            CREATE TABLE session_queue_new (
+                item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch_id TEXT NOT NULL,
+                queue_id TEXT NOT NULL,
+                session_id TEXT NOT NULL UNIQUE,
+                field_values TEXT,
+                session TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                priority INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
+                updated_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
+                started_at DATETIME,
+                completed_at DATETIME
+            );
+            """
+        )
+        column_names = ", ".join(columns.keys())
+        self.__cursor.execute(
+            f"""--sql
+            INSERT INTO session_queue_new ({column_names})
+            SELECT {column_names} FROM session_queue;
+            """
+        )
+        self.__cursor.execute("""DROP TABLE session_queue;""")
+        self.__cursor.execute("""ALTER TABLE session_queue_new RENAME TO session_queue;""")
+
+    def _migrate_batches_cpu_only(self) -> None:
+        """Batches stored before CPU-only session workers existed are left to the other workers"""
+        self.__cursor.execute("""PRAGMA table_info(session_queue_batches);""")
+        if "cpu_only" in {row["name"] for row in self.__cursor.fetchall()}:
+            return
+        self.__cursor.execute(
+            """--sql
+            ALTER TABLE session_queue_batches ADD COLUMN cpu_only BOOLEAN NOT NULL DEFAULT FALSE;
+            """
+        )
+
+    def _get_batch_graph(self, batch_id: str) -> Graph:
+        """Gets the graph of a batch stored with `enqueue_batch`"""
+        with self.__batch_graphs_lock:
+            graph = self.__batch_graphs.get(batch_id, None)
+            if graph is not None:
+                self.__batch_graphs.move_to_end(batch_id)
+                return graph
+        with self.__db.read() as conn:
+            result = conn.execute(
+                """--sql
+                SELECT graph
+                FROM session_queue_batches
+                WHERE batch_id = ?
+                """,
+                (batch_id,),
+            ).fetchone()
+        if result is None:
+            raise SessionQueueItemNotFoundError(f"No graph for batch {batch_id}")
+        graph = Graph.parse_raw(result[0])
+        with self.__batch_graphs_lock:
+            self.__batch_graphs[batch_id] = graph
+            while len(self.__batch_graphs) > MAX_CACHED_BATCH_GRAPHS:
+                self.__batch_graphs.popitem(last=False)
+        return graph
+
+    def _create_queue_item(self, queue_item_dict: dict) -> SessionQueueItem:
+        """Creates a queue item from its row, creating its session from the batch's graph if it wasn't yet"""
+        if queue_item_dict["session"] is None:
+            session = create_session(
+                graph=self._get_batch_graph(queue_item_dict["batch_id"]),
+                session_id=queue_item_dict["session_id"],
+                field_values=get_field_values(queue_item_dict),
+            )
+            queue_item_dict["session"] = session.json()
+        return SessionQueueItem.from_dict(queue_item_dict)
+
+    def _delete_unused_batches(self) -> None:
+        """Deletes the graphs of batches that no longer have queue items. Caller must hold the lock."""
+        self.__cursor.execute(
+            """--sql
+            DELETE FROM session_queue_batches
+            WHERE batch_id NOT IN (SELECT batch_id FROM session_queue);
+            """
+        )
+
     def _set_in_progress_to_canceled(self) -> None:
         """
         Sets all in_progress queue items to canceled. Run on app startup, not associated with any queue.
@@ -282,6 +424,9 @@ class SqliteSessionQueue(SessionQueueBase):
         )
 
     def enqueue_batch(self, queue_id: str, batch: Batch, prepend: bool) -> EnqueueBatchResult:
+        # The graph is stored once for the whole batch, and serialized before taking the lock
+        graph_json = batch.graph.json()
+        cpu_only = not uses_execution_device(batch.graph)
         try:
             self.__lock.acquire()
 
@@ -294,18 +439,47 @@ class SqliteSessionQueue(SessionQueueBase):
             if prepend:
                 priority = self._get_highest_priority(queue_id) + 1
 
-            requested_count = calc_session_count(batch)
+            # Only the accepted queue items are generated
+            plan = plan_batch(batch, max_new_queue_items)
+            requested_count = plan.requested
             values_to_insert = prepare_values_to_insert(
                 queue_id=queue_id,
                 batch=batch,
                 priority=priority,
-                max_new_queue_items=max_new_queue_items,
+                max_new_queue_items=plan.accepted,
             )
             enqueued_count = len(values_to_insert)
 
-            if requested_count > enqueued_count:
-                values_to_insert = values_to_insert[:max_new_queue_items]
-
+            if enqueued_count > 0:
+                # Items are created from their batch's graph when dequeued, so it can't be replaced while any wait
+                self.__cursor.execute(
+                    """--sql
+                    SELECT graph, EXISTS (
+                      SELECT 1
+                      FROM session_queue
+                      WHERE
+                        batch_id = session_queue_batches.batch_id
+                        AND session IS NULL
+                    )
+                    FROM session_queue_batches
+                    WHERE batch_id = ?
+                    """,
+                    (batch.batch_id,),
+                )
+                existing = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
+                if existing is not None and existing[0] != graph_json and existing[1]:
+                    raise BatchIdExistsError(f"Batch {batch.batch_id} is already queued with a different graph")
+                if existing is None or existing[0] != graph_json:
+                    self.__cursor.execute(
+                        """--sql
+                        INSERT OR REPLACE INTO session_queue_batches (batch_id, graph, cpu_only)
+                        VALUES (?, ?, ?)
+                        """,
+                        (batch.batch_id, graph_json, cpu_only),
+                    )
+                    # The graph of an earlier batch with this id may still be cached
+                    with self.__batch_graphs_lock:
+                        self.__batch_graphs.pop(batch.batch_id, None)
             self.__cursor.executemany(
                 """--sql
                 INSERT INTO session_queue (queue_id, session, session_id, batch_id, field_values, priority)
@@ -329,31 +503,130 @@ class SqliteSessionQueue(SessionQueueBase):
         self.__invoker.services.events.emit_batch_enqueued(enqueue_result)
         return enqueue_result
 
-    def dequeue(self) -> Optional[SessionQueueItem]:
+    def plan_batch(self, queue_id: str, batch: Batch) -> BatchPlan:
+        with self.__db.read() as conn:
+            current_queue_size = conn.execute(
+                """--sql
+                SELECT count(*)
+                FROM session_queue
+                WHERE
+                  queue_id = ?
+                  AND status = 'pending'
+                """,
+                (queue_id,),
+            ).fetchone()[0]
+        max_queue_size = self.__invoker.services.configuration.get_config().max_queue_size
+        return plan_batch(batch, max_queue_size - current_queue_size)
+
+    def dequeue(self, cpu_only: bool = False) -> Optional[SessionQueueItem]:
+        while True:
+            # Pick the next item from the index alone and claim it under the same lock, so that session processor
+            # workers dequeuing at the same time each get a different item. Then load only that item.
+            try:
+                self.__lock.acquire()
+                if cpu_only:
+                    # Walks the pending items in order, looking up each one's batch, until one doesn't use the device
+                    self.__cursor.execute(
+                        """--sql
+                        SELECT session_queue.item_id, session_queue.session IS NULL
+                        FROM session_queue
+                        CROSS JOIN session_queue_batches ON session_queue_batches.batch_id = session_queue.batch_id
+                        WHERE
+                          session_queue.status = 'pending'
+                          AND session_queue_batches.cpu_only
+                        ORDER BY
+                          session_queue.priority DESC,
+                          session_queue.item_id ASC
+                        LIMIT 1
+                        """
+                    )
+                else:
+                    self.__cursor.execute(
+                        """--sql
+                        SELECT item_id, session IS NULL
+                        FROM session_queue
+                        WHERE status = 'pending'
+                        ORDER BY
+                          priority DESC,
+                          item_id ASC
+                        LIMIT 1
+                        """
+                    )
+                result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
+                if result is not None:
+                    self.__cursor.execute(
+                        """--sql
+                        UPDATE session_queue
+                        SET status = 'in_progress'
+                        WHERE item_id = ?
+                        """,
+                        (result[0],),
+                    )
+                    self.__conn.commit()
+            except Exception:
+                self.__conn.rollback()
+                raise
+            finally:
+                self.__lock.release()
+            if result is None:
+                return None
+            item_id, needs_session = result
+            if needs_session and not self._store_session(item_id):
+                continue
+            return self._emit_queue_item_status_changed(item_id)
+
+    def _store_session(self, item_id: int) -> bool:
+        """
+        Creates the session of a queue item from its batch's graph, and stores it, so that it is only created once
+        and stays with the queue item. If the session can't be created, e.g. because a batch value is not valid for
+        its field, the item is given an empty session, so that it can still be read, and is failed.
+        """
         try:
             self.__lock.acquire()
             self.__cursor.execute(
                 """--sql
-                SELECT *
+                SELECT batch_id, session_id, field_values
                 FROM session_queue
-                WHERE status = 'pending'
-                ORDER BY
-                  priority DESC,
-                  item_id ASC
-                LIMIT 1
-                """
+                WHERE item_id = ?
+                """,
+                (item_id,),
             )
-            result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
+            result = cast(sqlite3.Row, self.__cursor.fetchone())
         except Exception:
             self.__conn.rollback()
             raise
         finally:
             self.__lock.release()
-        if result is None:
-            return None
-        queue_item = SessionQueueItem.from_dict(dict(result))
-        queue_item = self._set_queue_item_status(item_id=queue_item.item_id, status="in_progress")
-        return queue_item
+        error: Optional[str] = None
+        try:
+            session = create_session(
+                graph=self._get_batch_graph(result["batch_id"]),
+                session_id=result["session_id"],
+                field_values=get_field_values(dict(result)),
+            )
+        except Exception:
+            error = traceback.format_exc()
+            session = GraphExecutionState(id=result["session_id"], graph=Graph())
+        try:
+            self.__lock.acquire()
+            self.__cursor.execute(
+                """--sql
+                UPDATE session_queue
+                SET session = ?
+                WHERE item_id = ?
+                """,
+                (session.json(), item_id),
+            )
+            self.__conn.commit()
+        except Exception:
+            self.__conn.rollback()
+            raise
+        finally:
+            self.__lock.release()
+        if error is not None:
+            self._set_queue_item_status(item_id=item_id, status="failed", error=error)
+            return False
+        return True
 
     def get_next(self, queue_id: str) -> Optional[SessionQueueItem]:
         try:
@@ -367,7 +640,7 @@ class SqliteSessionQueue(SessionQueueBase):
                   AND status = 'pending'
                 ORDER BY
                   priority DESC,
-                  created_at ASC
+                  item_id ASC
                 LIMIT 1
                 """,
                 (queue_id,),
@@ -380,31 +653,81 @@ class SqliteSessionQueue(SessionQueueBase):
             self.__lock.release()
         if result is None:
             return None
-        return SessionQueueItem.from_dict(dict(result))
+        return self._create_queue_item(dict(result))
+
+    def get_pending_graphs(self, limit: int) -> list[Graph]:
+        with self.__db.read() as conn:
+            results = conn.execute(
+                """--sql
+                SELECT batch_id, session_id, field_values, session
+                FROM session_queue
+                WHERE status = 'pending'
+                ORDER BY
+                  priority DESC,
+                  item_id ASC
+                LIMIT ?
+                """,
+                (limit,),
+            ).fetchall()
+        graphs: list[Graph] = []
+        for result in results:
+            try:
+                if result["session"] is not None:
+                    graphs.append(GraphExecutionState.parse_raw(result["session"]).graph)
+                else:
+                    session = create_session(
+                        graph=self._get_batch_graph(result["batch_id"]),
+                        session_id=result["session_id"],
+                        field_values=get_field_values(dict(result)),
+                    )
+                    graphs.append(session.graph)
+            except Exception:
+                # The item fails when it is dequeued
+                continue
+        return graphs
 
     def get_current(self, queue_id: str) -> Optional[SessionQueueItem]:
-        try:
-            self.__lock.acquire()
-            self.__cursor.execute(
+        in_progress = self.get_in_progress(queue_id)
+        return in_progress[0] if in_progress else None
+
+    def get_in_progress(self, queue_id: str) -> list[SessionQueueItem]:
+        with self.__db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
                 """--sql
                 SELECT *
                 FROM session_queue
                 WHERE
                   queue_id = ?
                   AND status = 'in_progress'
-                LIMIT 1
+                ORDER BY
+                  started_at ASC,
+                  item_id ASC
                 """,
                 (queue_id,),
             )
-            result = cast(Union[sqlite3.Row, None], self.__cursor.fetchone())
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
-        if result is None:
-            return None
-        return SessionQueueItem.from_dict(dict(result))
+            results = cast(list[sqlite3.Row], cursor.fetchall())
+        return [self._create_queue_item(dict(result)) for result in results]
+
+    def _get_current_items(self, queue_id: str) -> list[SessionQueueCurrentItem]:
+        # The queue status is polled often, so only the columns it reports are read, not each item's whole session
+        with self.__db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """--sql
+                SELECT item_id, batch_id, session_id
+                FROM session_queue
+                WHERE
+                  queue_id = ?
+                  AND status = 'in_progress'
+                ORDER BY
+                  started_at ASC,
+                  item_id ASC
+                """,
+                (queue_id,),
+            )
+            results = cast(list[sqlite3.Row], cursor.fetchall())
+        return [SessionQueueCurrentItem(**dict(result)) for result in results]
 
     def _set_queue_item_status(
         self, item_id: int, status: QUEUE_ITEM_STATUS, error: Optional[str] = None
@@ -425,6 +748,9 @@ class SqliteSessionQueue(SessionQueueBase):
             raise
         finally:
             self.__lock.release()
+        return self._emit_queue_item_status_changed(item_id)
+
+    def _emit_queue_item_status_changed(self, item_id: int) -> SessionQueueItem:
         queue_item = self.get_queue_item(item_id)
         batch_status = self.get_batch_status(queue_id=queue_item.queue_id, batch_id=queue_item.batch_id)
         queue_status = self.get_queue_status(queue_id=queue_item.queue_id)
@@ -486,6 +812,7 @@ class SqliteSessionQueue(SessionQueueBase):
                 """,
                 (item_id,),
             )
+            self._delete_unused_batches()
             self.__conn.commit()
         except Exception:
             self.__conn.rollback()
@@ -514,6 +841,7 @@ class SqliteSessionQueue(SessionQueueBase):
                 """,
                 (queue_id,),
             )
+            self._delete_unused_batches()
             self.__conn.commit()
         except Exception:
             self.__conn.rollback()
@@ -552,6 +880,7 @@ class SqliteSessionQueue(SessionQueueBase):
                 """,
                 (queue_id,),
             )
+            self._delete_unused_batches()
             self.__conn.commit()
         except Exception:
             self.__conn.rollback()
@@ -560,6 +889,24 @@ class SqliteSessionQueue(SessionQueueBase):
             self.__lock.release()
         return PruneResult(deleted=count)
 
+    def complete_queue_item(self, item_id: int) -> SessionQueueItem:
+        # When a queue item has an error, we get an error event, then a completed event.
+        # Mark the queue item completed only if it isn't already marked completed, e.g.
+        # by a previously-handled error event.
+        queue_item = self.get_queue_item(item_id)
+        if queue_item.status not in ["completed", "failed", "canceled"]:
+            queue_item = self._set_queue_item_status(item_id=queue_item.item_id, status="completed")
+        return queue_item
+
+    def fail_queue_item(self, item_id: int, error: str) -> SessionQueueItem:
+        queue_item = self.get_queue_item(item_id)
+        # Always set to failed if have an error, even if previously the item was marked completed or canceled. The
+        # session processor fails an item as soon as its session completes with errors, so the error event that
+        # follows only needs handling if it hasn't.
+        if queue_item.status != "failed":
+            queue_item = self._set_queue_item_status(item_id=queue_item.item_id, status="failed", error=error)
+        return queue_item
+
     def cancel_queue_item(self, item_id: int, error: Optional[str] = None) -> SessionQueueItem:
         queue_item = self.get_queue_item(item_id)
         if queue_item.status not in ["canceled", "failed", "completed"]:
@@ -574,9 +921,21 @@ class SqliteSessionQueue(SessionQueueBase):
             )
         return queue_item
 
+    def _cancel_sessions(self, item_ids: list[int]) -> None:
+        """Stops the sessions of canceled queue items that were in progress, on whichever workers execute them"""
+        for item_id in item_ids:
+            queue_item = self.get_queue_item(item_id)
+            self.__invoker.services.queue.cancel(queue_item.session_id)
+            self.__invoker.services.events.emit_session_canceled(
+                queue_item_id=queue_item.item_id,
+                queue_id=queue_item.queue_id,
+                queue_batch_id=queue_item.batch_id,
+                graph_execution_state_id=queue_item.session_id,
+            )
+            self._emit_queue_item_status_changed(item_id)
+
     def cancel_by_batch_ids(self, queue_id: str, batch_ids: list[str]) -> CancelByBatchIDsResult:
         try:
-            current_queue_item = self.get_current(queue_id)
             self.__lock.acquire()
             placeholders = ", ".join(["?" for _ in batch_ids])
             where = f"""--sql
@@ -597,6 +956,17 @@ class SqliteSessionQueue(SessionQueueBase):
                 tuple(params),
             )
             count = self.__cursor.fetchone()[0]
+            # Selected under the same lock as the update, so that no item can be dequeued in between
+            self.__cursor.execute(
+                f"""--sql
+                SELECT item_id
+                FROM session_queue
+                {where}
+                  AND status = 'in_progress';
+                """,
+                tuple(params),
+            )
+            in_progress = [row[0] for row in self.__cursor.fetchall()]
             self.__cursor.execute(
                 f"""--sql
                 UPDATE session_queue
@@ -606,31 +976,16 @@ class SqliteSessionQueue(SessionQueueBase):
                 tuple(params),
             )
             self.__conn.commit()
-            if current_queue_item is not None and current_queue_item.batch_id in batch_ids:
-                self.__invoker.services.queue.cancel(current_queue_item.session_id)
-                self.__invoker.services.events.emit_session_canceled(
-                    queue_item_id=current_queue_item.item_id,
-                    queue_id=current_queue_item.queue_id,
-                    queue_batch_id=current_queue_item.batch_id,
-                    graph_execution_state_id=current_queue_item.session_id,
-                )
-                batch_status = self.get_batch_status(queue_id=queue_id, batch_id=current_queue_item.batch_id)
-                queue_status = self.get_queue_status(queue_id=queue_id)
-                self.__invoker.services.events.emit_queue_item_status_changed(
-                    session_queue_item=current_queue_item,
-                    batch_status=batch_status,
-                    queue_status=queue_status,
-                )
         except Exception:
             self.__conn.rollback()
             raise
         finally:
             self.__lock.release()
+        self._cancel_sessions(in_progress)
         return CancelByBatchIDsResult(canceled=count)
 
     def cancel_by_queue_id(self, queue_id: str) -> CancelByQueueIDResult:
         try:
-            current_queue_item = self.get_current(queue_id)
             self.__lock.acquire()
             where = """--sql
                 WHERE
@@ -649,6 +1004,17 @@ class SqliteSessionQueue(SessionQueueBase):
                 tuple(params),
             )
             count = self.__cursor.fetchone()[0]
+            # Selected under the same lock as the update, so that no item can be dequeued in between
+            self.__cursor.execute(
+                f"""--sql
+                SELECT item_id
+                FROM session_queue
+                {where}
+                  AND status = 'in_progress';
+                """,
+                tuple(params),
+            )
+            in_progress = [row[0] for row in self.__cursor.fetchall()]
             self.__cursor.execute(
                 f"""--sql
                 UPDATE session_queue
@@ -658,26 +1024,12 @@ class SqliteSessionQueue(SessionQueueBase):
                 tuple(params),
             )
             self.__conn.commit()
-            if current_queue_item is not None and current_queue_item.queue_id == queue_id:
-                self.__invoker.services.queue.cancel(current_queue_item.session_id)
-                self.__invoker.services.events.emit_session_canceled(
-                    queue_item_id=current_queue_item.item_id,
-                    queue_id=current_queue_item.queue_id,
-                    queue_batch_id=current_queue_item.batch_id,
-                    graph_execution_state_id=current_queue_item.session_id,
-                )
-                batch_status = self.get_batch_status(queue_id=queue_id, batch_id=current_queue_item.batch_id)
-                queue_status = self.get_queue_status(queue_id=queue_id)
-                self.__invoker.services.events.emit_queue_item_status_changed(
-                    session_queue_item=current_queue_item,
-                    batch_status=batch_status,
-                    queue_status=queue_status,
-                )
         except Exception:
             self.__conn.rollback()
             raise
         finally:
             self.__lock.release()
+        self._cancel_sessions(in_progress)
         return CancelByQueueIDResult(canceled=count)
 
     def get_queue_item(self, item_id: int) -> SessionQueueItem:
@@ -699,7 +1051,7 @@ class SqliteSessionQueue(SessionQueueBase):
             self.__lock.release()
         if result is None:
             raise SessionQueueItemNotFoundError(f"No queue item with id {item_id}")
-        return SessionQueueItem.from_dict(dict(result))
+        return self._create_queue_item(dict(result))
 
     def list_queue_items(
         self,
@@ -709,9 +1061,9 @@ class SqliteSessionQueue(SessionQueueBase):
         cursor: Optional[int] = None,
         status: Optional[QUEUE_ITEM_STATUS] = None,
     ) -> CursorPaginatedResults[SessionQueueItemDTO]:
-        try:
-            item_id = cursor
-            self.__lock.acquire()
+        item_id = cursor
+        with self.__db.read() as conn:
+            db_cursor = conn.cursor()
             query = """--sql
                 SELECT item_id,
                     status,
@@ -738,7 +1090,7 @@ class SqliteSessionQueue(SessionQueueBase):
 
             if item_id is not None:
                 query += """--sql
-                    AND (priority < ?) OR (priority = ? AND item_id > ?)
+                    AND ((priority < ?) OR (priority = ? AND item_id > ?))
                     """
                 params.extend([priority, priority, item_id])
 
@@ -749,25 +1101,20 @@ class SqliteSessionQueue(SessionQueueBase):
                 LIMIT ?
                 """
             params.append(limit + 1)
-            self.__cursor.execute(query, params)
-            results = cast(list[sqlite3.Row], self.__cursor.fetchall())
+            db_cursor.execute(query, params)
+            results = cast(list[sqlite3.Row], db_cursor.fetchall())
             items = [SessionQueueItemDTO.from_dict(dict(result)) for result in results]
             has_more = False
             if len(items) > limit:
                 # remove the extra item
                 items.pop()
                 has_more = True
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
         return CursorPaginatedResults(items=items, limit=limit, has_more=has_more)
 
     def get_queue_status(self, queue_id: str) -> SessionQueueStatus:
-        try:
-            self.__lock.acquire()
-            self.__cursor.execute(
+        with self.__db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
                 """--sql
                 SELECT status, count(*)
                 FROM session_queue
@@ -776,14 +1123,10 @@ class SqliteSessionQueue(SessionQueueBase):
                 """,
                 (queue_id,),
             )
-            counts_result = cast(list[sqlite3.Row], self.__cursor.fetchall())
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
+            counts_result = cast(list[sqlite3.Row], cursor.fetchall())
 
-        current_item = self.get_current(queue_id=queue_id)
+        current_items = self._get_current_items(queue_id=queue_id)
+        current_item = current_items[0] if current_items else None
         total = sum(row[1] for row in counts_result)
         counts: dict[str, int] = {row[0]: row[1] for row in counts_result}
         return SessionQueueStatus(
@@ -791,6 +1134,7 @@ class SqliteSessionQueue(SessionQueueBase):
             item_id=current_item.item_id if current_item else None,
             session_id=current_item.session_id if current_item else None,
             batch_id=current_item.batch_id if current_item else None,
+            current_items=current_items,
             pending=counts.get("pending", 0),
             in_progress=counts.get("in_progress", 0),
             completed=counts.get("completed", 0),
@@ -800,9 +1144,9 @@ class SqliteSessionQueue(SessionQueueBase):
         )
 
     def get_batch_status(self, queue_id: str, batch_id: str) -> BatchStatus:
-        try:
-            self.__lock.acquire()
-            self.__cursor.execute(
+        with self.__db.read() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
                 """--sql
                 SELECT status, count(*)
                 FROM session_queue
@@ -813,14 +1157,9 @@ class SqliteSessionQueue(SessionQueueBase):
                 """,
                 (queue_id, batch_id),
             )
-            result = cast(list[sqlite3.Row], self.__cursor.fetchall())
+            result = cast(list[sqlite3.Row], cursor.fetchall())
             total = sum(row[1] for row in result)
             counts: dict[str, int] = {row[0]: row[1] for row in result}
-        except Exception:
-            self.__conn.rollback()
-            raise
-        finally:
-            self.__lock.release()
 
         return BatchStatus(
             batch_id=batch_id,
@@ -5,7 +5,7 @@ import itertools
 from typing import Annotated, Any, Optional, Union, get_args, get_origin, get_type_hints
 
 import networkx as nx
-from pydantic import BaseModel, root_validator, validator
+from pydantic import BaseModel, PrivateAttr, root_validator, validator
 from pydantic.fields import Field
 
 # Importing * is bad karma but needed here for node detection
@@ -254,6 +254,55 @@ InvocationsUnion = Union[BaseInvocation.get_invocations()]  # type: ignore
 InvocationOutputsUnion = Union[BaseInvocationOutput.get_all_subclasses_tuple()]  # type: ignore
 
 
+class EdgeIndex:
+    """A graph's edges, indexed by the node and field at either end of them"""
+
+    def __init__(self, edges: list[Edge]) -> None:
+        self.count = 0
+        self.keys: set[tuple[str, str, str, str]] = set()
+        self.inputs: dict[str, dict[str, list[Edge]]] = dict()
+        self.outputs: dict[str, dict[str, list[Edge]]] = dict()
+        for edge in edges:
+            self.add(edge)
+
+    @staticmethod
+    def _get_key(edge: Edge) -> tuple[str, str, str, str]:
+        return (edge.source.node_id, edge.source.field, edge.destination.node_id, edge.destination.field)
+
+    def __contains__(self, edge: Edge) -> bool:
+        return self._get_key(edge) in self.keys
+
+    def add(self, edge: Edge) -> None:
+        self.count += 1
+        self.keys.add(self._get_key(edge))
+        self.inputs.setdefault(edge.destination.node_id, dict()).setdefault(edge.destination.field, list()).append(edge)
+        self.outputs.setdefault(edge.source.node_id, dict()).setdefault(edge.source.field, list()).append(edge)
+
+    def remove(self, edge: Edge) -> None:
+        key = self._get_key(edge)
+        self.count -= 1
+        self.keys.discard(key)
+        for edges in (
+            self.inputs[edge.destination.node_id][edge.destination.field],
+            self.outputs[edge.source.node_id][edge.source.field],
+        ):
+            edges.pop(next(i for i, e in enumerate(edges) if self._get_key(e) == key))
+
+    def get_inputs(self, node_id: str, field: Optional[str] = None) -> list[Edge]:
+        return self._get_edges(self.inputs, node_id, field)
+
+    def get_outputs(self, node_id: str, field: Optional[str] = None) -> list[Edge]:
+        return self._get_edges(self.outputs, node_id, field)
+
+    def _get_edges(self, index: dict[str, dict[str, list[Edge]]], node_id: str, field: Optional[str]) -> list[Edge]:
+        fields = index.get(node_id)
+        if fields is None:
+            return list()
+        if field is not None:
+            return list(fields.get(field, list()))
+        return [e for edges in fields.values() for e in edges]
+
+
 class Graph(BaseModel):
     id: str = Field(description="The id of this graph", default_factory=uuid_string)
     # TODO: use a list (and never use dict in a BaseModel) because pydantic/fastapi hates me
@@ -265,6 +314,35 @@ class Graph(BaseModel):
         default_factory=list,
     )
 
+    # Changed by every mutation of the nodes or edges, which must go through the graph's methods. The NetworkX graphs
+    # derived from this graph are memoised with the version (and those of its subgraphs) they were derived at.
+    _version: int = PrivateAttr(default=0)
+    _subgraphs: Optional[tuple[int, list["Graph"]]] = PrivateAttr(default=None)
+    _nx_graph: Optional[tuple[Any, nx.DiGraph]] = PrivateAttr(default=None)
+    _nx_graph_flat: Optional[tuple[Any, nx.DiGraph]] = PrivateAttr(default=None)
+    _edge_index: Optional[EdgeIndex] = PrivateAttr(default=None)
+
+    class Config:
+        # A graph given to another model (e.g. a GraphExecutionState or GraphInvocation) is kept rather than copied. A
+        # shallow copy would share the nodes and edges with the original, but not its version, so the copy's memoised
+        # graphs would miss the changes made through the original.
+        copy_on_model_validation = "none"
+
+    def copy(self, *, deep: bool = False, **kwargs: Any) -> "Graph":
+        """
+        Copies the graph. A shallow copy gets its own dict of nodes and list of edges, and any copy derives its
+        memoised graphs itself, rather than sharing them with this graph.
+        """
+        graph = super().copy(deep=deep, **kwargs)
+        if not deep:
+            graph.nodes = dict(graph.nodes)
+            graph.edges = list(graph.edges)
+        graph._subgraphs = None
+        graph._nx_graph = None
+        graph._nx_graph_flat = None
+        graph._edge_index = None
+        return graph
+
     def add_node(self, node: BaseInvocation) -> None:
         """Adds a node to a graph
 
@@ -275,6 +353,7 @@ class Graph(BaseModel):
             raise NodeAlreadyInGraphError()
 
         self.nodes[node.id] = node
+        self._changed(added_node=node)
 
     def _get_graph_and_node(self, node_path: str) -> tuple["Graph", str]:
         """Returns the graph and node id for a node path."""
@@ -311,6 +390,8 @@ class Graph(BaseModel):
                 edge_graph.delete_edge(edge)
 
             del graph.nodes[node_id]
+            graph._changed()
+            self._changed()
 
         except NodeNotFoundError:
             pass  # Ignore, not doesn't exist (should this throw?)
@@ -322,8 +403,16 @@ class Graph(BaseModel):
         """
 
         self._validate_edge(edge)
-        if edge not in self.edges:
+        self._add_edge(edge)
+
+    def _add_edge(self, edge: Edge) -> None:
+        """Adds an edge that was already validated"""
+
+        edge_index = self._get_edge_index()
+        if edge not in edge_index:
             self.edges.append(edge)
+            edge_index.add(edge)
+            self._changed(added_edge=edge)
         else:
             raise InvalidEdgeError()
 
@@ -331,10 +420,19 @@ class Graph(BaseModel):
         """Deletes an edge from a graph"""
 
         try:
+            edge_index = self._get_edge_index()
             self.edges.remove(edge)
+            edge_index.remove(edge)
+            self._changed()
         except KeyError:
             pass
 
+    def _get_edge_index(self) -> EdgeIndex:
+        # Built when first needed (e.g. after the graph is loaded), then kept up to date as edges are added and deleted
+        if self._edge_index is None or self._edge_index.count != len(self.edges):
+            self._edge_index = EdgeIndex(self.edges)
+        return self._edge_index
+
     def validate_self(self) -> None:
         """
         Validates the graph.
@@ -455,10 +553,13 @@ class Graph(BaseModel):
                 f"Edge to node {edge.destination.node_id} field {edge.destination.field} already exists"
             )
 
-        # Validate that no cycles would be created
+        # Validate that no cycles would be created (the graph is acyclic, so only a path back to the source would be)
         g = self.nx_graph_flat()
-        g.add_edge(edge.source.node_id, edge.destination.node_id)
-        if not nx.is_directed_acyclic_graph(g):
+        if edge.source.node_id == edge.destination.node_id or (
+            edge.source.node_id in g
+            and edge.destination.node_id in g
+            and nx.has_path(g, edge.destination.node_id, edge.source.node_id)
+        ):
             raise InvalidEdgeError(
                 f"Edge creates a cycle in the graph: {edge.source.node_id} -> {edge.destination.node_id}"
             )
@@ -534,6 +635,8 @@ class Graph(BaseModel):
 
         # Set the new node in the graph
         graph.nodes[new_node.id] = new_node
+        graph._changed()
+        self._changed()
         if new_node.id != node.id:
             input_edges = self._get_input_edges_and_graphs(node_path)
             output_edges = self._get_output_edges_and_graphs(node_path)
@@ -577,20 +680,18 @@ class Graph(BaseModel):
         # Filter to edges that match the field
         filtered_edges = (e for e in edges if field is None or e[2].destination.field == field)
 
-        # Create full node paths for each edge
-        return [
-            Edge(
-                source=EdgeConnection(
-                    node_id=self._get_node_path(e.source.node_id, prefix=prefix),
-                    field=e.source.field,
-                ),
-                destination=EdgeConnection(
-                    node_id=self._get_node_path(e.destination.node_id, prefix=prefix),
-                    field=e.destination.field,
-                ),
-            )
-            for _, prefix, e in filtered_edges
-        ]
+        # Create full node paths for each edge (edges in this graph already have them)
+        return [e if not prefix else self._get_edge_with_prefix(e, prefix) for _, prefix, e in filtered_edges]
+
+    def _get_edge_with_prefix(self, edge: Edge, prefix: str) -> Edge:
+        return Edge(
+            source=EdgeConnection(
+                node_id=self._get_node_path(edge.source.node_id, prefix=prefix), field=edge.source.field
+            ),
+            destination=EdgeConnection(
+                node_id=self._get_node_path(edge.destination.node_id, prefix=prefix), field=edge.destination.field
+            ),
+        )
 
     def _get_input_edges_and_graphs(
         self, node_path: str, prefix: Optional[str] = None
@@ -599,7 +700,7 @@ class Graph(BaseModel):
         edges = list()
 
         # Return any input edges that appear in this graph
-        edges.extend([(self, prefix, e) for e in self.edges if e.destination.node_id == node_path])
+        edges.extend([(self, prefix, e) for e in self._get_edge_index().get_inputs(node_path)])
 
         node_id = node_path if "." not in node_path else node_path[: node_path.index(".")]
         node = self.nodes[node_id]
@@ -619,20 +720,8 @@ class Graph(BaseModel):
         # Filter to edges that match the field
         filtered_edges = (e for e in edges if e[2].source.field == field)
 
-        # Create full node paths for each edge
-        return [
-            Edge(
-                source=EdgeConnection(
-                    node_id=self._get_node_path(e.source.node_id, prefix=prefix),
-                    field=e.source.field,
-                ),
-                destination=EdgeConnection(
-                    node_id=self._get_node_path(e.destination.node_id, prefix=prefix),
-                    field=e.destination.field,
-                ),
-            )
-            for _, prefix, e in filtered_edges
-        ]
+        # Create full node paths for each edge (edges in this graph already have them)
+        return [e if not prefix else self._get_edge_with_prefix(e, prefix) for _, prefix, e in filtered_edges]
 
     def _get_output_edges_and_graphs(
         self, node_path: str, prefix: Optional[str] = None
@@ -641,7 +730,7 @@ class Graph(BaseModel):
         edges = list()
 
         # Return any input edges that appear in this graph
-        edges.extend([(self, prefix, e) for e in self.edges if e.source.node_id == node_path])
+        edges.extend([(self, prefix, e) for e in self._get_edge_index().get_outputs(node_path)])
 
         node_id = node_path if "." not in node_path else node_path[: node_path.index(".")]
         node = self.nodes[node_id]
@@ -738,13 +827,64 @@ class Graph(BaseModel):
 
         return True
 
+    def _changed(self, added_node: Optional[BaseInvocation] = None, added_edge: Optional[Edge] = None) -> None:
+        """
+        Records a change to the graph's nodes or edges. Memoised graphs are updated in place when a node or edge was
+        added, as that is cheap and is how execution graphs grow, and are otherwise derived again when next needed.
+        """
+        # Adding a subgraph changes the flattened graph too much to update it in place
+        updatable = (added_node is not None and not isinstance(added_node, GraphInvocation)) or added_edge is not None
+        nx_graph = self._nx_graph[1] if self._nx_graph is not None and self._nx_graph[0] == self._version else None
+        nx_graph_flat = (
+            self._nx_graph_flat[1]
+            if self._nx_graph_flat is not None and self._nx_graph_flat[0] == self._get_structure_key()
+            else None
+        )
+        subgraphs = self._subgraphs[1] if self._subgraphs is not None and self._subgraphs[0] == self._version else None
+
+        self._version += 1
+        self._subgraphs = None
+        self._nx_graph = None
+        self._nx_graph_flat = None
+        if not updatable:
+            return
+
+        if added_node is not None:
+            if nx_graph is not None:
+                nx_graph.add_node(added_node.id)
+            if nx_graph_flat is not None and not isinstance(added_node, IterateInvocation):
+                nx_graph_flat.add_node(added_node.id)
+        elif added_edge is not None:
+            for g in (nx_graph, nx_graph_flat):
+                if g is not None:
+                    g.add_edge(added_edge.source.node_id, added_edge.destination.node_id)
+
+        self._subgraphs = (self._version, subgraphs) if subgraphs is not None else None
+        if nx_graph is not None:
+            self._nx_graph = (self._version, nx_graph)
+        if nx_graph_flat is not None:
+            self._nx_graph_flat = (self._get_structure_key(), nx_graph_flat)
+
+    def _get_structure_key(self) -> tuple:
+        """Gets a key that changes whenever this graph or any of its subgraphs change"""
+        if self._subgraphs is None or self._subgraphs[0] != self._version:
+            self._subgraphs = (
+                self._version,
+                [n.graph for n in self.nodes.values() if isinstance(n, GraphInvocation)],
+            )
+        return (self._version, tuple((id(g), g._get_structure_key()) for g in self._subgraphs[1]))
+
     def nx_graph(self) -> nx.DiGraph:
-        """Returns a NetworkX DiGraph representing the layout of this graph"""
-        # TODO: Cache this?
-        g = nx.DiGraph()
-        g.add_nodes_from([n for n in self.nodes.keys()])
-        g.add_edges_from(set([(e.source.node_id, e.destination.node_id) for e in self.edges]))
-        return g
+        """
+        Returns a NetworkX DiGraph representing the layout of this graph. It is memoised, so it is a read-only view,
+        which is up to date until the graph changes.
+        """
+        if self._nx_graph is None or self._nx_graph[0] != self._version:
+            g = nx.DiGraph()
+            g.add_nodes_from([n for n in self.nodes.keys()])
+            g.add_edges_from(set([(e.source.node_id, e.destination.node_id) for e in self.edges]))
+            self._nx_graph = (self._version, g)
+        return self._nx_graph[1].copy(as_view=True)
 
     def nx_graph_with_data(self) -> nx.DiGraph:
         """Returns a NetworkX DiGraph representing the data and layout of this graph"""
@@ -754,8 +894,19 @@ class Graph(BaseModel):
         return g
 
     def nx_graph_flat(self, nx_graph: Optional[nx.DiGraph] = None, prefix: Optional[str] = None) -> nx.DiGraph:
-        """Returns a flattened NetworkX DiGraph, including all subgraphs (but not with iterations expanded)"""
-        g = nx_graph or nx.DiGraph()
+        """
+        Returns a flattened NetworkX DiGraph, including all subgraphs (but not with iterations expanded). It is
+        memoised, so it is a read-only view, which is up to date until the graph changes.
+        """
+        if nx_graph is None and prefix is None:
+            structure_key = self._get_structure_key()
+            if self._nx_graph_flat is None or self._nx_graph_flat[0] != structure_key:
+                self._nx_graph_flat = (structure_key, self._build_nx_graph_flat(nx.DiGraph()))
+            return self._nx_graph_flat[1].copy(as_view=True)
+        return self._build_nx_graph_flat(nx_graph or nx.DiGraph(), prefix)
+
+    def _build_nx_graph_flat(self, g: nx.DiGraph, prefix: Optional[str] = None) -> nx.DiGraph:
+        """Adds this graph's nodes and edges to a flattened graph, with their paths under the prefix"""
 
         # Add all nodes from this graph except graph/iteration nodes
         g.add_nodes_from(
@@ -768,7 +919,7 @@ class Graph(BaseModel):
 
         # Expand graph nodes
         for sgn in (gn for gn in self.nodes.values() if isinstance(gn, GraphInvocation)):
-            g = sgn.graph.nx_graph_flat(g, self._get_node_path(sgn.id, prefix))
+            g = sgn.graph._build_nx_graph_flat(g, self._get_node_path(sgn.id, prefix))
 
         # TODO: figure out if iteration nodes need to be expanded
 
@@ -777,6 +928,148 @@ class Graph(BaseModel):
         return g
 
 
+class GraphExecutionScheduler:
+    """
+    Tracks which nodes of a graph execution state can be prepared and which are ready to execute, so that getting the
+    next node does not search the graphs from scratch. It is built from the state when first needed, then kept up to
+    date as nodes are prepared and completed.
+    """
+
+    def __init__(self, state: "GraphExecutionState") -> None:
+        graph = state.graph
+        g = graph.nx_graph_flat()
+        self.graph_key = graph._get_structure_key()
+
+        # The source graph, in topological order
+        self.source_nodes: list[str] = list(nx.topological_sort(g))
+        self.source_parents: dict[str, list[str]] = {n: [e[0] for e in g.in_edges(n)] for n in self.source_nodes}
+        self.source_iterators: set[str] = {
+            n for n in self.source_nodes if isinstance(graph.get_node(n), IterateInvocation)
+        }
+
+        # The iterate ancestors of each source node, and those that are active for it (not behind a collector)
+        self.iterate_ancestors: dict[str, set[str]] = dict()
+        self.active_iterators: dict[str, set[str]] = dict()
+        for n in self.source_nodes:
+            ancestors: set[str] = set()
+            active: set[str] = set()
+            is_collector = isinstance(graph.get_node(n), CollectInvocation)
+            for p in self.source_parents[n]:
+                parent_iterators = {p} if p in self.source_iterators else set()
+                ancestors |= self.iterate_ancestors[p] | parent_iterators
+                if not is_collector:
+                    active |= self.active_iterators[p] | parent_iterators
+            self.iterate_ancestors[n] = ancestors
+            self.active_iterators[n] = active
+
+        # Source nodes that have not been prepared, in topological order
+        self.unprepared: dict[str, None] = dict.fromkeys(
+            n for n in self.source_nodes if n not in state.source_prepared_mapping
+        )
+
+        # The execution graph: the number of unexecuted parents of each prepared node, the children of each prepared
+        # node, the prepared iterators each prepared node descends from (or is), and the nodes that are ready to execute
+        self.pending: dict[str, int] = dict()
+        self.children: dict[str, set[str]] = dict()
+        self.prepared_iterators: dict[str, frozenset[str]] = dict()
+        self.ready: list[str] = list()
+
+        execution_parents: dict[str, set[str]] = {n: set() for n in state.execution_graph.nodes}
+        for edge in state.execution_graph.edges:
+            execution_parents[edge.destination.node_id].add(edge.source.node_id)
+        for n in nx.topological_sort(state.execution_graph.nx_graph()):
+            self.add_prepared_node(
+                n,
+                execution_parents[n],
+                isinstance(state.execution_graph.nodes[n], IterateInvocation),
+                state.executed,
+                state.executing,
+            )
+
+    def get_preparable_node(self, executed: set[str]) -> Optional[str]:
+        """Gets the first source node in topological order that can be prepared"""
+        return next(
+            (
+                n
+                for n in self.unprepared
+                # exclude iterate nodes whose inputs have not been executed
+                if not (n in self.source_iterators and not all(p in executed for p in self.source_parents[n]))
+                # exclude nodes who have unexecuted iterate ancestors
+                and all(a in executed for a in self.iterate_ancestors[n])
+            ),
+            None,
+        )
+
+    def add_prepared_node(
+        self,
+        node_id: str,
+        parents: set[str],
+        is_iterator: bool,
+        executed: set[str],
+        executing: set[str],
+    ) -> None:
+        """Adds a node of the execution graph, whose parents must already have been added"""
+        self.children[node_id] = set()
+        for p in parents:
+            self.children[p].add(node_id)
+
+        # Share the parent's set where possible, as a collector's descendants descend from every one of its iterations
+        if len(parents) == 1:
+            prepared_iterators = self.prepared_iterators[next(iter(parents))]
+        else:
+            prepared_iterators = frozenset().union(*(self.prepared_iterators[p] for p in parents))
+        if is_iterator:
+            prepared_iterators = prepared_iterators | {node_id}
+        self.prepared_iterators[node_id] = prepared_iterators
+
+        if node_id in executed:
+            return
+        self.pending[node_id] = sum(p not in executed for p in parents)
+        if self.pending[node_id] == 0 and node_id not in executing:
+            self.ready.append(node_id)
+
+    def complete(self, node_id: str) -> None:
+        """Marks a prepared node as executed, readying the children that were waiting only for it"""
+        if self.pending.pop(node_id, None) is None:
+            return
+        for c in self.children[node_id]:
+            self.pending[c] -= 1
+            if self.pending[c] == 0:
+                self.ready.append(c)
+
+    def pop_ready(self, executed: set[str]) -> Optional[str]:
+        """Gets the most recently readied node, which is the deepest, and removes it from the ready nodes"""
+        while len(self.ready) > 0:
+            node_id = self.ready.pop()
+            if node_id not in executed:
+                return node_id
+        return None
+
+
+class GraphExecutionStateDelta(BaseModel):
+    """
+    The changes made to a graph execution state as it executes, which can be applied to an earlier copy of it. Changes
+    to the graph being executed cannot be described by a delta.
+    """
+
+    nodes: dict[str, Annotated[InvocationsUnion, Field(discriminator="type")]] = Field(
+        description="The execution nodes that were prepared, or had their inputs set", default_factory=dict
+    )
+    edges: list[Edge] = Field(description="The execution edges that were added", default_factory=list)
+    prepared_source_mapping: dict[str, str] = Field(
+        description="The map of the prepared nodes to original graph nodes", default_factory=dict
+    )
+    executed: list[str] = Field(description="The node ids that were executed", default_factory=list)
+    executing: set[str] = Field(description="The set of node ids that are now executing", default_factory=set)
+    executed_history: list[str] = Field(
+        description="The node ids that were executed, in order of execution", default_factory=list
+    )
+    results: dict[str, Annotated[InvocationOutputsUnion, Field(discriminator="type")]] = Field(
+        description="The results of the node executions", default_factory=dict
+    )
+    errors: dict[str, str] = Field(description="Errors raised when executing nodes", default_factory=dict)
+
+
 class GraphExecutionState(BaseModel):
     """Tracks the state of a graph execution"""
 
@@ -792,6 +1085,10 @@ class GraphExecutionState(BaseModel):
 
     # Nodes that have been executed
     executed: set[str] = Field(description="The set of node ids that have been executed", default_factory=set)
+    executing: set[str] = Field(
+        description="The set of prepared node ids that are ready and have been handed out, but are not complete",
+        default_factory=set,
+    )
     executed_history: list[str] = Field(
         description="The list of node ids that have been executed, in order of execution",
         default_factory=list,
@@ -817,6 +1114,14 @@ class GraphExecutionState(BaseModel):
         default_factory=dict,
     )
 
+    # Derived from the rest of the state when needed, so it is not serialized
+    _scheduler: Optional[GraphExecutionScheduler] = PrivateAttr(default=None)
+
+    # The changes made since the state was stored, if they are being tracked (see `track_changes()`)
+    _delta: Optional[GraphExecutionStateDelta] = PrivateAttr(default=None)
+    _delta_revision: Optional[int] = PrivateAttr(default=None)
+    _delta_graph_key: Any = PrivateAttr(default=None)
+
     @validator("graph")
     def graph_is_valid(cls, v: Graph):
         """Validates that the graph is valid"""
@@ -824,12 +1129,16 @@ class GraphExecutionState(BaseModel):
         return v
 
     class Config:
+        # Kept rather than copied when given to another model (e.g. a SessionQueueItem), as a shallow copy would share
+        # the graphs and history with the original, but not the memoised scheduler and the tracked changes
+        copy_on_model_validation = "none"
         schema_extra = {
             "required": [
                 "id",
                 "graph",
                 "execution_graph",
                 "executed",
+                "executing",
                 "executed_history",
                 "results",
                 "errors",
@@ -839,26 +1148,30 @@ class GraphExecutionState(BaseModel):
         }
 
     def next(self) -> Optional[BaseInvocation]:
-        """Gets the next node ready to execute."""
-
-        # TODO: enable multiple nodes to execute simultaneously by tracking currently executing nodes
-        #       possibly with a timeout?
+        """
+        Gets the next node ready to execute, and marks it as executing until it is completed or errors. Nodes that
+        are executing are not returned again, so calling this repeatedly gets every node that can execute at the same
+        time.
+        """
 
-        # If there are no prepared nodes, prepare some nodes
-        next_node = self._get_next_node()
-        if next_node is None:
-            prepared_id = self._prepare()
+        # If there are no ready nodes, prepare as many nodes as we can
+        scheduler = self._get_scheduler()
+        next_node_id = scheduler.pop_ready(self.executed)
+        if next_node_id is None:
+            while self._prepare() is not None:
+                pass
+            next_node_id = scheduler.pop_ready(self.executed)
 
-            # Prepare as many nodes as we can
-            while prepared_id is not None:
-                prepared_id = self._prepare()
-                next_node = self._get_next_node()
+        # If next is still none, there's no next node, return None
+        if next_node_id is None:
+            return None
 
         # Get values from edges
-        if next_node is not None:
-            self._prepare_inputs(next_node)
-
-        # If next is still none, there's no next node, return None
+        next_node = self.execution_graph.nodes[next_node_id]
+        self._prepare_inputs(next_node)
+        self.executing.add(next_node_id)
+        if self._delta is not None:
+            self._delta.nodes[next_node_id] = next_node
         return next_node
 
     def complete(self, node_id: str, output: InvocationOutputsUnion):
@@ -868,8 +1181,14 @@ class GraphExecutionState(BaseModel):
             return  # TODO: log error?
 
         # Mark node as executed
+        self.executing.discard(node_id)
+        if self._scheduler is not None and node_id not in self.executed:
+            self._scheduler.complete(node_id)
         self.executed.add(node_id)
         self.results[node_id] = output
+        if self._delta is not None:
+            self._delta.executed.append(node_id)
+            self._delta.results[node_id] = output
 
         # Check if source node is complete (all prepared nodes are complete)
         source_node = self.prepared_source_mapping[node_id]
@@ -878,20 +1197,67 @@ class GraphExecutionState(BaseModel):
         if all([n in self.executed for n in prepared_nodes]):
             self.executed.add(source_node)
             self.executed_history.append(source_node)
+            if self._delta is not None:
+                self._delta.executed.append(source_node)
+                self._delta.executed_history.append(source_node)
 
     def set_node_error(self, node_id: str, error: str):
         """Marks a node as errored"""
+        self.executing.discard(node_id)
         self.errors[node_id] = error
+        if self._delta is not None:
+            self._delta.errors[node_id] = error
 
     def is_complete(self) -> bool:
         """Returns true if the graph is complete"""
-        node_ids = set(self.graph.nx_graph_flat().nodes)
-        return self.has_error() or all((k in self.executed for k in node_ids))
+        return self.has_error() or all((k in self.executed for k in self._get_scheduler().source_nodes))
 
     def has_error(self) -> bool:
         """Returns true if the graph has any errors"""
         return len(self.errors) > 0
 
+    def track_changes(self, revision: int) -> None:
+        """Starts tracking the changes made to this state, which its storage stored as `revision`"""
+        self._delta = GraphExecutionStateDelta()
+        self._delta_revision = revision
+        self._delta_graph_key = self.graph._get_structure_key()
+
+    def take_changes(self) -> tuple[Optional[int], Optional[GraphExecutionStateDelta]]:
+        """
+        Gets the revision the changes were tracked from and the changes made since, and stops tracking them. The
+        changes are None if they were not tracked, or if the graph was changed.
+        """
+        revision, delta = self._delta_revision, self._delta
+        if delta is not None and self._delta_graph_key != self.graph._get_structure_key():
+            delta = None
+        if delta is not None:
+            delta.executing = set(self.executing)
+        self._delta = None
+        self._delta_revision = None
+        self._delta_graph_key = None
+        return revision, delta
+
+    def apply_delta(self, delta: GraphExecutionStateDelta) -> None:
+        """Applies changes that were taken from a later copy of this state"""
+        for node_id, node in delta.nodes.items():
+            if node_id in self.execution_graph.nodes:
+                self.execution_graph.nodes[node_id] = node
+            else:
+                self.execution_graph.add_node(node)
+        # The edges were validated when they were added to the later copy
+        for edge in delta.edges:
+            self.execution_graph._add_edge(edge)
+        for node_id, source_node in delta.prepared_source_mapping.items():
+            self.prepared_source_mapping[node_id] = source_node
+            self.source_prepared_mapping.setdefault(source_node, set()).add(node_id)
+        self.executed.update(delta.executed)
+        self.executing = set(delta.executing)
+        self.executed_history.extend(delta.executed_history)
+        self.results.update(delta.results)
+        self.errors.update(delta.errors)
+        # The scheduler is derived again from the new execution graph when needed
+        self._scheduler = None
+
     def _create_execution_node(self, node_path: str, iteration_node_map: list[tuple[str, str]]) -> list[str]:
         """Prepares an iteration node and connects all edges, returning the new node id"""
 
@@ -899,13 +1265,16 @@ class GraphExecutionState(BaseModel):
 
         self_iteration_count = -1
 
+        # Get the prepared nodes for each source node
+        prepared_nodes: dict[str, list[str]] = dict()
+        for source_node_id, prepared_node_id in iteration_node_map:
+            prepared_nodes.setdefault(source_node_id, list()).append(prepared_node_id)
+
         # If this is an iterator node, we must create a copy for each iteration
         if isinstance(node, IterateInvocation):
             # Get input collection edge (should error if there are no inputs)
             input_collection_edge = next(iter(self.graph._get_input_edges(node_path, "collection")))
-            input_collection_prepared_node_id = next(
-                n[1] for n in iteration_node_map if n[0] == input_collection_edge.source.node_id
-            )
+            input_collection_prepared_node_id = prepared_nodes[input_collection_edge.source.node_id][0]
             input_collection_prepared_node_output = self.results[input_collection_prepared_node_id]
             input_collection = getattr(input_collection_prepared_node_output, input_collection_edge.source.field)
             self_iteration_count = len(input_collection)
@@ -922,7 +1291,7 @@ class GraphExecutionState(BaseModel):
         # For collect nodes, this may contain multiple inputs to the same field
         new_edges = list()
         for edge in input_edges:
-            for input_node_id in (n[1] for n in iteration_node_map if n[0] == edge.source.node_id):
+            for input_node_id in prepared_nodes.get(edge.source.node_id, list()):
                 new_edge = Edge(
                     source=EdgeConnection(node_id=input_node_id, field=edge.source.field),
                     destination=EdgeConnection(node_id="", field=edge.destination.field),
@@ -944,6 +1313,9 @@ class GraphExecutionState(BaseModel):
             # Add to execution graph
             self.execution_graph.add_node(new_node)
             self.prepared_source_mapping[new_node.id] = node_path
+            if self._delta is not None:
+                self._delta.nodes[new_node.id] = new_node
+                self._delta.prepared_source_mapping[new_node.id] = node_path
             if node_path not in self.source_prepared_mapping:
                 self.source_prepared_mapping[node_path] = set()
             self.source_prepared_mapping[node_path].add(new_node.id)
@@ -955,62 +1327,45 @@ class GraphExecutionState(BaseModel):
                     destination=EdgeConnection(node_id=new_node.id, field=edge.destination.field),
                 )
                 self.execution_graph.add_edge(new_edge)
+                if self._delta is not None:
+                    self._delta.edges.append(new_edge)
+
+            if self._scheduler is not None:
+                self._scheduler.add_prepared_node(
+                    new_node.id,
+                    {e.source.node_id for e in new_edges},
+                    isinstance(new_node, IterateInvocation),
+                    self.executed,
+                    self.executing,
+                )
 
             new_nodes.append(new_node.id)
 
         return new_nodes
 
-    def _iterator_graph(self) -> nx.DiGraph:
-        """Gets a DiGraph with edges to collectors removed so an ancestor search produces all active iterators for any node"""
-        g = self.graph.nx_graph_flat()
-        collectors = (n for n in self.graph.nodes if isinstance(self.graph.get_node(n), CollectInvocation))
-        for c in collectors:
-            g.remove_edges_from(list(g.in_edges(c)))
-        return g
+    def _get_scheduler(self) -> GraphExecutionScheduler:
+        # The scheduler is derived again if the graph has changed since
+        if self._scheduler is None or self._scheduler.graph_key != self.graph._get_structure_key():
+            self._scheduler = GraphExecutionScheduler(self)
+        return self._scheduler
 
     def _get_node_iterators(self, node_id: str) -> list[str]:
         """Gets iterators for a node"""
-        g = self._iterator_graph()
-        iterators = [n for n in nx.ancestors(g, node_id) if isinstance(self.graph.get_node(n), IterateInvocation)]
-        return iterators
+        return list(self._get_scheduler().active_iterators[node_id])
 
     def _prepare(self) -> Optional[str]:
-        # Get flattened source graph
-        g = self.graph.nx_graph_flat()
-
         # Find next node that:
         # - was not already prepared
         # - is not an iterate node whose inputs have not been executed
         # - does not have an unexecuted iterate ancestor
-        sorted_nodes = nx.topological_sort(g)
-        next_node_id = next(
-            (
-                n
-                for n in sorted_nodes
-                # exclude nodes that have already been prepared
-                if n not in self.source_prepared_mapping
-                # exclude iterate nodes whose inputs have not been executed
-                and not (
-                    isinstance(self.graph.get_node(n), IterateInvocation)  # `n` is an iterate node...
-                    and not all((e[0] in self.executed for e in g.in_edges(n)))  # ...that has unexecuted inputs
-                )
-                # exclude nodes who have unexecuted iterate ancestors
-                and not any(
-                    (
-                        isinstance(self.graph.get_node(a), IterateInvocation)  # `a` is an iterate ancestor of `n`...
-                        and a not in self.executed  # ...that is not executed
-                        for a in nx.ancestors(g, n)  # for all ancestors `a` of node `n`
-                    )
-                )
-            ),
-            None,
-        )
+        scheduler = self._get_scheduler()
+        next_node_id = scheduler.get_preparable_node(self.executed)
 
         if next_node_id is None:
             return None
 
         # Get all parents of the next node
-        next_node_parents = [e[0] for e in g.in_edges(next_node_id)]
+        next_node_parents = scheduler.source_parents[next_node_id]
 
         # Create execution nodes
         next_node = self.graph.get_node(next_node_id)
@@ -1034,8 +1389,7 @@ class GraphExecutionState(BaseModel):
             # Select the correct prepared parents for each iteration
             # For every iterator, the parent must either not be a child of that iterator, or must match the prepared iteration for that iterator
             # TODO: Handle a node mapping to none
-            eg = self.execution_graph.nx_graph_flat()
-            prepared_parent_mappings = [[(n, self._get_iteration_node(n, g, eg, it)) for n in next_node_parents] for it in iterator_node_prepared_combinations]  # type: ignore
+            prepared_parent_mappings = [[(n, self._get_iteration_node(n, it)) for n in next_node_parents] for it in iterator_node_prepared_combinations]  # type: ignore
 
             # Create execution node for each iteration
             for iteration_mappings in prepared_parent_mappings:
@@ -1043,13 +1397,15 @@ class GraphExecutionState(BaseModel):
                 if create_results is not None:
                     new_node_ids.extend(create_results)
 
+        # Nodes are only prepared once (an iterator over an empty collection prepares nothing)
+        if next_node_id in self.source_prepared_mapping:
+            del scheduler.unprepared[next_node_id]
+
         return next(iter(new_node_ids), None)
 
     def _get_iteration_node(
         self,
         source_node_path: str,
-        graph: nx.DiGraph,
-        execution_graph: nx.DiGraph,
         prepared_iterator_nodes: list[str],
     ) -> Optional[str]:
         """Gets the prepared version of the specified source node that matches every iteration specified"""
@@ -1063,38 +1419,21 @@ class GraphExecutionState(BaseModel):
             return prepared_iterator
 
         # Filter to only iterator nodes that are a parent of the specified node, in tuple format (prepared, source)
+        scheduler = self._get_scheduler()
         iterator_source_node_mapping = [(n, self.prepared_source_mapping[n]) for n in prepared_iterator_nodes]
-        parent_iterators = [itn for itn in iterator_source_node_mapping if nx.has_path(graph, itn[1], source_node_path)]
+        parent_iterators = [
+            itn
+            for itn in iterator_source_node_mapping
+            if itn[1] == source_node_path or itn[1] in scheduler.iterate_ancestors[source_node_path]
+        ]
 
         return next(
-            (n for n in prepared_nodes if all(nx.has_path(execution_graph, pit[0], n) for pit in parent_iterators)),
-            None,
-        )
-
-    def _get_next_node(self) -> Optional[BaseInvocation]:
-        """Gets the deepest node that is ready to be executed"""
-        g = self.execution_graph.nx_graph()
-
-        # Depth-first search with pre-order traversal is a depth-first topological sort
-        sorted_nodes = nx.dfs_preorder_nodes(g)
-
-        next_node = next(
-            (
-                n
-                for n in sorted_nodes
-                if n not in self.executed  # the node must not already be executed...
-                and all((e[0] in self.executed for e in g.in_edges(n)))  # ...and all its inputs must be executed
-            ),
+            (n for n in prepared_nodes if all(pit[0] in scheduler.prepared_iterators[n] for pit in parent_iterators)),
             None,
         )
 
-        if next_node is None:
-            return None
-
-        return self.execution_graph.nodes[next_node]
-
     def _prepare_inputs(self, node: BaseInvocation):
-        input_edges = [e for e in self.execution_graph.edges if e.destination.node_id == node.id]
+        input_edges = self.execution_graph._get_edge_index().get_inputs(node.id)
         if isinstance(node, CollectInvocation):
             output_collection = [
                 getattr(self.results[edge.source.node_id], edge.source.field)
@@ -1,39 +1,280 @@
 import sqlite3
+import sys
 import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
 from logging import Logger
+from pathlib import Path
+from queue import Empty, Queue
+from typing import Any, Callable, Iterator, Optional
+
+from pydantic import BaseModel, Field
 
 from invokeai.app.services.config import InvokeAIAppConfig
 
 sqlite_memory = ":memory:"
 
+# Maximum number of queued writes committed in a single transaction
+MAX_WRITE_BATCH = 64
+
+
+class SqliteLockStats(BaseModel):
+    call_site: str = Field(description="The function that took the lock")
+    acquisitions: int = Field(default=0, description="How many times the lock was taken")
+    wait_time: float = Field(default=0.0, description="Total time spent waiting for the lock (seconds)")
+    max_wait_time: float = Field(default=0.0, description="Longest time spent waiting for the lock (seconds)")
+    hold_time: float = Field(default=0.0, description="Total time the lock was held (seconds)")
+    max_hold_time: float = Field(default=0.0, description="Longest time the lock was held (seconds)")
+
+
+class SqliteDatabaseStatus(BaseModel):
+    lock_stats: list[SqliteLockStats] = Field(description="Contention on the read-write connection, per call site")
+    read_connections: int = Field(description="The number of read-only connections opened")
+    writes: int = Field(description="The number of writes committed through the writer queue")
+    write_batches: int = Field(description="The number of transactions the queued writes were committed in")
+
+
+def get_call_site(depth: int) -> str:
+    """Names the function `depth` frames above the caller, e.g. `session_queue_sqlite.dequeue`"""
+    frame = sys._getframe(depth + 1)
+    module = frame.f_globals.get("__name__", "?").rsplit(".", 1)[-1]
+    return f"{module}.{frame.f_code.co_name}"
+
+
+class InstrumentedLock:
+    """A `threading.Lock` that records how long each call site waits for it and holds it"""
+
+    _lock: threading.Lock
+    _stats_lock: threading.Lock
+    _stats: dict[str, SqliteLockStats]
+    _call_site: str
+    _wait_time: float
+    _acquired_at: float
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = dict()
+        self._call_site = ""
+        self._wait_time = 0.0
+        self._acquired_at = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        return self._acquire(get_call_site(1), blocking, timeout)
+
+    def release(self) -> None:
+        # Read the owner's timings before releasing, as the next owner overwrites them
+        hold_time = time.perf_counter() - self._acquired_at
+        call_site, wait_time = self._call_site, self._wait_time
+        self._lock.release()
+        with self._stats_lock:
+            stats = self._stats.get(call_site, None)
+            if stats is None:
+                stats = self._stats[call_site] = SqliteLockStats(call_site=call_site)
+            stats.acquisitions += 1
+            stats.wait_time += wait_time
+            stats.max_wait_time = max(stats.max_wait_time, wait_time)
+            stats.hold_time += hold_time
+            stats.max_hold_time = max(stats.max_hold_time, hold_time)
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def get_stats(self) -> list[SqliteLockStats]:
+        """Returns a copy of the stats of each call site, the ones that waited longest first"""
+        with self._stats_lock:
+            stats = [s.copy() for s in self._stats.values()]
+        return sorted(stats, key=lambda s: s.wait_time, reverse=True)
+
+    def __enter__(self) -> bool:
+        return self._acquire(get_call_site(1), True, -1)
+
+    def __exit__(self, *args) -> None:
+        self.release()
+
+    def _acquire(self, call_site: str, blocking: bool, timeout: float) -> bool:
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            self._acquired_at = time.perf_counter()
+            self._wait_time = self._acquired_at - start
+            self._call_site = call_site
+        return acquired
+
 
 class SqliteDatabase:
+    """
+    The app's SQLite database.
+
+    `conn` is the single read-write connection, shared by all services and guarded by `lock`. File databases use WAL
+    journaling, which lets readers proceed while a write is in progress, and get a pool of read-only connections:
+    services may run queries that don't need to see their own uncommitted writes on one of those with `read()`,
+    without taking `lock`. In-memory databases cannot be opened more than once, so `read()` falls back to `conn`.
+
+    Writes may also be queued with `write()`. A single writer thread commits queued writes in batches, so many small
+    writes from different threads share one transaction and take `lock` once.
+
+    `lock` records how long each call site waits for and holds it; see `get_status()`.
+    """
+
     conn: sqlite3.Connection
-    lock: threading.Lock
+    lock: InstrumentedLock
     _logger: Logger
     _config: InvokeAIAppConfig
+    _location: str
+    _read_connections: "Queue[sqlite3.Connection]"
+    _read_connections_opened: int
+    _max_read_connections: int
+    _read_lock: threading.Lock
+    _write_queue: "Queue[tuple[Callable[[sqlite3.Cursor], Any], Future]]"
+    _writer_thread: Optional[threading.Thread]
+    _writes: int
+    _write_batches: int
 
     def __init__(self, config: InvokeAIAppConfig, logger: Logger):
         self._logger = logger
         self._config = config
 
         if self._config.use_memory_db:
-            location = sqlite_memory
+            self._location = sqlite_memory
             logger.info("Using in-memory database")
         else:
             db_path = self._config.db_path
             db_path.parent.mkdir(parents=True, exist_ok=True)
-            location = str(db_path)
-            self._logger.info(f"Using database at {location}")
+            self._location = str(db_path)
+            self._logger.info(f"Using database at {self._location}")
+
+        self.conn = self._connect(self._location)
+        self.lock = InstrumentedLock()
+
+        if self._location != sqlite_memory:
+            # WAL is a property of the database file, so this only needs to be done on the read-write connection
+            self.conn.execute("PRAGMA journal_mode = WAL;")
+            # In WAL mode, NORMAL only syncs at checkpoints; a power loss may roll back the last transactions but
+            # cannot corrupt the database
+            self.conn.execute("PRAGMA synchronous = NORMAL;")
+        self.conn.execute("PRAGMA foreign_keys = ON;")
+
+        self._read_connections = Queue()
+        self._read_connections_opened = 0
+        self._max_read_connections = 0 if self._location == sqlite_memory else self._config.db_read_connections
+        self._read_lock = threading.Lock()
 
-        self.conn = sqlite3.connect(location, check_same_thread=False)
-        self.lock = threading.Lock()
-        self.conn.row_factory = sqlite3.Row
+        self._write_queue = Queue()
+        self._writer_thread = None
+        self._writes = 0
+        self._write_batches = 0
+
+    def _connect(self, location: str, read_only: bool = False) -> sqlite3.Connection:
+        if read_only:
+            conn = sqlite3.connect(
+                f"{Path(location).as_uri()}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+                timeout=self._config.db_busy_timeout,
+            )
+        else:
+            conn = sqlite3.connect(location, check_same_thread=False, timeout=self._config.db_busy_timeout)
+        conn.row_factory = sqlite3.Row
 
         if self._config.log_sql:
-            self.conn.set_trace_callback(self._logger.debug)
+            conn.set_trace_callback(self._logger.debug)
 
-        self.conn.execute("PRAGMA foreign_keys = ON;")
+        # Negative cache sizes are in KiB
+        conn.execute(f"PRAGMA cache_size = {-self._config.db_cache_size * 1024};")
+        conn.execute(f"PRAGMA mmap_size = {self._config.db_mmap_size * 2**20};")
+        return conn
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """
+        Provides a connection for read-only queries. It sees all committed writes, but not uncommitted changes made
+        on `conn`. If all read connections are in use, this waits for one to be returned.
+        """
+        conn = self._get_read_connection()
+        if conn is None:
+            with self.lock:
+                yield self.conn
+            return
+        try:
+            yield conn
+        finally:
+            # Don't leave a read transaction open, it would stop WAL checkpoints from completing
+            if conn.in_transaction:
+                conn.rollback()
+            self._read_connections.put(conn)
+
+    def _get_read_connection(self) -> Optional[sqlite3.Connection]:
+        if self._max_read_connections == 0:
+            return None
+        with self._read_lock:
+            if self._read_connections.empty() and self._read_connections_opened < self._max_read_connections:
+                conn = self._connect(self._location, read_only=True)
+                self._read_connections_opened += 1
+                return conn
+        return self._read_connections.get()
+
+    def write(self, statements: Callable[[sqlite3.Cursor], Any]) -> None:
+        """
+        Queues `statements` to be run on the read-write connection by the writer thread, and blocks until they are
+        committed. Queued writes are committed in batches; each runs in its own savepoint, so an error only rolls back
+        that write, and is raised here. Must not be called while holding `lock`.
+        """
+        future: Future = Future()
+        self._write_queue.put((statements, future))
+        with self._read_lock:
+            if self._writer_thread is None:
+                self._writer_thread = threading.Thread(name="sqlite_writer", target=self._process_writes, daemon=True)
+                self._writer_thread.start()
+        future.result()
+
+    def _process_writes(self) -> None:
+        while True:
+            batch = [self._write_queue.get()]
+            while len(batch) < MAX_WRITE_BATCH:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: list[tuple[Callable[[sqlite3.Cursor], Any], Future]]) -> None:
+        errors: list[Optional[Exception]] = []
+        try:
+            self.lock.acquire()
+            cursor = self.conn.cursor()
+            cursor.execute("BEGIN;")
+            for statements, _ in batch:
+                cursor.execute("SAVEPOINT queued_write;")
+                try:
+                    statements(cursor)
+                    errors.append(None)
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO queued_write;")
+                    errors.append(e)
+                cursor.execute("RELEASE queued_write;")
+            self.conn.commit()
+            self._writes += len(batch)
+            self._write_batches += 1
+        except Exception as e:
+            self.conn.rollback()
+            errors = [e] * len(batch)
+        finally:
+            self.lock.release()
+        for (_, future), error in zip(batch, errors):
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def get_status(self) -> SqliteDatabaseStatus:
+        return SqliteDatabaseStatus(
+            lock_stats=self.lock.get_stats(),
+            read_connections=self._read_connections_opened,
+            writes=self._writes,
+            write_batches=self._write_batches,
+        )
 
     def clean(self) -> None:
         try:
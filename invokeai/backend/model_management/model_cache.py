@@ -20,9 +20,11 @@ import gc
 import hashlib
 import math
 import os
-import sys
+import threading
 import time
-from contextlib import suppress
+import weakref
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Dict, Optional, Type, Union, types
@@ -31,6 +33,7 @@ import torch
 
 import invokeai.backend.util.logging as logger
 from invokeai.backend.model_management.memory_snapshot import MemorySnapshot, get_pretty_snapshot_diff
+from invokeai.backend.model_management.model_cache_eviction import EvictionPolicy, LRUEvictionPolicy
 from invokeai.backend.model_management.model_load_optimizations import skip_torch_weight_init
 
 from ..util.devices import choose_torch_device
@@ -77,21 +80,35 @@ class ModelCache(object):
 class _CacheRecord:
     size: int
     model: Any
+    model_type: ModelType
+    # How long the model took to load from disk, in seconds
+    load_time: float
     cache: ModelCache
+    # The handles given out for the model, which own the references to it that callers hold
+    handles: "weakref.WeakSet[ModelLocker]"
     _locks: int
 
-    def __init__(self, cache, model: Any, size: int):
+    def __init__(self, cache, model: Any, size: int, model_type: ModelType, load_time: float = 0.0):
         self.size = size
         self.model = model
+        self.model_type = model_type
+        self.load_time = load_time
         self.cache = cache
+        self.handles = weakref.WeakSet()
         self._locks = 0
 
     def lock(self):
-        self._locks += 1
+        with self.cache._lock:
+            self._locks += 1
+            if self._locks == 1:
+                self.cache._locked_models += 1
 
     def unlock(self):
-        self._locks -= 1
-        assert self._locks >= 0
+        with self.cache._lock:
+            assert self._locks > 0
+            self._locks -= 1
+            if self._locks == 0:
+                self.cache._locked_models -= 1
 
     @property
     def locked(self):
@@ -117,6 +134,7 @@ class ModelCache(object):
         lazy_offloading: bool = True,
         sha_chunksize: int = 16777216,
         logger: types.ModuleType = logger,
+        eviction_policy: Optional[EvictionPolicy] = None,
     ):
         """
         :param max_cache_size: Maximum size of the RAM cache [6.0 GB]
@@ -126,6 +144,7 @@ class ModelCache(object):
         :param lazy_offloading: Keep model in VRAM until another model needs to be loaded
         :param sequential_offload: Conserve VRAM by loading and unloading each stage of the pipeline sequentially
         :param sha_chunksize: Chunksize to use when calculating sha256 model hash
+        :param eviction_policy: Decides which models to unload first to make room for another [least recently used]
         """
         self.model_infos: Dict[str, ModelBase] = dict()
         # allow lazy offloading only when vram cache enabled
@@ -137,12 +156,26 @@ class ModelCache(object):
         self.storage_device: torch.device = storage_device
         self.sha_chunksize = sha_chunksize
         self.logger = logger
+        self._eviction_policy: EvictionPolicy = eviction_policy or LRUEvictionPolicy()
 
         # used for stats collection
         self.stats = None
 
-        self._cached_models = dict()
-        self._cache_stack = list()
+        # The cached models, least recently used first, with their total size and how many there are of each type
+        self._cached_models: OrderedDict[str, _CacheRecord] = OrderedDict()
+        self._cached_size = 0
+        self._cached_type_counts: Counter[ModelType] = Counter()
+        # The keys of the cached models that are not on the storage device, and how many cached models are locked
+        self._loaded_keys: set[str] = set()
+        self._locked_models = 0
+        # The models being loaded, which the threads that need them at the same time wait for, and their total size
+        self._loading: Dict[str, Future] = dict()
+        self._loading_size = 0
+        # Sessions may execute on several threads, which share the cache. Models are loaded without holding the lock.
+        self._lock = threading.RLock()
+        # Held while a model is in use on the execution device, so that nodes executing at the same time take turns
+        # to use (and patch) the models. A node may use several models at once, so it is reentrant.
+        self._execution_device_lock = threading.RLock()
 
     def get_key(
         self,
@@ -170,14 +203,15 @@ class ModelCache(object):
             submodel_type=None,
         )
 
-        if model_info_key not in self.model_infos:
-            self.model_infos[model_info_key] = model_class(
-                model_path,
-                base_model,
-                model_type,
-            )
+        with self._lock:
+            if model_info_key not in self.model_infos:
+                self.model_infos[model_info_key] = model_class(
+                    model_path,
+                    base_model,
+                    model_type,
+                )
 
-        return self.model_infos[model_info_key]
+            return self.model_infos[model_info_key]
 
     # TODO: args
     def get_model(
@@ -207,50 +241,160 @@ class ModelCache(object):
             model_type=model_type,
             submodel_type=submodel,
         )
-        # TODO: lock for no copies on simultaneous calls?
-        cache_entry = self._cached_models.get(key, None)
-        if cache_entry is None:
+        # Only one thread loads each model. Any others that need it at the same time wait for that load, then get the
+        # model from the cache (or load it again, if it was unloaded right away).
+        while True:
+            with self._lock:
+                cache_entry = self._cached_models.get(key, None)
+                if cache_entry is not None:
+                    if self.stats:
+                        self.stats.hits += 1
+                    self._cached_models.move_to_end(key)
+                    self._eviction_policy.on_hit(key)
+                    return self._get_model_locker(key, cache_entry, model_info, submodel, gpu_load)
+
+                loading = self._loading.get(key, None)
+                if loading is None:
+                    loading = self._loading[key] = Future()
+                    self.logger.info(
+                        f"Loading model {model_path}, type"
+                        f" {base_model.value}:{model_type.value}{':'+submodel.value if submodel else ''}"
+                    )
+                    if self.stats:
+                        self.stats.misses += 1
+
+                    self_reported_model_size_before_load = model_info.get_size(submodel)
+                    # Remove old models from the cache to make room for the new model, which is reserved while it loads
+                    self._make_cache_room(self_reported_model_size_before_load)
+                    self._loading_size += self_reported_model_size_before_load
+                    break
+            loading.result()
+
+        try:
+            cache_entry = self._load_model(key, model_info, model_type, submodel, self_reported_model_size_before_load)
+        except Exception as e:
+            with self._lock:
+                del self._loading[key]
+                self._loading_size -= self_reported_model_size_before_load
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            self._loading_size -= self_reported_model_size_before_load
+            self._add_cache_entry(key, cache_entry)
+            model_locker = self._get_model_locker(key, cache_entry, model_info, submodel, gpu_load)
+        loading.set_result(None)
+        return model_locker
+
+    def prefetch_model(
+        self,
+        model_path: Union[str, Path],
+        model_class: Type[ModelBase],
+        base_model: BaseModelType,
+        model_type: ModelType,
+        submodel: Optional[SubModelType] = None,
+    ) -> bool:
+        """
+        Loads a model into the RAM cache ahead of the session that needs it, if it fits in the room that is free.
+        Nothing is unloaded to make room, so that prefetching never displaces a model in use. Returns whether the
+        model was loaded.
+        """
+        if not isinstance(model_path, Path):
+            model_path = Path(model_path)
+
+        model_info = self._get_model_info(
+            model_path=model_path,
+            model_class=model_class,
+            base_model=base_model,
+            model_type=model_type,
+        )
+        key = self.get_key(
+            model_path=model_path,
+            base_model=base_model,
+            model_type=model_type,
+            submodel_type=submodel,
+        )
+        with self._lock:
+            if key in self._cached_models or key in self._loading:
+                return False
+            size = model_info.get_size(submodel)
+            if self._cache_size() + size > self.max_cache_size * GIG:
+                self.logger.debug(
+                    f"Not prefetching model {key}: {(size/GIG):.2f} GB does not fit in the"
+                    f" {(self.max_cache_size - self._cache_size()/GIG):.2f} GB free"
+                )
+                return False
+            loading = self._loading[key] = Future()
+            self._loading_size += size
             self.logger.info(
-                f"Loading model {model_path}, type"
+                f"Prefetching model {model_path}, type"
                 f" {base_model.value}:{model_type.value}{':'+submodel.value if submodel else ''}"
             )
-            if self.stats:
-                self.stats.misses += 1
-
-            self_reported_model_size_before_load = model_info.get_size(submodel)
-            # Remove old models from the cache to make room for the new model.
-            self._make_cache_room(self_reported_model_size_before_load)
 
-            # Load the model from disk and capture a memory snapshot before/after.
-            start_load_time = time.time()
-            snapshot_before = MemorySnapshot.capture()
-            with skip_torch_weight_init():
-                model = model_info.get_model(child_type=submodel, torch_dtype=self.precision)
-            snapshot_after = MemorySnapshot.capture()
-            end_load_time = time.time()
+        try:
+            cache_entry = self._load_model(key, model_info, model_type, submodel, size)
+        except Exception:
+            with self._lock:
+                del self._loading[key]
+                self._loading_size -= size
+            # Threads waiting for the model load it themselves, and get their own error
+            loading.set_result(None)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            self._loading_size -= size
+            self._add_cache_entry(key, cache_entry)
+        loading.set_result(None)
+        return True
+
+    def _load_model(
+        self,
+        key: str,
+        model_info: ModelBase,
+        model_type: ModelType,
+        submodel: Optional[SubModelType],
+        self_reported_model_size_before_load: int,
+    ) -> _CacheRecord:
+        # Load the model from disk and capture a memory snapshot before/after. The snapshots are only logged, so
+        # they don't collect garbage first, which can take seconds on a large heap.
+        start_load_time = time.time()
+        snapshot_before = MemorySnapshot.capture(run_garbage_collector=False)
+        with skip_torch_weight_init():
+            model = model_info.get_model(child_type=submodel, torch_dtype=self.precision)
+        snapshot_after = MemorySnapshot.capture(run_garbage_collector=False)
+        end_load_time = time.time()
+
+        self_reported_model_size_after_load = model_info.get_size(submodel)
 
-            self_reported_model_size_after_load = model_info.get_size(submodel)
+        self.logger.debug(
+            f"Moved model '{key}' from disk to cpu in {(end_load_time-start_load_time):.2f}s.\n"
+            f"Self-reported size before/after load: {(self_reported_model_size_before_load/GIG):.3f}GB /"
+            f" {(self_reported_model_size_after_load/GIG):.3f}GB.\n"
+            f"{get_pretty_snapshot_diff(snapshot_before, snapshot_after)}"
+        )
 
+        if abs(self_reported_model_size_after_load - self_reported_model_size_before_load) > 10 * MB:
             self.logger.debug(
-                f"Moved model '{key}' from disk to cpu in {(end_load_time-start_load_time):.2f}s.\n"
-                f"Self-reported size before/after load: {(self_reported_model_size_before_load/GIG):.3f}GB /"
-                f" {(self_reported_model_size_after_load/GIG):.3f}GB.\n"
-                f"{get_pretty_snapshot_diff(snapshot_before, snapshot_after)}"
+                f"Model '{key}' mis-reported its size before load. Self-reported size before/after load:"
+                f" {(self_reported_model_size_before_load/GIG):.2f}GB /"
+                f" {(self_reported_model_size_after_load/GIG):.2f}GB."
             )
 
-            if abs(self_reported_model_size_after_load - self_reported_model_size_before_load) > 10 * MB:
-                self.logger.debug(
-                    f"Model '{key}' mis-reported its size before load. Self-reported size before/after load:"
-                    f" {(self_reported_model_size_before_load/GIG):.2f}GB /"
-                    f" {(self_reported_model_size_after_load/GIG):.2f}GB."
-                )
-
-            cache_entry = _CacheRecord(self, model, self_reported_model_size_after_load)
-            self._cached_models[key] = cache_entry
-        else:
-            if self.stats:
-                self.stats.hits += 1
+        return _CacheRecord(
+            self, model, self_reported_model_size_after_load, model_type, load_time=end_load_time - start_load_time
+        )
 
+    def _get_model_locker(
+        self,
+        key: str,
+        cache_entry: _CacheRecord,
+        model_info: ModelBase,
+        submodel: Optional[SubModelType],
+        gpu_load: bool,
+    ) -> "ModelCache.ModelLocker":
+        # Called with the lock held
         if self.stats:
             self.stats.cache_size = self.max_cache_size * GIG
             self.stats.high_watermark = max(self.stats.high_watermark, self._cache_size())
@@ -259,10 +403,6 @@ class ModelCache(object):
                 self.stats.loaded_model_sizes.get(key, 0), model_info.get_size(submodel)
             )
 
-        with suppress(Exception):
-            self._cache_stack.remove(key)
-        self._cache_stack.append(key)
-
         return self.ModelLocker(self, key, cache_entry.model, gpu_load, cache_entry.size)
 
     def _move_model_to_device(self, key: str, target_device: torch.device):
@@ -275,9 +415,13 @@ class ModelCache(object):
             return
 
         start_model_to_time = time.time()
-        snapshot_before = MemorySnapshot.capture()
+        snapshot_before = MemorySnapshot.capture(run_garbage_collector=False)
         cache_entry.model.to(target_device)
-        snapshot_after = MemorySnapshot.capture()
+        snapshot_after = MemorySnapshot.capture(run_garbage_collector=False)
+        if cache_entry.loaded:
+            self._loaded_keys.add(key)
+        else:
+            self._loaded_keys.discard(key)
         end_model_to_time = time.time()
         self.logger.debug(
             f"Moved model '{key}' from {source_device} to"
@@ -305,6 +449,11 @@ class ModelCache(object):
                 )
 
     class ModelLocker(object):
+        """
+        A handle to a cached model. Callers reference the model through its handle (or the `ModelInfo` holding it),
+        and the model is not unloaded from the cache while any of its handles are alive.
+        """
+
         def __init__(self, cache, key, model, gpu_load, size_needed):
             """
             :param cache: The model_cache object
@@ -319,51 +468,74 @@ class ModelCache(object):
             self.model = model
             self.size_needed = size_needed
             self.cache_entry = self.cache._cached_models[self.key]
+            self.cache_entry.handles.add(self)
 
         def __enter__(self) -> Any:
+            # Held until the context exits, also for models that are not moved to the device (e.g. ONNX models), as
+            # nodes patch the models they use in place once they have entered their context. Acquired before the
+            # cache's lock, which is never held while waiting for this one
+            if self.gpu_load:
+                self.cache._execution_device_lock.acquire()
+
             if not hasattr(self.model, "to"):
                 return self.model
 
-            # NOTE that the model has to have the to() method in order for this
-            # code to move it into GPU!
-            if self.gpu_load:
-                self.cache_entry.lock()
+            with self.cache._lock:
+                # NOTE that the model has to have the to() method in order for this
+                # code to move it into GPU!
+                if self.gpu_load:
+                    self.cache_entry.lock()
 
-                try:
-                    if self.cache.lazy_offloading:
-                        self.cache._offload_unlocked_models(self.size_needed)
+                    try:
+                        if self.cache.lazy_offloading:
+                            self.cache._offload_unlocked_models(self.size_needed)
 
-                    self.cache._move_model_to_device(self.key, self.cache.execution_device)
+                        self.cache._move_model_to_device(self.key, self.cache.execution_device)
 
-                    self.cache.logger.debug(f"Locking {self.key} in {self.cache.execution_device}")
-                    self.cache._print_cuda_stats()
+                        self.cache.logger.debug(f"Locking {self.key} in {self.cache.execution_device}")
+                        self.cache._print_cuda_stats()
 
-                except Exception:
-                    self.cache_entry.unlock()
-                    raise
+                    except Exception:
+                        self.cache_entry.unlock()
+                        self.cache._execution_device_lock.release()
+                        raise
 
-            # TODO: not fully understand
-            # in the event that the caller wants the model in RAM, we
-            # move it into CPU if it is in GPU and not locked
-            elif self.cache_entry.loaded and not self.cache_entry.locked:
-                self.cache._move_model_to_device(self.key, self.cache.storage_device)
+                # TODO: not fully understand
+                # in the event that the caller wants the model in RAM, we
+                # move it into CPU if it is in GPU and not locked
+                elif self.cache_entry.loaded and not self.cache_entry.locked:
+                    self.cache._move_model_to_device(self.key, self.cache.storage_device)
 
             return self.model
 
         def __exit__(self, type, value, traceback):
-            if not hasattr(self.model, "to"):
-                return
-
-            self.cache_entry.unlock()
-            if not self.cache.lazy_offloading:
-                self.cache._offload_unlocked_models()
-                self.cache._print_cuda_stats()
+            if hasattr(self.model, "to"):
+                with self.cache._lock:
+                    self.cache_entry.unlock()
+                    if not self.cache.lazy_offloading:
+                        self.cache._offload_unlocked_models()
+                        self.cache._print_cuda_stats()
+            if self.gpu_load:
+                self.cache._execution_device_lock.release()
 
     # TODO: should it be called untrack_model?
     def uncache_model(self, cache_id: str):
-        with suppress(ValueError):
-            self._cache_stack.remove(cache_id)
-        self._cached_models.pop(cache_id, None)
+        with self._lock:
+            if cache_id in self._cached_models:
+                self._remove_cache_entry(cache_id)
+
+    def _add_cache_entry(self, key: str, cache_entry: _CacheRecord) -> None:
+        self._cached_models[key] = cache_entry
+        self._cached_size += cache_entry.size
+        self._cached_type_counts[cache_entry.model_type] += 1
+        self._eviction_policy.on_added(key, cache_entry.size, cache_entry.load_time)
+
+    def _remove_cache_entry(self, key: str, evicted: bool = False) -> None:
+        cache_entry = self._cached_models.pop(key)
+        self._cached_size -= cache_entry.size
+        self._cached_type_counts[cache_entry.model_type] -= 1
+        self._loaded_keys.discard(key)
+        self._eviction_policy.on_removed(key, evicted)
 
     def model_hash(
         self,
@@ -388,23 +560,17 @@ class ModelCache(object):
         vram = "%4.2fG" % (torch.cuda.memory_allocated() / GIG)
         ram = "%4.2fG" % self.cache_size()
 
-        cached_models = 0
-        loaded_models = 0
-        locked_models = 0
-        for model_info in self._cached_models.values():
-            cached_models += 1
-            if model_info.loaded:
-                loaded_models += 1
-            if model_info.locked:
-                locked_models += 1
-
+        cached_models = len(self._cached_models)
+        loaded_models = len(self._loaded_keys)
+        locked_models = self._locked_models
+        cached_types = ", ".join(f"{t.value}: {n}" for t, n in self._cached_type_counts.items() if n > 0)
         self.logger.debug(
             f"Current VRAM/RAM usage: {vram}/{ram}; cached_models/loaded_models/locked_models/ ="
-            f" {cached_models}/{loaded_models}/{locked_models}"
+            f" {cached_models}/{loaded_models}/{locked_models} ({cached_types})"
         )
 
     def _cache_size(self) -> int:
-        return sum([m.size for m in self._cached_models.values()])
+        return self._cached_size + self._loading_size
 
     def _make_cache_room(self, model_size):
         # calculate how much memory this model will require
@@ -421,60 +587,39 @@ class ModelCache(object):
 
         self.logger.debug(f"Before unloading: cached_models={len(self._cached_models)}")
 
-        pos = 0
-        while current_size + bytes_needed > maximum_size and pos < len(self._cache_stack):
-            model_key = self._cache_stack[pos]
-            cache_entry = self._cached_models[model_key]
+        # Models are unloaded in the order the eviction policy chooses, least recently used first by default
+        unloaded_keys = list()
+        cache_entry: Optional[_CacheRecord] = None
+        for model_key in self._eviction_policy.eviction_order(self._cached_models.keys()):
+            if current_size + bytes_needed <= maximum_size:
+                break
 
-            refs = sys.getrefcount(cache_entry.model)
-
-            # manualy clear local variable references of just finished function calls
-            # for some reason python don't want to collect it even by gc.collect() immidiately
-            if refs > 2:
-                while True:
-                    cleared = False
-                    for referrer in gc.get_referrers(cache_entry.model):
-                        if type(referrer).__name__ == "frame":
-                            # RuntimeError: cannot clear an executing frame
-                            with suppress(RuntimeError):
-                                referrer.clear()
-                                cleared = True
-                                # break
-
-                    # repeat if referrers changes(due to frame clear), else exit loop
-                    if cleared:
-                        gc.collect()
-                    else:
-                        break
+            cache_entry = self._cached_models[model_key]
 
             device = cache_entry.model.device if hasattr(cache_entry.model, "device") else None
             self.logger.debug(
                 f"Model: {model_key}, locks: {cache_entry._locks}, device: {device}, loaded: {cache_entry.loaded},"
-                f" refs: {refs}"
+                f" handles: {len(cache_entry.handles)}"
             )
 
-            # 2 refs:
-            # 1 from cache_entry
-            # 1 from getrefcount function
-            # 1 from onnx runtime object
-            if not cache_entry.locked and refs <= 3 if "onnx" in model_key else 2:
-                self.logger.debug(
-                    f"Unloading model {model_key} to free {(model_size/GIG):.2f} GB (-{(cache_entry.size/GIG):.2f} GB)"
+            # Models that callers still hold a handle to would not be freed
+            if not cache_entry.locked and len(cache_entry.handles) == 0:
+                self.logger.info(
+                    f"Unloading model {model_key} to free {(model_size/GIG):.2f} GB (-{(cache_entry.size/GIG):.2f} GB),"
+                    f" {self._eviction_policy.describe(model_key)}"
                 )
                 current_size -= cache_entry.size
                 if self.stats:
                     self.stats.cleared += 1
-                del self._cache_stack[pos]
-                del self._cached_models[model_key]
-                del cache_entry
+                unloaded_keys.append(model_key)
 
-            else:
-                pos += 1
+        for model_key in unloaded_keys:
+            self._remove_cache_entry(model_key, evicted=True)
+        # Drop the loop's reference, so that the last model unloaded can be freed
+        del cache_entry
 
-        gc.collect()
-        torch.cuda.empty_cache()
-        if choose_torch_device() == torch.device("mps"):
-            mps.empty_cache()
+        if len(unloaded_keys) > 0:
+            self._free_memory()
 
         self.logger.debug(f"After unloading: cached_models={len(self._cached_models)}")
 
@@ -482,7 +627,9 @@ class ModelCache(object):
         reserved = self.max_vram_cache_size * GIG
         vram_in_use = torch.cuda.memory_allocated()
         self.logger.debug(f"{(vram_in_use/GIG):.2f}GB VRAM used for models; max allowed={(reserved/GIG):.2f}GB")
-        for model_key, cache_entry in sorted(self._cached_models.items(), key=lambda x: x[1].size):
+        loaded_models = sorted(((k, self._cached_models[k]) for k in self._loaded_keys), key=lambda x: x[1].size)
+        offloaded = False
+        for model_key, cache_entry in loaded_models:
             if vram_in_use <= reserved:
                 break
             if not cache_entry.locked and cache_entry.loaded:
@@ -490,7 +637,13 @@ class ModelCache(object):
 
                 vram_in_use = torch.cuda.memory_allocated()
                 self.logger.debug(f"{(vram_in_use/GIG):.2f}GB VRAM used for models; max allowed={(reserved/GIG):.2f}GB")
+                offloaded = True
+
+        if offloaded:
+            self._free_memory()
 
+    def _free_memory(self):
+        """Frees the memory of the models that were unloaded or offloaded, which may be in reference cycles"""
         gc.collect()
         torch.cuda.empty_cache()
         if choose_torch_device() == torch.device("mps"):
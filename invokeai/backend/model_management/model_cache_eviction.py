@@ -0,0 +1,123 @@
+"""
+Policies that decide which models the RAM model cache unloads first, when it needs room for another.
+
+The cache tells its policy when a model is added, used again or removed, and asks it to order the cached models for
+eviction. It calls the policy while holding its lock, and only evicts models that are not in use, so the policy need
+not be thread-safe, and may put any model first.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Literal, Type
+
+GIG = 2**30
+
+EvictionPolicyName = Literal["lru", "greedy_dual"]
+
+
+class EvictionPolicy(ABC):
+    """Orders the models of a model cache for eviction"""
+
+    @abstractmethod
+    def on_added(self, key: str, size: int, load_time: float) -> None:
+        """Called when a model of `size` bytes, which took `load_time` seconds to load, is added to the cache"""
+        pass
+
+    @abstractmethod
+    def on_hit(self, key: str) -> None:
+        """Called when a cached model is used again"""
+        pass
+
+    @abstractmethod
+    def on_removed(self, key: str, evicted: bool) -> None:
+        """Called when a model is removed from the cache, because the policy chose it (`evicted`) or otherwise"""
+        pass
+
+    @abstractmethod
+    def eviction_order(self, keys: Iterable[str]) -> Iterable[str]:
+        """Orders the keys of the cached models, given least recently used first, by which to evict first"""
+        pass
+
+    @abstractmethod
+    def describe(self, key: str) -> str:
+        """Describes why a model is where it is in the eviction order, to log the policy's decisions"""
+        pass
+
+
+class LRUEvictionPolicy(EvictionPolicy):
+    """Evicts the least recently used model first, whatever it would cost to load it again"""
+
+    def on_added(self, key: str, size: int, load_time: float) -> None:
+        pass
+
+    def on_hit(self, key: str) -> None:
+        pass
+
+    def on_removed(self, key: str, evicted: bool) -> None:
+        pass
+
+    def eviction_order(self, keys: Iterable[str]) -> Iterable[str]:
+        return keys
+
+    def describe(self, key: str) -> str:
+        return "least recently used"
+
+
+class GreedyDualEvictionPolicy(EvictionPolicy):
+    """
+    Evicts the model that is cheapest to keep out of the cache first, in the style of GreedyDual-Size-Frequency.
+
+    Each model's priority is `L + uses * load_time / size`: the time it would take to load the model again, per GB of
+    cache it takes up, for every time it was used while cached. A large model that loads quickly is evicted before a
+    small one that loads slowly, and a model used often before one used once.
+
+    `L` starts at 0, and becomes the priority of each model evicted. Models that are used again get a priority above
+    it, so a model that was costly but is no longer used ages out once cheaper models have been evicted in its place.
+    Models of equal priority are evicted least recently used first.
+    """
+
+    def __init__(self) -> None:
+        self._inflation = 0.0
+        self._cost: Dict[str, float] = dict()
+        self._uses: Dict[str, int] = dict()
+        self._priority: Dict[str, float] = dict()
+
+    def on_added(self, key: str, size: int, load_time: float) -> None:
+        self._cost[key] = load_time / max(size / GIG, 1e-6)
+        self._uses[key] = 1
+        self._priority[key] = self._inflation + self._cost[key]
+
+    def on_hit(self, key: str) -> None:
+        if key not in self._cost:
+            return
+        self._uses[key] += 1
+        self._priority[key] = self._inflation + self._uses[key] * self._cost[key]
+
+    def on_removed(self, key: str, evicted: bool) -> None:
+        priority = self._priority.pop(key, None)
+        self._cost.pop(key, None)
+        self._uses.pop(key, None)
+        if evicted and priority is not None:
+            self._inflation = max(self._inflation, priority)
+
+    def eviction_order(self, keys: Iterable[str]) -> Iterable[str]:
+        # sorted() is stable, so ties are broken least recently used first
+        return sorted(keys, key=lambda k: self._priority.get(k, self._inflation))
+
+    def describe(self, key: str) -> str:
+        return (
+            f"priority {self._priority.get(key, self._inflation):.3f} (inflation {self._inflation:.3f}):"
+            f" used {self._uses.get(key, 0)} time(s), {self._cost.get(key, 0.0):.3f}s to load per GB"
+        )
+
+
+EVICTION_POLICIES: Dict[str, Type[EvictionPolicy]] = {
+    "lru": LRUEvictionPolicy,
+    "greedy_dual": GreedyDualEvictionPolicy,
+}
+
+
+def create_eviction_policy(name: EvictionPolicyName) -> EvictionPolicy:
+    """Creates the eviction policy named in the app config"""
+    if name not in EVICTION_POLICIES:
+        raise ValueError(f"Unknown model cache eviction policy: {name}")
+    return EVICTION_POLICIES[name]()
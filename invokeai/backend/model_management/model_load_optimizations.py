@@ -1,7 +1,14 @@
+import threading
 from contextlib import contextmanager
 
 import torch
 
+# Models may be loaded on several threads at once. The layers are patched while any of them is in the context manager,
+# and restored when the last one leaves.
+_patch_lock = threading.Lock()
+_patch_count = 0
+_saved_functions: list = []
+
 
 def _no_op(*args, **kwargs):
     pass
@@ -17,14 +24,21 @@ def skip_torch_weight_init():
     completely unnecessary if the intent is to load checkpoint weights from disk for the layer. This context manager
     monkey-patches common torch layers to skip the weight initialization step.
     """
+    global _patch_count, _saved_functions
     torch_modules = [torch.nn.Linear, torch.nn.modules.conv._ConvNd]
-    saved_functions = [m.reset_parameters for m in torch_modules]
 
-    try:
-        for torch_module in torch_modules:
-            torch_module.reset_parameters = _no_op
+    with _patch_lock:
+        if _patch_count == 0:
+            _saved_functions = [m.reset_parameters for m in torch_modules]
+            for torch_module in torch_modules:
+                torch_module.reset_parameters = _no_op
+        _patch_count += 1
 
+    try:
         yield None
     finally:
-        for torch_module, saved_function in zip(torch_modules, saved_functions):
-            torch_module.reset_parameters = saved_function
+        with _patch_lock:
+            _patch_count -= 1
+            if _patch_count == 0:
+                for torch_module, saved_function in zip(torch_modules, _saved_functions):
+                    torch_module.reset_parameters = saved_function
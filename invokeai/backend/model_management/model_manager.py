@@ -249,6 +249,7 @@ from invokeai.app.services.config import InvokeAIAppConfig
 from invokeai.backend.util import CUDA_DEVICE, Chdir
 
 from .model_cache import ModelCache, ModelLocker
+from .model_cache_eviction import create_eviction_policy
 from .model_search import ModelSearch
 from .models import (
     MODEL_CLASSES,
@@ -349,6 +350,7 @@ class ModelManager(object):
             precision=precision,
             sequential_offload=sequential_offload,
             logger=logger,
+            eviction_policy=create_eviction_policy(self.app_config.model_cache_eviction),
         )
 
         self._read_models(config)
@@ -516,6 +518,58 @@ class ModelManager(object):
             _cache=self.cache,
         )
 
+    def prefetch_model(
+        self,
+        model_name: str,
+        base_model: BaseModelType,
+        model_type: ModelType,
+        submodel_type: Optional[SubModelType] = None,
+    ) -> bool:
+        """Load a model into the RAM cache ahead of time, if it fits in
+        the cache's free room. Models that are not found, or that need
+        converting first, are left to be loaded when they are needed.
+        :return: True if the model was loaded
+        """
+        model_key = self.create_key(model_name, base_model, model_type)
+        if not self.model_exists(model_name, base_model, model_type):
+            return False
+
+        model_config = self._get_model_config(base_model, model_name, model_type)
+        model_path, is_submodel_override = self._get_model_path(model_config, submodel_type)
+
+        if is_submodel_override:
+            model_type = submodel_type
+            submodel_type = None
+
+        model_class = self._get_implementation(base_model, model_type)
+        if not model_path.exists():
+            return False
+
+        # A checkpoint is converted on first use, which must not happen on two threads at once
+        dst_convert_path = self._get_model_cache_path(model_path)
+        if model_class.detect_format(str(model_path)) == "checkpoint" and not dst_convert_path.exists():
+            return False
+
+        model_path = model_class.convert_if_required(
+            base_model=base_model,
+            model_path=str(model_path),
+            output_path=dst_convert_path,
+            config=model_config,
+        )
+
+        loaded = self.cache.prefetch_model(
+            model_path=model_path,
+            model_class=model_class,
+            base_model=base_model,
+            model_type=model_type,
+            submodel=submodel_type,
+        )
+        if loaded:
+            self.cache_keys.setdefault(model_key, set()).add(
+                self.cache.get_key(model_path, base_model, model_type, submodel_type)
+            )
+        return loaded
+
     def _get_model_path(
         self, model_config: ModelConfigBase, submodel_type: Optional[SubModelType] = None
     ) -> (Path, bool):
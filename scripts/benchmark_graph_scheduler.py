@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+"""
+Compare the time `GraphExecutionState` spends scheduling nodes with its incremental scheduler against the previous
+implementation, which searched the graphs from scratch for every node.
+
+The graphs iterate over a range in several stages, each doing some math on every item and collecting the results, so
+the number of prepared nodes grows with the size of the range. Nodes are cheap and run for real, so the time measured is
+almost all scheduling.
+"""
+
+import argparse
+import itertools
+import time
+from typing import Optional
+
+import networkx as nx
+
+from invokeai.app.invocations.baseinvocation import BaseInvocation
+from invokeai.app.invocations.collections import RangeInvocation
+from invokeai.app.invocations.math import AddInvocation, MultiplyInvocation
+from invokeai.app.services.shared.graph import (
+    CollectInvocation,
+    Edge,
+    EdgeConnection,
+    Graph,
+    GraphExecutionState,
+    IterateInvocation,
+)
+
+
+class RebuildingGraphExecutionState(GraphExecutionState):
+    """The previous implementation, which rebuilds the graphs it searches every time it gets the next node"""
+
+    def next(self) -> Optional[BaseInvocation]:
+        # If there are no prepared nodes, prepare some nodes
+        next_node = self._get_next_node()
+        if next_node is None:
+            prepared_id = self._prepare()
+
+            # Prepare as many nodes as we can
+            while prepared_id is not None:
+                prepared_id = self._prepare()
+                next_node = self._get_next_node()
+
+        # Get values from edges
+        if next_node is not None:
+            self._prepare_inputs(next_node)
+            self.executing.add(next_node.id)
+
+        # If next is still none, there's no next node, return None
+        return next_node
+
+    def is_complete(self) -> bool:
+        node_ids = set(self.graph.nx_graph_flat().nodes)
+        return self.has_error() or all((k in self.executed for k in node_ids))
+
+    def _iterator_graph(self) -> nx.DiGraph:
+        g = self.graph.nx_graph_flat().copy()
+        collectors = (n for n in self.graph.nodes if isinstance(self.graph.get_node(n), CollectInvocation))
+        for c in collectors:
+            g.remove_edges_from(list(g.in_edges(c)))
+        return g
+
+    def _get_node_iterators(self, node_id: str) -> list[str]:
+        g = self._iterator_graph()
+        return [n for n in nx.ancestors(g, node_id) if isinstance(self.graph.get_node(n), IterateInvocation)]
+
+    def _prepare(self) -> Optional[str]:
+        g = self.graph.nx_graph_flat()
+        sorted_nodes = nx.topological_sort(g)
+        next_node_id = next(
+            (
+                n
+                for n in sorted_nodes
+                if n not in self.source_prepared_mapping
+                and not (
+                    isinstance(self.graph.get_node(n), IterateInvocation)
+                    and not all((e[0] in self.executed for e in g.in_edges(n)))
+                )
+                and not any(
+                    (
+                        isinstance(self.graph.get_node(a), IterateInvocation) and a not in self.executed
+                        for a in nx.ancestors(g, n)
+                    )
+                )
+            ),
+            None,
+        )
+
+        if next_node_id is None:
+            return None
+
+        next_node_parents = [e[0] for e in g.in_edges(next_node_id)]
+        next_node = self.graph.get_node(next_node_id)
+        new_node_ids = list()
+        if isinstance(next_node, CollectInvocation):
+            all_iteration_mappings = list(
+                itertools.chain(*(((s, p) for p in self.source_prepared_mapping[s]) for s in next_node_parents))
+            )
+            new_node_ids.extend(self._create_execution_node(next_node_id, all_iteration_mappings))
+        else:
+            iterator_nodes = self._get_node_iterators(next_node_id)
+            iterator_nodes_prepared = [list(self.source_prepared_mapping[n]) for n in iterator_nodes]
+            iterator_node_prepared_combinations = list(itertools.product(*iterator_nodes_prepared))
+            eg = self.execution_graph.nx_graph_flat()
+            prepared_parent_mappings = [
+                [(n, self._get_rebuilt_iteration_node(n, g, eg, it)) for n in next_node_parents]
+                for it in iterator_node_prepared_combinations
+            ]
+            for iteration_mappings in prepared_parent_mappings:
+                new_node_ids.extend(self._create_execution_node(next_node_id, iteration_mappings))  # type: ignore
+
+        return next(iter(new_node_ids), None)
+
+    def _get_rebuilt_iteration_node(
+        self,
+        source_node_path: str,
+        graph: nx.DiGraph,
+        execution_graph: nx.DiGraph,
+        prepared_iterator_nodes: list[str],
+    ) -> Optional[str]:
+        prepared_nodes = self.source_prepared_mapping[source_node_path]
+        if len(prepared_nodes) == 1:
+            return next(iter(prepared_nodes))
+
+        prepared_iterator = next((n for n in prepared_nodes if n in prepared_iterator_nodes), None)
+        if prepared_iterator is not None:
+            return prepared_iterator
+
+        iterator_source_node_mapping = [(n, self.prepared_source_mapping[n]) for n in prepared_iterator_nodes]
+        parent_iterators = [itn for itn in iterator_source_node_mapping if nx.has_path(graph, itn[1], source_node_path)]
+
+        return next(
+            (n for n in prepared_nodes if all(nx.has_path(execution_graph, pit[0], n) for pit in parent_iterators)),
+            None,
+        )
+
+    def _get_next_node(self) -> Optional[BaseInvocation]:
+        g = self.execution_graph.nx_graph()
+        sorted_nodes = nx.dfs_preorder_nodes(g)
+        next_node = next(
+            (
+                n
+                for n in sorted_nodes
+                if n not in self.executed
+                and n not in self.executing
+                and all((e[0] in self.executed for e in g.in_edges(n)))
+            ),
+            None,
+        )
+        if next_node is None:
+            return None
+        return self.execution_graph.nodes[next_node]
+
+
+def create_edge(source: str, source_field: str, destination: str, destination_field: str) -> Edge:
+    return Edge(
+        source=EdgeConnection(node_id=source, field=source_field),
+        destination=EdgeConnection(node_id=destination, field=destination_field),
+    )
+
+
+def create_iterate_collect_graph(iterations: int, stages: int) -> Graph:
+    """Iterates over a range in each stage, multiplying and offsetting each item, then collects the results"""
+    graph = Graph()
+    graph.add_node(RangeInvocation(id="range", start=0, stop=iterations, step=1))
+    for stage in range(stages):
+        graph.add_node(IterateInvocation(id=f"iterate_{stage}"))
+        graph.add_node(MultiplyInvocation(id=f"multiply_{stage}", b=2))
+        graph.add_node(AddInvocation(id=f"add_{stage}", b=1))
+        graph.add_node(CollectInvocation(id=f"collect_{stage}"))
+        graph.add_edge(create_edge("range", "collection", f"iterate_{stage}", "collection"))
+        graph.add_edge(create_edge(f"iterate_{stage}", "item", f"multiply_{stage}", "a"))
+        graph.add_edge(create_edge(f"multiply_{stage}", "value", f"add_{stage}", "a"))
+        graph.add_edge(create_edge(f"add_{stage}", "value", f"collect_{stage}", "item"))
+    return graph
+
+
+def execute(state: GraphExecutionState) -> float:
+    start = time.perf_counter()
+    while (node := state.next()) is not None:
+        state.complete(node.id, node.invoke(None))  # type: ignore - the math nodes don't use the context
+    assert state.is_complete()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Graph scheduler benchmark")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[10, 50, 100, 200], help="Sizes of range to test")
+    parser.add_argument("--stages", type=int, default=2, help="Number of iterate/collect stages in the graph")
+    args = parser.parse_args()
+
+    print(f"{'iterations':>10} {'nodes':>6} {'rebuilding (s)':>14} {'incremental (s)':>15} {'speedup':>8}")
+    for iterations in args.iterations:
+        graph = create_iterate_collect_graph(iterations, args.stages)
+        rebuilding = execute(RebuildingGraphExecutionState(graph=graph))
+        incremental_state = GraphExecutionState(graph=graph)
+        incremental = execute(incremental_state)
+        nodes = len(incremental_state.execution_graph.nodes)
+        print(f"{iterations:>10} {nodes:>6} {rebuilding:>14.3f} {incremental:>15.3f} {rebuilding / incremental:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""
+Compare save/load latency and peak RSS of the latents storage backends.
+
+Each backend runs in its own process so that peak RSS is not polluted by the other one.
+"""
+
+import argparse
+import multiprocessing
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import torch
+
+from invokeai.app.services.latents_storage.latents_storage_disk import DiskLatentsStorage
+from invokeai.app.services.latents_storage.latents_storage_mmap import MmapLatentsStorage
+
+BACKENDS = {"torch": DiskLatentsStorage, "mmap": MmapLatentsStorage}
+
+
+def run_backend(backend: str, shape: list[int], count: int, touch: bool, results: multiprocessing.Queue) -> None:
+    latents = [torch.randn(shape, dtype=torch.float16) for _ in range(count)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        storage = BACKENDS[backend](tmpdir)
+        save_times = []
+        for i, tensor in enumerate(latents):
+            start = time.perf_counter()
+            storage.save(f"latents_{i}", tensor)
+            save_times.append(time.perf_counter() - start)
+        del latents
+
+        load_times = []
+        loaded = []
+        for i in range(count):
+            start = time.perf_counter()
+            tensor = storage.get(f"latents_{i}")
+            if touch:
+                # Force every page in, as a consumer doing real work would
+                tensor.sum()
+            load_times.append(time.perf_counter() - start)
+            loaded.append(tensor)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss_mb = max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+    results.put((backend, statistics.median(save_times), statistics.median(load_times), max_rss_mb))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latents storage benchmark")
+    parser.add_argument("--shape", type=int, nargs="+", default=[1, 4, 128, 128], help="Shape of each latents tensor")
+    parser.add_argument("--count", type=int, default=50, help="Number of tensors to save and load")
+    parser.add_argument("--touch", action="store_true", help="Read every element of each loaded tensor")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    print(f"{args.count} tensors of shape {args.shape} (float16), touch={args.touch}")
+    print(f"{'backend':<8} {'save (ms)':>10} {'load (ms)':>10} {'peak RSS (MB)':>14}")
+    for backend in BACKENDS:
+        process = ctx.Process(target=run_backend, args=(backend, args.shape, args.count, args.touch, results))
+        process.start()
+        name, save_time, load_time, max_rss_mb = results.get()
+        process.join()
+        print(f"{name:<8} {save_time * 1000:>10.3f} {load_time * 1000:>10.3f} {max_rss_mb:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+Measure how long `ModelCache.get_model` takes to return a model that is already cached, with different numbers of
+models in the cache.
+
+The models are placeholders, which are "loaded" instantly, so the time measured is the cache's own bookkeeping. Models
+are fetched in a random order, as the nodes of a session would fetch their LoRAs, embeddings and submodels.
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import torch
+
+from invokeai.backend.model_management.model_cache import ModelCache
+from invokeai.backend.model_management.models import BaseModelType, ModelType, SubModelType
+
+
+class PlaceholderModel:
+    pass
+
+
+class PlaceholderModelInfo:
+    """Stands in for a `ModelBase`, loading a placeholder model of a fixed size"""
+
+    def __init__(self, model_path: str, base_model: BaseModelType, model_type: ModelType):
+        self.model_path = model_path
+
+    def get_size(self, child_type: Optional[SubModelType] = None) -> int:
+        return 2**20
+
+    def get_model(self, torch_dtype: Optional[torch.dtype], child_type: Optional[SubModelType] = None) -> Any:
+        return PlaceholderModel()
+
+
+def measure_hits(model_paths: list[Path], hits: int) -> float:
+    """Fills a cache with the models, then returns the mean time to get one of them (seconds)"""
+    cache = ModelCache(
+        max_cache_size=1000.0,
+        execution_device=torch.device("cpu"),
+        lazy_offloading=False,
+        logger=logging.getLogger("benchmark"),  # type: ignore - only used to log, which this skips
+    )
+    for path in model_paths:
+        cache.get_model(path, PlaceholderModelInfo, BaseModelType.StableDiffusion1, ModelType.Lora)  # type: ignore
+
+    order = [random.choice(model_paths) for _ in range(hits)]
+    start = time.perf_counter()
+    for path in order:
+        cache.get_model(path, PlaceholderModelInfo, BaseModelType.StableDiffusion1, ModelType.Lora)  # type: ignore
+    return (time.perf_counter() - start) / hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model cache hit latency benchmark")
+    parser.add_argument("--models", type=int, nargs="+", default=[10, 100, 1000], help="Numbers of cached models")
+    parser.add_argument("--hits", type=int, default=10000, help="Number of cache hits to measure")
+    args = parser.parse_args()
+
+    print(f"{'models':>6} {'hit latency (us)':>16}")
+    with tempfile.TemporaryDirectory() as directory:
+        for models in args.models:
+            model_paths = [Path(directory) / f"model_{i}" for i in range(models)]
+            for path in model_paths:
+                path.touch()
+            print(f"{models:>6} {measure_hits(model_paths, args.hits) * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""
+Compare the time the model cache spends loading models from disk with each of its eviction policies.
+
+Sessions use one of a few SDXL main models (the more popular ones more often), a few LoRAs and sometimes a ControlNet,
+as generations in the app would. The cache does not have room for every model, so models are evicted and loaded again.
+The models are placeholders with the sizes of the real ones. They take a fraction of the real models' load time to
+"load", which the cache measures as it would the real ones', and the load time reported is what the real models would
+take.
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import torch
+
+from invokeai.backend.model_management.model_cache import GIG, CacheStats, ModelCache
+from invokeai.backend.model_management.model_cache_eviction import EVICTION_POLICIES
+from invokeai.backend.model_management.models import BaseModelType, ModelType, SubModelType
+
+# The size (GB) and time to load (seconds) of each type of model, roughly as measured for SDXL
+SUBMODELS = {
+    SubModelType.UNet: (4.8, 20.0),
+    SubModelType.TextEncoder: (0.23, 1.5),
+    SubModelType.TextEncoder2: (1.3, 5.0),
+    SubModelType.Vae: (0.16, 0.5),
+}
+LORA = (0.15, 0.1)
+CONTROLNET = (2.3, 3.0)
+
+# The load time of the placeholder models, as a fraction of the real models'
+TIME_SCALE = 0.001
+
+
+class PlaceholderModel:
+    pass
+
+
+class PlaceholderModelInfo:
+    """Stands in for a `ModelBase`, taking as long to load as the real model would (scaled down)"""
+
+    # The time the real models would have taken to load
+    load_time = 0.0
+
+    def __init__(self, model_path: str, base_model: BaseModelType, model_type: ModelType):
+        self.model_path = Path(model_path)
+
+    def _get_cost(self, child_type: Optional[SubModelType]) -> tuple[float, float]:
+        if child_type is not None:
+            return SUBMODELS[child_type]
+        return LORA if self.model_path.name.startswith("lora") else CONTROLNET
+
+    def get_size(self, child_type: Optional[SubModelType] = None) -> int:
+        return int(self._get_cost(child_type)[0] * GIG)
+
+    def get_model(self, torch_dtype: Optional[torch.dtype], child_type: Optional[SubModelType] = None) -> Any:
+        load_time = self._get_cost(child_type)[1]
+        PlaceholderModelInfo.load_time += load_time
+        time.sleep(load_time * TIME_SCALE)
+        return PlaceholderModel()
+
+
+def create_sessions(
+    directory: Path, sessions: int, main_models: int, loras: int, controlnets: int
+) -> list[list[tuple[Path, ModelType, Optional[SubModelType]]]]:
+    """Creates the models each session uses, in the order it uses them"""
+    mains = [directory / f"main_{i}" for i in range(main_models)]
+    lora_paths = [directory / f"lora_{i}" for i in range(loras)]
+    controlnet_paths = [directory / f"controlnet_{i}" for i in range(controlnets)]
+    for path in mains + lora_paths + controlnet_paths:
+        path.touch()
+
+    # Popular models are used more often: the n-th most popular in proportion to 1/n
+    main_weights = [1 / (i + 1) for i in range(main_models)]
+    lora_weights = [1 / (i + 1) for i in range(loras)]
+    result = []
+    for _ in range(sessions):
+        main = random.choices(mains, main_weights)[0]
+        session: list[tuple[Path, ModelType, Optional[SubModelType]]] = [
+            (main, ModelType.Main, SubModelType.TextEncoder),
+            (main, ModelType.Main, SubModelType.TextEncoder2),
+        ]
+        for lora in set(random.choices(lora_paths, lora_weights, k=random.randint(0, 3))):
+            session.append((lora, ModelType.Lora, None))
+        if random.random() < 0.3:
+            session.append((random.choice(controlnet_paths), ModelType.ControlNet, None))
+        session.append((main, ModelType.Main, SubModelType.UNet))
+        session.append((main, ModelType.Main, SubModelType.Vae))
+        result.append(session)
+    return result
+
+
+def run(
+    sessions: list[list[tuple[Path, ModelType, Optional[SubModelType]]]], policy: str, cache_size: float
+) -> tuple[float, int]:
+    """Runs the sessions with a cache using the eviction policy, returning the load time (seconds) and misses"""
+    cache = ModelCache(
+        max_cache_size=cache_size,
+        execution_device=torch.device("cpu"),
+        lazy_offloading=False,
+        logger=logging.getLogger("benchmark"),  # type: ignore - only used to log, which this skips
+        eviction_policy=EVICTION_POLICIES[policy](),
+    )
+    cache.stats = CacheStats()
+    PlaceholderModelInfo.load_time = 0.0
+    for session in sessions:
+        for path, model_type, submodel in session:
+            cache.get_model(
+                path, PlaceholderModelInfo, BaseModelType.StableDiffusionXL, model_type, submodel  # type: ignore
+            )
+    return PlaceholderModelInfo.load_time, cache.stats.misses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model cache eviction policy benchmark")
+    parser.add_argument("--sessions", type=int, default=200, help="Number of sessions to run")
+    parser.add_argument("--main-models", type=int, default=3, help="Number of main models the sessions use")
+    parser.add_argument("--loras", type=int, default=30, help="Number of LoRAs the sessions use")
+    parser.add_argument("--controlnets", type=int, default=4, help="Number of ControlNets the sessions use")
+    parser.add_argument("--cache-sizes", type=float, nargs="+", default=[10.0, 14.0], help="Sizes of cache (GB)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the sessions")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    print(f"{'cache (GB)':>10} {'policy':<12} {'misses':>6} {'load time (s)':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        sessions = create_sessions(Path(directory), args.sessions, args.main_models, args.loras, args.controlnets)
+        for cache_size in args.cache_sizes:
+            for policy in EVICTION_POLICIES:
+                load_time, misses = run(sessions, policy, cache_size)
+                print(f"{cache_size:>10.1f} {policy:<12} {misses:>6} {load_time:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
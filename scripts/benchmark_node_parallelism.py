@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""
+Compare executing a session's nodes one at a time with executing its independent nodes at the same time.
+
+The default text-to-image graph, and the same graph with a ControlNet whose control image is loaded and preprocessed,
+are executed with each node taking a fixed time instead of doing its work. As in the app, nodes are handed out by
+`GraphExecutionState.next()`, up to the number of node workers at once, and nodes that use a model take turns on the
+execution device.
+"""
+
+import argparse
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Callable
+
+from invokeai.app.invocations.baseinvocation import BaseInvocation, BaseInvocationOutput
+from invokeai.app.invocations.controlnet_image_processors import (
+    CannyImageProcessorInvocation,
+    ControlNetInvocation,
+    ControlNetModelField,
+)
+from invokeai.app.invocations.noise import NoiseOutput
+from invokeai.app.invocations.primitives import (
+    ConditioningField,
+    ConditioningOutput,
+    ImageField,
+    ImageInvocation,
+    ImageOutput,
+    LatentsField,
+    LatentsOutput,
+)
+from invokeai.app.services.shared.default_graphs import create_text_to_image
+from invokeai.app.services.shared.graph import Edge, EdgeConnection, Graph, GraphExecutionState
+from invokeai.backend.model_management.models import BaseModelType
+
+
+def image_output(node: BaseInvocation) -> ImageOutput:
+    return ImageOutput(image=ImageField(image_name=node.id), width=512, height=512)
+
+
+# The time each type of node takes (seconds), whether it uses a model, and the output it produces. Nodes that are not
+# listed are cheap and run for real.
+SIMULATED_NODES: dict[str, tuple[float, bool, Callable[[BaseInvocation], BaseInvocationOutput]]] = {
+    "noise": (0.02, False, lambda n: NoiseOutput(noise=LatentsField(latents_name=n.id), width=512, height=512)),
+    "compel": (0.15, True, lambda n: ConditioningOutput(conditioning=ConditioningField(conditioning_name=n.id))),
+    "denoise_latents": (
+        2.0,
+        True,
+        lambda n: LatentsOutput(latents=LatentsField(latents_name=n.id), width=512, height=512),
+    ),
+    "l2i": (0.3, True, image_output),
+    "img_nsfw": (0.2, True, image_output),
+    "image": (0.05, False, image_output),
+    "canny_image_processor": (0.15, False, image_output),
+}
+
+
+def create_text_to_image_graph() -> Graph:
+    graph = create_text_to_image().graph
+    # The default graph's seed is a placeholder, which clients replace
+    graph.get_node("seed").value = 0  # type: ignore - the seed node is an integer primitive
+    return graph
+
+
+def create_controlnet_graph() -> Graph:
+    graph = create_text_to_image_graph()
+    graph.add_node(ImageInvocation(id="control_image", image=ImageField(image_name="control.png")))
+    graph.add_node(CannyImageProcessorInvocation(id="canny"))
+    graph.add_node(
+        ControlNetInvocation(
+            id="controlnet",
+            control_model=ControlNetModelField(
+                model_name="sd-controlnet-canny", base_model=BaseModelType.StableDiffusion1
+            ),
+        )
+    )
+    for source, destination in [
+        (("control_image", "image"), ("canny", "image")),
+        (("canny", "image"), ("controlnet", "image")),
+        (("controlnet", "control"), ("6", "control")),
+    ]:
+        graph.add_edge(
+            Edge(
+                source=EdgeConnection(node_id=source[0], field=source[1]),
+                destination=EdgeConnection(node_id=destination[0], field=destination[1]),
+            )
+        )
+    return graph
+
+
+def invoke(node: BaseInvocation, device_lock: Lock) -> tuple[BaseInvocation, BaseInvocationOutput]:
+    simulated = SIMULATED_NODES.get(node.get_type())
+    if simulated is None:
+        return node, node.invoke(None)  # type: ignore - the nodes that run for real don't use the context
+    cost, uses_model, create_output = simulated
+    if uses_model:
+        with device_lock:
+            time.sleep(cost)
+    else:
+        time.sleep(cost)
+    return node, create_output(node)
+
+
+def execute(graph: Graph, node_workers: int) -> float:
+    state = GraphExecutionState(graph=graph)
+    device_lock = Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=node_workers) as executor:
+        running: set[Future] = set()
+        while True:
+            while len(running) < node_workers:
+                node = state.next()
+                if node is None:
+                    break
+                running.add(executor.submit(invoke, node, device_lock))
+            if not running:
+                break
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node, output = future.result()
+                state.complete(node.id, output)
+    assert state.is_complete()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Node parallelism benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Numbers of node workers to test")
+    args = parser.parse_args()
+
+    graphs = {"text-to-image": create_text_to_image_graph(), "controlnet": create_controlnet_graph()}
+    print(f"{'graph':<14} {'node workers':>12} {'time (s)':>9}")
+    for name, graph in graphs.items():
+        for node_workers in args.workers:
+            print(f"{name:<14} {node_workers:>12} {execute(graph, node_workers):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+Compare the time spent storing a graph execution state after every node when the whole state is rewritten, against
+appending the changes to a log of them.
+
+The graphs iterate over a range, doing some math on every item and collecting the results, so the state grows with the
+size of the range. Nodes are cheap and run for real, so the time measured is almost all storage.
+
+As the processor does, the state is stored after every node, then retrieved, as the stats do when they are logged.
+"""
+
+import argparse
+import logging
+import time
+
+from invokeai.app.invocations.collections import RangeInvocation
+from invokeai.app.invocations.math import AddInvocation, MultiplyInvocation
+from invokeai.app.services.config import InvokeAIAppConfig
+from invokeai.app.services.item_storage.graph_execution_state_sqlite import SqliteGraphExecutionStateStorage
+from invokeai.app.services.item_storage.item_storage_base import ItemStorageABC
+from invokeai.app.services.item_storage.item_storage_sqlite import SqliteItemStorage
+from invokeai.app.services.shared.graph import (
+    CollectInvocation,
+    Edge,
+    EdgeConnection,
+    Graph,
+    GraphExecutionState,
+    IterateInvocation,
+)
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+
+
+def create_edge(source: str, source_field: str, destination: str, destination_field: str) -> Edge:
+    return Edge(
+        source=EdgeConnection(node_id=source, field=source_field),
+        destination=EdgeConnection(node_id=destination, field=destination_field),
+    )
+
+
+def create_iterate_collect_graph(iterations: int) -> Graph:
+    graph = Graph()
+    graph.add_node(RangeInvocation(id="range", start=0, stop=iterations, step=1))
+    graph.add_node(IterateInvocation(id="iterate"))
+    graph.add_node(MultiplyInvocation(id="multiply", b=2))
+    graph.add_node(AddInvocation(id="add", b=1))
+    graph.add_node(CollectInvocation(id="collect"))
+    graph.add_edge(create_edge("range", "collection", "iterate", "collection"))
+    graph.add_edge(create_edge("iterate", "item", "multiply", "a"))
+    graph.add_edge(create_edge("multiply", "value", "add", "a"))
+    graph.add_edge(create_edge("add", "value", "collect", "item"))
+    return graph
+
+
+def execute(graph: Graph, storage: ItemStorageABC[GraphExecutionState]) -> float:
+    """Executes the graph, storing and retrieving the state after every node, and returns the time spent doing so"""
+    state = GraphExecutionState(graph=graph)
+    storage.set(state)
+    storage_time = 0.0
+    while (node := state.next()) is not None:
+        state.complete(node.id, node.invoke(None))  # type: ignore - the math nodes don't use the context
+        start = time.perf_counter()
+        storage.set(state)
+        # The stats retrieve the state after every node, though the copy being executed is stored
+        assert storage.get(state.id) is not None
+        storage_time += time.perf_counter() - start
+    stored = storage.get(state.id)
+    assert stored is not None and stored.is_complete()
+    return storage_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session persistence benchmark")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[10, 50, 100], help="Sizes of range to test")
+    args = parser.parse_args()
+
+    db = SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), logging.getLogger("benchmark"))
+    rewriting = SqliteItemStorage[GraphExecutionState](db=db, table_name="rewritten_graph_executions")
+    logging_storage = SqliteGraphExecutionStateStorage(db=db, table_name="logged_graph_executions")
+
+    print(f"{'iterations':>10} {'rewriting (s)':>13} {'logging (s)':>11} {'speedup':>8}")
+    for iterations in args.iterations:
+        graph = create_iterate_collect_graph(iterations)
+        rewritten = execute(graph, rewriting)
+        logged = execute(graph, logging_storage)
+        print(f"{iterations:>10} {rewritten:>13.3f} {logged:>11.3f} {rewritten / logged:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""
+Measure dequeue and status-poll latency of the session queue as it grows.
+
+For each queue size, a database is filled with that many queue items, half of them pending. Pending items are stored
+as batches are, with their sessions created at dequeue; the others have a session. Each size is run with the
+single-column indices the queue used to have, and with the current composite indices.
+
+"pick" is the query that selects the next item: `SELECT *` for the old indices, as dequeue used to do, and the
+two-phase pick-then-load for the current ones. "dequeue" and "status" time the service's `dequeue()` and
+`get_queue_status()`. The status is polled with several items in progress, as it is with several session processor
+workers; each of them reports every item in progress.
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+from unittest.mock import MagicMock
+
+from invokeai.app.invocations.primitives import StringInvocation
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.session_queue.session_queue_sqlite import SqliteSessionQueue
+from invokeai.app.services.shared.graph import Graph, GraphExecutionState
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.backend.util.logging import InvokeAILogger
+
+BATCH_ID = "benchmark_batch"
+QUEUE_ID = "default"
+INSERT_CHUNK = 10000
+
+CURRENT_INDICES = [
+    "idx_session_queue_status_priority",
+    "idx_session_queue_queue_id_status_priority",
+    "idx_session_queue_queue_id_priority",
+    "idx_session_queue_batch_id_queue_id_status",
+]
+
+OLD_INDICES = {
+    "idx_session_queue_batch_id": "session_queue(batch_id)",
+    "idx_session_queue_created_priority": "session_queue(priority)",
+    "idx_session_queue_created_status": "session_queue(status)",
+}
+
+
+def create_graph(nodes: int) -> Graph:
+    graph = Graph()
+    for i in range(nodes):
+        graph.add_node(StringInvocation(id=str(i), value=f"a prompt for node {i}"))
+    return graph
+
+
+def fill_queue(db: SqliteDatabase, size: int, graph: Graph) -> None:
+    session = GraphExecutionState(graph=graph).json()
+    field_values = json.dumps([{"node_path": "0", "field_name": "value", "value": "a batch value"}])
+    db.conn.execute("INSERT INTO session_queue_batches (batch_id, graph) VALUES (?, ?);", (BATCH_ID, graph.json()))
+    for start in range(0, size, INSERT_CHUNK):
+        rows = []
+        for i in range(start, min(start + INSERT_CHUNK, size)):
+            pending = i >= size // 2
+            rows.append(
+                (
+                    QUEUE_ID,
+                    None if pending else session,
+                    f"session_{i}",
+                    BATCH_ID,
+                    field_values,
+                    "pending" if pending else "completed",
+                )
+            )
+        db.conn.executemany(
+            """--sql
+            INSERT INTO session_queue (queue_id, session, session_id, batch_id, field_values, status)
+            VALUES (?, ?, ?, ?, ?, ?);
+            """,
+            rows,
+        )
+        db.conn.commit()
+
+
+def use_old_indices(db: SqliteDatabase) -> None:
+    for name in CURRENT_INDICES:
+        db.conn.execute(f"DROP INDEX {name};")
+    for name, columns in OLD_INDICES.items():
+        db.conn.execute(f"CREATE INDEX {name} ON {columns};")
+    db.conn.execute("ANALYZE;")
+    db.conn.commit()
+
+
+def pick_old(db: SqliteDatabase) -> None:
+    db.conn.execute(
+        "SELECT * FROM session_queue WHERE status = 'pending' ORDER BY priority DESC, item_id ASC LIMIT 1;"
+    ).fetchone()
+
+
+def pick_current(db: SqliteDatabase) -> None:
+    item_id = db.conn.execute(
+        "SELECT item_id FROM session_queue WHERE status = 'pending' ORDER BY priority DESC, item_id ASC LIMIT 1;"
+    ).fetchone()[0]
+    db.conn.execute("SELECT * FROM session_queue WHERE item_id = ?;", (item_id,)).fetchone()
+
+
+def time_ms(op: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        op()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def run(size: int, old_indices: bool, nodes: int, repeat: int, in_progress: int) -> tuple[float, float, float]:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = InvokeAIAppConfig(db_dir=Path(tmpdir), max_queue_size=size + 1)
+        db = SqliteDatabase(config, InvokeAILogger.get_logger())
+        invoker = MagicMock()
+        invoker.services.configuration.get_config.return_value = config
+        session_queue = SqliteSessionQueue(db=db)
+        session_queue.start(invoker)
+        fill_queue(db, size, create_graph(nodes))
+        if old_indices:
+            use_old_indices(db)
+        else:
+            db.conn.execute("ANALYZE;")
+            db.conn.commit()
+
+        pick = time_ms(lambda: pick_old(db) if old_indices else pick_current(db), repeat)
+        dequeue = time_ms(session_queue.dequeue, repeat)
+        db.conn.execute("UPDATE session_queue SET status = 'completed' WHERE status = 'in_progress';")
+        db.conn.commit()
+        for _ in range(in_progress):
+            session_queue.dequeue()
+        status = time_ms(lambda: session_queue.get_queue_status(QUEUE_ID), repeat)
+        db.conn.close()
+    return pick, dequeue, status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session queue benchmark")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="Numbers of queue items to test"
+    )
+    parser.add_argument("--nodes", type=int, default=5, help="Number of nodes in each session's graph")
+    parser.add_argument("--repeat", type=int, default=20, help="Number of times each operation is timed")
+    parser.add_argument("--in-progress", type=int, default=4, help="Number of items in progress when polling status")
+    args = parser.parse_args()
+
+    print(
+        f"Median latency over {args.repeat} calls, sessions of {args.nodes} nodes,"
+        f" {args.in_progress} items in progress when polling status"
+    )
+    print(f"{'queue items':>12} {'indices':<8} {'pick (ms)':>10} {'dequeue (ms)':>13} {'status (ms)':>12}")
+    for size in args.sizes:
+        for old_indices in (True, False):
+            pick, dequeue, status = run(size, old_indices, args.nodes, args.repeat, args.in_progress)
+            indices = "old" if old_indices else "current"
+            print(f"{size:>12} {indices:<8} {pick:>10.3f} {dequeue:>13.3f} {status:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+import pytest
+import torch
+
+from invokeai.backend.model_management.lora import ModelPatcher
+from invokeai.backend.model_management.model_cache import GIG, CacheStats, ModelCache
+from invokeai.backend.model_management.model_cache_eviction import (
+    EvictionPolicy,
+    GreedyDualEvictionPolicy,
+    LRUEvictionPolicy,
+)
+from invokeai.backend.model_management.models import BaseModelType, ModelType, SubModelType
+from invokeai.backend.model_management.models.lora import LoRALayer
+
+MODEL_SIZE = 2**20
+
+
+class FakeModel:
+    pass
+
+
+class FakeModelInfo:
+    """Stands in for a `ModelBase`, loading a placeholder model of a fixed size"""
+
+    def __init__(self, model_path: str, base_model: BaseModelType, model_type: ModelType):
+        self.model_path = model_path
+
+    def get_size(self, child_type: Optional[SubModelType] = None) -> int:
+        return MODEL_SIZE
+
+    def get_model(self, torch_dtype: Optional[torch.dtype], child_type: Optional[SubModelType] = None) -> FakeModel:
+        return FakeModel()
+
+
+@pytest.fixture
+def model_paths(tmp_path: Path) -> list[Path]:
+    paths = [tmp_path / f"model_{i}" for i in range(4)]
+    for path in paths:
+        path.touch()
+    return paths
+
+
+def get_model(cache: ModelCache, path: Path, model_type: ModelType = ModelType.Lora) -> None:
+    cache.get_model(path, FakeModelInfo, BaseModelType.StableDiffusion1, model_type)  # type: ignore
+
+
+def prefetch_model(cache: ModelCache, path: Path) -> bool:
+    return cache.prefetch_model(path, FakeModelInfo, BaseModelType.StableDiffusion1, ModelType.Lora)  # type: ignore
+
+
+def get_key(cache: ModelCache, path: Path, model_type: ModelType = ModelType.Lora) -> str:
+    return cache.get_key(str(path), BaseModelType.StableDiffusion1, model_type)
+
+
+def test_model_cache_unloads_least_recently_used(model_paths: list[Path]):
+    cache = ModelCache(max_cache_size=3 * MODEL_SIZE / GIG, execution_device=torch.device("cpu"))
+    for path in model_paths[:3]:
+        get_model(cache, path)
+    # Using the first model makes the second the least recently used
+    get_model(cache, model_paths[0])
+    get_model(cache, model_paths[3])
+
+    assert list(cache._cached_models.keys()) == [get_key(cache, model_paths[i]) for i in (2, 0, 3)]
+    assert cache._cache_size() == 3 * MODEL_SIZE
+
+
+def test_model_cache_counts_models(model_paths: list[Path]):
+    cache = ModelCache(max_cache_size=1.0, execution_device=torch.device("cpu"))
+    get_model(cache, model_paths[0], ModelType.Lora)
+    get_model(cache, model_paths[1], ModelType.Lora)
+    get_model(cache, model_paths[2], ModelType.TextualInversion)
+    assert cache._cache_size() == 3 * MODEL_SIZE
+    assert cache._cached_type_counts[ModelType.Lora] == 2
+    assert cache._cached_type_counts[ModelType.TextualInversion] == 1
+
+    cache.uncache_model(get_key(cache, model_paths[0], ModelType.Lora))
+    assert cache._cache_size() == 2 * MODEL_SIZE
+    assert cache._cached_type_counts[ModelType.Lora] == 1
+
+
+def test_model_cache_keeps_models_with_handles(model_paths: list[Path]):
+    cache = ModelCache(max_cache_size=2 * MODEL_SIZE / GIG, execution_device=torch.device("cpu"))
+    handle = cache.get_model(model_paths[0], FakeModelInfo, BaseModelType.StableDiffusion1, ModelType.Lora)  # type: ignore
+    get_model(cache, model_paths[1])
+    get_model(cache, model_paths[2])
+    assert list(cache._cached_models.keys()) == [get_key(cache, model_paths[i]) for i in (0, 2)]
+
+    # Once the handle is dropped, the model can be unloaded
+    del handle
+    get_model(cache, model_paths[3])
+    assert list(cache._cached_models.keys()) == [get_key(cache, model_paths[i]) for i in (2, 3)]
+
+
+def test_model_cache_prefetches_only_into_free_room(model_paths: list[Path]):
+    cache = ModelCache(max_cache_size=2 * MODEL_SIZE / GIG, execution_device=torch.device("cpu"))
+    get_model(cache, model_paths[0])
+    assert prefetch_model(cache, model_paths[1])
+    # Models that are cached already, or that don't fit without unloading another, are not prefetched
+    assert not prefetch_model(cache, model_paths[1])
+    assert not prefetch_model(cache, model_paths[2])
+    assert list(cache._cached_models.keys()) == [get_key(cache, model_paths[i]) for i in (0, 1)]
+
+    # A prefetched model is a cache hit
+    cache.stats = CacheStats()
+    get_model(cache, model_paths[1])
+    assert cache.stats.hits == 1 and cache.stats.misses == 0
+
+
+class SlowModelInfo(FakeModelInfo):
+    """Takes longer to load the models whose names start with `slow`"""
+
+    def get_model(self, torch_dtype: Optional[torch.dtype], child_type: Optional[SubModelType] = None) -> FakeModel:
+        if Path(self.model_path).name.startswith("slow"):
+            time.sleep(0.05)
+        return FakeModel()
+
+
+def test_greedy_dual_policy_orders_by_reload_cost():
+    policy = GreedyDualEvictionPolicy()
+    # A large model that loads quickly is cheaper to keep out of the cache than a small one that loads slowly
+    policy.on_added("unet", size=5 * GIG, load_time=5.0)
+    policy.on_added("lora", size=GIG // 50, load_time=0.05)
+    policy.on_added("vae", size=GIG // 2, load_time=0.2)
+    assert list(policy.eviction_order(["unet", "lora", "vae"])) == ["vae", "unet", "lora"]
+
+    # Models that are used again are kept longer
+    policy.on_hit("vae")
+    policy.on_hit("vae")
+    assert list(policy.eviction_order(["unet", "lora", "vae"])) == ["unet", "vae", "lora"]
+
+    # Evicting a model ages the others, so a model added afterwards ranks above them, even if it is cheaper
+    policy.on_removed("lora", evicted=True)
+    policy.on_added("embedding", size=GIG // 10, load_time=0.01)
+    assert list(policy.eviction_order(["unet", "vae", "embedding"])) == ["unet", "vae", "embedding"]
+
+
+@pytest.mark.parametrize("eviction_policy,kept", [(LRUEvictionPolicy(), "fast"), (GreedyDualEvictionPolicy(), "slow")])
+def test_model_cache_evicts_by_policy(tmp_path: Path, eviction_policy: EvictionPolicy, kept: str):
+    cache = ModelCache(
+        max_cache_size=2 * MODEL_SIZE / GIG, execution_device=torch.device("cpu"), eviction_policy=eviction_policy
+    )
+    paths = {name: tmp_path / name for name in ("slow", "fast", "other")}
+    for path in paths.values():
+        path.touch()
+    for name in ("slow", "fast", "other"):
+        cache.get_model(paths[name], SlowModelInfo, BaseModelType.StableDiffusion1, ModelType.Lora)  # type: ignore
+    assert list(cache._cached_models.keys()) == [get_key(cache, paths[name]) for name in (kept, "other")]
+
+
+class CountingModel:
+    device = torch.device("cpu")
+
+    def to(self, device: torch.device) -> None:
+        pass
+
+
+class CountingModelInfo(FakeModelInfo):
+    """Loads models slowly, counting how many times each is loaded"""
+
+    loads: Counter[tuple[str, Optional[SubModelType]]] = Counter()
+    loads_lock = threading.Lock()
+
+    def get_model(self, torch_dtype: Optional[torch.dtype], child_type: Optional[SubModelType] = None) -> CountingModel:
+        with self.loads_lock:
+            self.loads[(self.model_path, child_type)] += 1
+        time.sleep(0.01)
+        return CountingModel()
+
+
+@pytest.mark.parametrize("max_cache_models", [100, 3])
+def test_model_cache_is_thread_safe(model_paths: list[Path], max_cache_models: int):
+    """Many threads getting and using the submodels of a few models at once"""
+    cache = ModelCache(max_cache_size=max_cache_models * MODEL_SIZE / GIG, execution_device=torch.device("cpu"))
+    CountingModelInfo.loads.clear()
+    submodels = [SubModelType.UNet, SubModelType.TextEncoder, SubModelType.Vae]
+    models: dict[str, set[int]] = defaultdict(set)
+    models_lock = threading.Lock()
+
+    def use_models(seed: int) -> None:
+        rng = random.Random(seed)
+        for _ in range(20):
+            path, submodel = rng.choice(model_paths), rng.choice(submodels)
+            model_locker = cache.get_model(
+                path, CountingModelInfo, BaseModelType.StableDiffusion1, ModelType.Main, submodel  # type: ignore
+            )
+            with model_locker as model:
+                with models_lock:
+                    models[model_locker.key].add(id(model))
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        for future in [executor.submit(use_models, seed) for seed in range(32)]:
+            future.result()
+
+    assert cache._locked_models == 0
+    assert all(not cache_entry.locked for cache_entry in cache._cached_models.values())
+    assert len(cache._loading) == 0 and cache._loading_size == 0
+    assert cache._cache_size() == len(cache._cached_models) * MODEL_SIZE
+    if max_cache_models >= len(model_paths) * len(submodels):
+        # Every submodel was loaded once, and all threads shared it
+        assert all(n == 1 for n in CountingModelInfo.loads.values())
+        assert all(len(ids) == 1 for ids in models.values())
+    else:
+        # Models in use can't be unloaded, but once they are all released, loading another makes room for it
+        cache.get_model(
+            model_paths[0], CountingModelInfo, BaseModelType.StableDiffusion1, ModelType.Main, SubModelType.Tokenizer  # type: ignore
+        )
+        assert len(cache._cached_models) <= max_cache_models
+
+
+class TextEncoder(torch.nn.Module):
+    """A model with the layers that `ModelPatcher.apply_clip_skip` pops"""
+
+    def __init__(self):
+        super().__init__()
+        self.text_model = torch.nn.Module()
+        self.text_model.encoder = torch.nn.Module()
+        self.text_model.encoder.layers = torch.nn.ModuleList([torch.nn.Linear(4, 4) for _ in range(4)])
+
+    @property
+    def device(self) -> torch.device:
+        return self.text_model.encoder.layers[0].weight.device
+
+
+class TextEncoderModelInfo(FakeModelInfo):
+    model = TextEncoder()
+
+    def get_model(self, torch_dtype: Optional[torch.dtype], child_type: Optional[SubModelType] = None) -> TextEncoder:
+        return self.model
+
+
+def test_model_cache_serializes_patched_models(model_paths: list[Path]):
+    """Two threads patching and using the same cached model, as the prompt nodes do"""
+    cache = ModelCache(max_cache_size=1.0, execution_device=torch.device("cpu"))
+    text_encoder = TextEncoderModelInfo.model
+    original_weight = text_encoder.text_model.encoder.layers[0].weight.detach().clone()
+    lora_layer = LoRALayer(
+        "lora_te_text_model_encoder_layers_0",
+        {"lora_up.weight": torch.ones(4, 1), "lora_down.weight": torch.ones(1, 4)},
+    )
+    lora = SimpleNamespace(layers={lora_layer.layer_key: lora_layer})
+    patched: list[tuple[int, torch.Tensor]] = []
+
+    def patch_and_use() -> None:
+        model_locker = cache.get_model(
+            model_paths[0], TextEncoderModelInfo, BaseModelType.StableDiffusion1, ModelType.Main, SubModelType.TextEncoder  # type: ignore
+        )
+        with (
+            model_locker as model,
+            ModelPatcher.apply_lora_text_encoder(model, [(lora, 1.0)]),  # type: ignore
+            ModelPatcher.apply_clip_skip(model, 1),
+        ):
+            time.sleep(0.05)
+            patched.append((len(model.text_model.encoder.layers), model.text_model.encoder.layers[0].weight.clone()))
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for future in [executor.submit(patch_and_use) for _ in range(2)]:
+            future.result()
+
+    # Each thread saw the model patched once, and left it as it was
+    for layers, weight in patched:
+        assert layers == 3
+        assert torch.equal(weight, original_weight + 1)
+    assert len(text_encoder.text_model.encoder.layers) == 4
+    assert torch.equal(text_encoder.text_model.encoder.layers[0].weight, original_weight)
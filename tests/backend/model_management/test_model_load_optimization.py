@@ -1,3 +1,6 @@
+import threading
+import time
+
 import pytest
 import torch
 
@@ -68,3 +71,23 @@ def test_skip_torch_weight_init_restores_base_class_behavior():
     torch.nn.modules.conv._ConvNd.reset_parameters = saved_fn
 
     assert called_monkey_patched_fn
+
+
+def test_skip_torch_weight_init_restores_after_overlapping_threads():
+    """Test that the layers are restored when `skip_torch_weight_init()` is used on several threads at once."""
+    reset_params_fn_before = torch.nn.Linear.reset_parameters
+    entered = threading.Barrier(2)
+
+    def load(exit_first: bool):
+        with skip_torch_weight_init():
+            entered.wait()
+            if not exit_first:
+                time.sleep(0.05)
+
+    threads = [threading.Thread(target=load, args=(exit_first,)) for exit_first in (True, False)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert torch.nn.Linear.reset_parameters == reset_params_fn_before
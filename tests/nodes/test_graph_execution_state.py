@@ -19,6 +19,7 @@ from invokeai.app.services.invocation_processor.invocation_processor_default imp
 from invokeai.app.services.invocation_queue.invocation_queue_memory import MemoryInvocationQueue
 from invokeai.app.services.invocation_services import InvocationServices
 from invokeai.app.services.invocation_stats.invocation_stats_default import InvocationStatsService
+from invokeai.app.services.item_storage.graph_execution_state_sqlite import SqliteGraphExecutionStateStorage
 from invokeai.app.services.item_storage.item_storage_sqlite import SqliteItemStorage
 from invokeai.app.services.session_queue.session_queue_common import DEFAULT_QUEUE_ID
 from invokeai.app.services.shared.graph import (
@@ -51,7 +52,7 @@ def mock_services() -> InvocationServices:
     configuration = InvokeAIAppConfig(use_memory_db=True, node_cache_size=0)
     db = SqliteDatabase(configuration, InvokeAILogger.get_logger())
     # NOTE: none of these are actually called by the test invocations
-    graph_execution_manager = SqliteItemStorage[GraphExecutionState](db=db, table_name="graph_executions")
+    graph_execution_manager = SqliteGraphExecutionStateStorage(db=db, table_name="graph_executions")
     return InvocationServices(
         board_image_records=None,  # type: ignore
         board_images=None,  # type: ignore
@@ -66,8 +67,10 @@ def mock_services() -> InvocationServices:
         images=None,  # type: ignore
         invocation_cache=MemoryInvocationCache(max_cache_size=0),
         latents=None,  # type: ignore
+        latents_reclaimer=None,  # type: ignore
         logger=logging,  # type: ignore
         model_manager=None,  # type: ignore
+        model_prefetcher=None,  # type: ignore
         names=None,  # type: ignore
         performance_statistics=InvocationStatsService(),
         processor=DefaultInvocationProcessor(),
@@ -129,6 +132,29 @@ def test_graph_is_not_complete(simple_graph, mock_services):
     assert not g.is_complete()
 
 
+def test_graph_state_hands_out_independent_nodes_at_once(mock_services):
+    graph = Graph()
+    graph.add_node(PromptTestInvocation(id="1", prompt="Banana sushi"))
+    graph.add_node(PromptTestInvocation(id="2", prompt="Grape sushi"))
+    graph.add_node(TextToImageTestInvocation(id="3"))
+    graph.add_edge(create_edge("1", "prompt", "3", "prompt"))
+    g = GraphExecutionState(graph=graph)
+
+    n1 = g.next()
+    n2 = g.next()
+    assert n1 is not None and n2 is not None
+    assert {g.prepared_source_mapping[n1.id], g.prepared_source_mapping[n2.id]} == {"1", "2"}
+    assert g.executing == {n1.id, n2.id}
+    # The image node waits for its prompt
+    assert g.next() is None
+
+    for n in (n1, n2):
+        g.complete(n.id, n.invoke(None))  # type: ignore - the test prompt invocation does not use the context
+    assert not g.executing
+    n3 = g.next()
+    assert n3 is not None and g.prepared_source_mapping[n3.id] == "3"
+
+
 # TODO: test completion with iterators/subgraphs
 
 
@@ -152,6 +178,133 @@ def test_graph_state_expands_iterator(mock_services):
     assert results == expected
 
 
+def test_graph_state_resumes_after_serialization(mock_services):
+    """Tests that a state loaded from storage part way through executes the rest of its nodes"""
+    graph = Graph()
+    graph.add_node(RangeInvocation(id="0", start=0, stop=3, step=1))
+    graph.add_node(IterateInvocation(id="1"))
+    graph.add_node(AddInvocation(id="2", b=10))
+    graph.add_node(CollectInvocation(id="3"))
+    graph.add_edge(create_edge("0", "collection", "1", "collection"))
+    graph.add_edge(create_edge("1", "item", "2", "a"))
+    graph.add_edge(create_edge("2", "value", "3", "item"))
+
+    g = GraphExecutionState(graph=graph)
+    for _ in range(5):
+        invoke_next(g, mock_services)
+    g = GraphExecutionState.parse_raw(g.json())
+
+    while not g.is_complete():
+        n = invoke_next(g, mock_services)
+        assert n[0] is not None
+
+    collect_node = next(iter(g.source_prepared_mapping["3"]))
+    assert sorted(g.results[collect_node].collection) == [10, 11, 12]
+
+
+def test_graph_state_storage_appends_changes(mock_services):
+    """Tests that a stored state only appends its changes, and is rebuilt from them when retrieved"""
+    graph = Graph()
+    graph.add_node(RangeInvocation(id="0", start=0, stop=3, step=1))
+    graph.add_node(IterateInvocation(id="1"))
+    graph.add_node(AddInvocation(id="2", b=10))
+    graph.add_node(CollectInvocation(id="3"))
+    graph.add_edge(create_edge("0", "collection", "1", "collection"))
+    graph.add_edge(create_edge("1", "item", "2", "a"))
+    graph.add_edge(create_edge("2", "value", "3", "item"))
+
+    storage = mock_services.graph_execution_manager
+    g = GraphExecutionState(graph=graph)
+    storage.set(g)
+    for _ in range(5):
+        invoke_next(g, mock_services)
+        storage.set(g)
+
+    with storage._db.read() as conn:
+        deltas = storage._get_deltas(conn, g.id)
+    assert len(deltas) > 0
+
+    stored = storage.get(g.id)
+    assert stored is not None
+    assert stored.json() == g.json()
+
+    # The retrieved state tracks its own changes
+    while not stored.is_complete():
+        invoke_next(stored, mock_services)
+        storage.set(stored)
+
+    completed = storage.get(g.id)
+    assert completed is not None
+    assert completed.is_complete()
+    collect_node = next(iter(completed.source_prepared_mapping["3"]))
+    assert sorted(completed.results[collect_node].collection) == [10, 11, 12]
+    with storage._db.read() as conn:
+        assert storage._get_deltas(conn, g.id) == []
+
+
+def test_graph_state_storage_appends_changes_when_retrieved_in_between(mock_services):
+    """Tests that retrieving a state, as the stats do after every node, does not stop its changes being appended"""
+    graph = Graph()
+    graph.add_node(RangeInvocation(id="0", start=0, stop=3, step=1))
+    graph.add_node(IterateInvocation(id="1"))
+    graph.add_node(AddInvocation(id="2", b=10))
+    graph.add_node(CollectInvocation(id="3"))
+    graph.add_edge(create_edge("0", "collection", "1", "collection"))
+    graph.add_edge(create_edge("1", "item", "2", "a"))
+    graph.add_edge(create_edge("2", "value", "3", "item"))
+
+    storage = mock_services.graph_execution_manager
+
+    def execute(retrieve: bool) -> tuple[GraphExecutionState, GraphExecutionState, list[int]]:
+        g = GraphExecutionState(graph=graph)
+        storage.set(g)
+        retrieved = g
+        log_lengths = []
+        for _ in range(5):
+            invoke_next(g, mock_services)
+            storage.set(g)
+            if retrieve:
+                retrieved = storage.get(g.id)
+                assert retrieved is not None
+                assert retrieved.json() == g.json()
+            with storage._db.read() as conn:
+                log_lengths.append(len(storage._get_deltas(conn, g.id)))
+        return g, retrieved, log_lengths
+
+    _, _, log_lengths = execute(retrieve=False)
+    g, retrieved, retrieved_log_lengths = execute(retrieve=True)
+    assert retrieved_log_lengths == log_lengths
+    assert max(log_lengths) > 0
+
+    # The retrieved copy is behind once the executed one is stored again, so storing it rewrites the snapshot
+    invoke_next(g, mock_services)
+    storage.set(g)
+    storage.set(retrieved)
+    with storage._db.read() as conn:
+        assert storage._get_deltas(conn, g.id) == []
+    stored = storage.get(g.id)
+    assert stored is not None
+    assert stored.json() == retrieved.json()
+
+
+def test_graph_state_storage_stores_snapshot_when_graph_changes(mock_services):
+    storage = mock_services.graph_execution_manager
+    graph = Graph()
+    graph.add_node(PromptTestInvocation(id="1", prompt="Banana sushi"))
+    g = GraphExecutionState(graph=graph)
+    storage.set(g)
+    invoke_next(g, mock_services)
+
+    g.add_node(PromptTestInvocation(id="2", prompt="Cat sushi"))
+    storage.set(g)
+
+    with storage._db.read() as conn:
+        assert storage._get_deltas(conn, g.id) == []
+    stored = storage.get(g.id)
+    assert stored is not None
+    assert stored.json() == g.json()
+
+
 def test_graph_state_collects(mock_services):
     graph = Graph()
     test_prompts = ["Banana sushi", "Cat sushi"]
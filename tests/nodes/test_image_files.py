@@ -0,0 +1,95 @@
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from PIL import Image
+
+from invokeai.app.services.image_files import image_files_disk
+from invokeai.app.services.image_files.image_files_common import ImageFileNotFoundException
+from invokeai.app.services.image_files.image_files_disk import DiskImageFileStorage
+
+# A 10x10 RGB image takes 300 bytes decoded
+IMAGE_BYTES = 300
+
+
+def create_image(color: str) -> Image.Image:
+    return Image.new("RGB", (10, 10), color)
+
+
+def create_storage(tmp_path: Path, max_cache_size: int) -> DiskImageFileStorage:
+    storage = DiskImageFileStorage(tmp_path, max_cache_size=max_cache_size)
+    invoker = MagicMock()
+    invoker.services.configuration.png_compress_level = 1
+    storage.start(invoker)
+    return storage
+
+
+@pytest.fixture(autouse=True)
+def no_trash(monkeypatch: pytest.MonkeyPatch):
+    # Deleted images are moved to the trash, which the tests have no business touching
+    monkeypatch.setattr(image_files_disk, "send2trash", lambda path: Path(path).unlink())
+
+
+def test_cache_evicts_least_recently_used_image(tmp_path: Path):
+    storage = create_storage(tmp_path, max_cache_size=3 * IMAGE_BYTES)
+    for name, color in [("1.png", "red"), ("2.png", "green"), ("3.png", "blue")]:
+        storage.save(create_image(color), name)
+    # Using the first image makes the second the least recently used
+    storage.get("1.png")
+    storage.save(create_image("white"), "4.png")
+
+    status = storage.get_cache_status()
+    assert (status.size, status.bytes, status.max_bytes) == (3, 3 * IMAGE_BYTES, 3 * IMAGE_BYTES)
+    assert (status.hits, status.misses, status.evictions) == (1, 0, 1)
+
+    # The second image is read from disk again, evicting the third
+    assert storage.get("2.png").getpixel((0, 0)) == (0, 128, 0)
+    storage.get("1.png")
+    status = storage.get_cache_status()
+    assert (status.hits, status.misses, status.evictions) == (2, 1, 2)
+    storage.get("3.png")
+    assert storage.get_cache_status().misses == 2
+
+
+def test_cache_does_not_keep_images_larger_than_itself(tmp_path: Path):
+    storage = create_storage(tmp_path, max_cache_size=IMAGE_BYTES)
+    storage.save(create_image("red"), "1.png")
+    storage.save(Image.new("RGB", (20, 20), "green"), "2.png")
+    status = storage.get_cache_status()
+    # The small image is not evicted to make room for one that would not fit anyway
+    assert (status.size, status.bytes, status.evictions) == (1, IMAGE_BYTES, 0)
+    storage.get("2.png")
+    storage.get("1.png")
+    status = storage.get_cache_status()
+    assert (status.hits, status.misses) == (1, 1)
+
+
+def test_cache_is_disabled_without_size(tmp_path: Path):
+    storage = create_storage(tmp_path, max_cache_size=0)
+    storage.save(create_image("red"), "1.png")
+    assert storage.get("1.png").getpixel((0, 0)) == (255, 0, 0)
+    assert storage.get("1.png").getpixel((0, 0)) == (255, 0, 0)
+    status = storage.get_cache_status()
+    assert (status.size, status.bytes, status.hits, status.misses, status.evictions) == (0, 0, 0, 2, 0)
+
+
+def test_delete_removes_image_from_cache(tmp_path: Path):
+    storage = create_storage(tmp_path, max_cache_size=3 * IMAGE_BYTES)
+    storage.save(create_image("red"), "1.png")
+    storage.delete("1.png")
+    status = storage.get_cache_status()
+    assert (status.size, status.bytes) == (0, 0)
+    assert not storage.get_path("1.png").exists()
+    with pytest.raises(ImageFileNotFoundException):
+        storage.get("1.png")
+
+
+def test_get_returns_loaded_image_without_open_file(tmp_path: Path):
+    storage = create_storage(tmp_path, max_cache_size=3 * IMAGE_BYTES)
+    create_image("red").save(storage.get_path("1.png"))
+    image = storage.get("1.png")
+    assert getattr(image, "fp", None) is None
+    # The pixels were decoded when the image was read, so the file is no longer needed
+    storage.get_path("1.png").unlink()
+    assert image.getpixel((9, 9)) == (255, 0, 0)
+    assert storage.get("1.png") is image
@@ -0,0 +1,124 @@
+from unittest.mock import MagicMock
+
+import pytest
+from pydantic import BaseModel
+
+from invokeai.app.invocations.math import AddInvocation
+from invokeai.app.invocations.primitives import ImageField, ImageOutput, LatentsField, LatentsOutput
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
+from invokeai.app.services.invocation_cache.invocation_cache_common import create_content_key
+from invokeai.app.services.invocation_cache.invocation_cache_memory import MemoryInvocationCache
+from invokeai.app.services.invocation_cache.invocation_cache_sqlite import SqliteInvocationCache
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.backend.util.logging import InvokeAILogger
+
+
+@pytest.fixture
+def cache() -> MemoryInvocationCache:
+    cache = MemoryInvocationCache(max_cache_size=10)
+    cache.start(MagicMock())
+    return cache
+
+
+def test_references_are_indexed_on_save(cache: MemoryInvocationCache):
+    cache.save(1, ImageOutput(image=ImageField(image_name="a.png"), width=8, height=8))
+    cache.save(2, LatentsOutput(latents=LatentsField(latents_name="session__node"), width=8, height=8))
+    assert cache.references("a.png")
+    assert cache.references("session__node")
+    assert not cache.references("session")
+    assert not cache.references("image_output")
+
+
+def test_delete_by_matches_invalidates_referencing_outputs(cache: MemoryInvocationCache):
+    cache.save(1, ImageOutput(image=ImageField(image_name="a.png"), width=8, height=8))
+    cache.save(2, ImageOutput(image=ImageField(image_name="b.png"), width=8, height=8))
+    cache.save(3, ImageOutput(image=ImageField(image_name="c.png"), width=8, height=8))
+    cache._delete_by_matches(["a.png", "b.png"])
+    assert cache.get(1) is None
+    assert cache.get(2) is None
+    assert cache.get(3) is not None
+    assert not cache.references("a.png")
+
+
+def test_eviction_removes_references():
+    cache = MemoryInvocationCache(max_cache_size=1)
+    cache.start(MagicMock())
+    cache.save(1, ImageOutput(image=ImageField(image_name="a.png"), width=8, height=8))
+    cache.save(2, ImageOutput(image=ImageField(image_name="b.png"), width=8, height=8))
+    assert not cache.references("a.png")
+    assert cache.references("b.png")
+
+
+def test_create_key_is_deterministic_and_ignores_id():
+    key = MemoryInvocationCache.create_key(AddInvocation(id="1", a=1, b=2))
+    assert key == MemoryInvocationCache.create_key(AddInvocation(id="2", a=1, b=2))
+    # blake2b with a 32-byte digest, hex encoded
+    assert len(key) == 64
+    assert key != MemoryInvocationCache.create_key(AddInvocation(id="1", a=2, b=1))
+    assert key != MemoryInvocationCache.create_key(AddInvocation(id="1", a=1, b=2, use_cache=False))
+
+
+class SetModel(BaseModel):
+    values: set[int]
+
+
+def test_create_key_encodes_sets_in_a_stable_order():
+    # 8 and 16 collide in a small set, so they iterate in the order they were added, as strings would in an order
+    # that depends on hash randomization and so changes from one process to the next
+    model = SetModel(values=[8, 16])
+    reordered = SetModel(values=[16, 8])
+    assert list(model.values) != list(reordered.values)
+    assert create_content_key(model) == create_content_key(reordered)
+    assert create_content_key(model) != create_content_key(SetModel(values=[8]))
+
+
+@pytest.fixture
+def db() -> SqliteDatabase:
+    return SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+
+
+def create_sqlite_cache(db: SqliteDatabase, max_disk_size: int = 2**20) -> SqliteInvocationCache:
+    cache = SqliteInvocationCache(db, MemoryInvocationCache(max_cache_size=10), max_disk_size=max_disk_size)
+    cache.start(MagicMock())
+    return cache
+
+
+def test_sqlite_cache_survives_restart(db: SqliteDatabase):
+    output = ImageOutput(image=ImageField(image_name="a.png"), width=8, height=8)
+    create_sqlite_cache(db).save("key", output)
+
+    # A new instance has an empty memory tier, so the output must come from the database and be promoted
+    cache = create_sqlite_cache(db)
+    assert cache.references("a.png")
+    loaded = cache.get("key")
+    assert isinstance(loaded, ImageOutput)
+    assert loaded == output
+    assert cache._memory.get("key") == output
+    status = cache.get_status()
+    assert status.hits == 1
+    assert status.disk_size == 1
+
+
+def test_sqlite_cache_evicts_least_recently_used(db: SqliteDatabase):
+    output_size = len(ImageOutput(image=ImageField(image_name="a.png"), width=8, height=8).json())
+    cache = create_sqlite_cache(db, max_disk_size=2 * output_size)
+    cache.save("a", ImageOutput(image=ImageField(image_name="a.png"), width=8, height=8))
+    cache.save("b", ImageOutput(image=ImageField(image_name="b.png"), width=8, height=8))
+    cache = create_sqlite_cache(db, max_disk_size=2 * output_size)
+    cache.get("a")  # "b" is now the least recently used
+    cache.save("c", ImageOutput(image=ImageField(image_name="c.png"), width=8, height=8))
+    cache = create_sqlite_cache(db, max_disk_size=2 * output_size)
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert not cache.references("b.png")
+    assert cache.get_status().disk_bytes == 2 * output_size
+
+
+def test_sqlite_cache_deletes_persisted_outputs_by_match(db: SqliteDatabase):
+    cache = create_sqlite_cache(db)
+    cache.save("a", LatentsOutput(latents=LatentsField(latents_name="session__node"), width=8, height=8))
+    cache._delete_by_match("session__node")
+    cache = create_sqlite_cache(db)
+    assert not cache.references("session__node")
+    assert cache.get("a") is None
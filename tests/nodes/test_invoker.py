@@ -21,6 +21,7 @@ from invokeai.app.services.invocation_queue.invocation_queue_memory import Memor
 from invokeai.app.services.invocation_services import InvocationServices
 from invokeai.app.services.invocation_stats.invocation_stats_default import InvocationStatsService
 from invokeai.app.services.invoker import Invoker
+from invokeai.app.services.item_storage.graph_execution_state_sqlite import SqliteGraphExecutionStateStorage
 from invokeai.app.services.item_storage.item_storage_sqlite import SqliteItemStorage
 from invokeai.app.services.session_queue.session_queue_common import DEFAULT_QUEUE_ID
 from invokeai.app.services.shared.graph import Graph, GraphExecutionState, GraphInvocation, LibraryGraph
@@ -56,7 +57,7 @@ def mock_services() -> InvocationServices:
     configuration = InvokeAIAppConfig(use_memory_db=True, node_cache_size=0)
 
     # NOTE: none of these are actually called by the test invocations
-    graph_execution_manager = SqliteItemStorage[GraphExecutionState](db=db, table_name="graph_executions")
+    graph_execution_manager = SqliteGraphExecutionStateStorage(db=db, table_name="graph_executions")
     return InvocationServices(
         board_image_records=None,  # type: ignore
         board_images=None,  # type: ignore
@@ -71,8 +72,10 @@ def mock_services() -> InvocationServices:
         images=None,  # type: ignore
         invocation_cache=MemoryInvocationCache(max_cache_size=0),
         latents=None,  # type: ignore
+        latents_reclaimer=None,  # type: ignore
         logger=logging,  # type: ignore
         model_manager=None,  # type: ignore
+        model_prefetcher=None,  # type: ignore
         names=None,  # type: ignore
         performance_statistics=InvocationStatsService(),
         processor=DefaultInvocationProcessor(),
@@ -150,6 +153,35 @@ def test_can_invoke_all(mock_invoker: Invoker, simple_graph):
     assert g.is_complete()
 
 
+def test_invoke_all_enqueues_independent_nodes(mock_invoker: Invoker):
+    mock_invoker.services.configuration.node_workers = 2
+    g = mock_invoker.create_execution_state()
+    g.graph.add_node(PromptTestInvocation(id="1", prompt="Banana sushi"))
+    g.graph.add_node(PromptTestInvocation(id="2", prompt="Grape sushi"))
+    g.graph.add_node(TextToImageTestInvocation(id="3"))
+    g.graph.add_edge(create_edge("1", "prompt", "3", "prompt"))
+
+    mock_invoker.invoke(
+        session_queue_batch_id="1",
+        session_queue_item_id=1,
+        session_queue_id=DEFAULT_QUEUE_ID,
+        graph_execution_state=g,
+        invoke_all=True,
+    )
+    assert len(g.executing) == 2
+
+    def has_executed_all(g: GraphExecutionState):
+        g = mock_invoker.services.graph_execution_manager.get(g.id)
+        return g.is_complete()
+
+    wait_until(lambda: has_executed_all(g), timeout=5, interval=1)
+    mock_invoker.stop()
+
+    g = mock_invoker.services.graph_execution_manager.get(g.id)
+    assert g.executed_history.count("3") == 1
+    assert not g.executing
+
+
 # @pytest.mark.xfail(reason = "Requires fixing following the model manager refactor")
 def test_handles_errors(mock_invoker: Invoker):
     g = mock_invoker.create_execution_state()
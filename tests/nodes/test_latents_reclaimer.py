@@ -0,0 +1,62 @@
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+import torch
+
+from invokeai.app.services.latents_reclaimer import latents_reclaimer_default
+from invokeai.app.services.latents_reclaimer.latents_reclaimer_default import DiskLatentsReclaimer, get_session_id
+from invokeai.app.services.latents_storage.latents_storage_disk import DiskLatentsStorage
+from invokeai.app.services.latents_storage.latents_storage_forward_cache import ForwardCacheLatentsStorage
+
+SESSION_A = "7b4c3a4e-8d2f-4a5e-9c1b-2f3e4d5c6b7a"
+SESSION_B = "0f1e2d3c-4b5a-4697-8887-a9b8c7d6e5f4"
+
+
+def test_get_session_id():
+    assert get_session_id(f"{SESSION_A}__denoise") == SESSION_A
+    assert get_session_id(f"{SESSION_A}_compel_conditioning") == SESSION_A
+
+
+def test_reclaims_finished_sessions_and_leftovers(tmp_path: Path):
+    disk = DiskLatentsStorage(tmp_path)
+    disk.save("leftover__noise", torch.zeros(4))
+
+    latents = ForwardCacheLatentsStorage(disk)
+    invoker = MagicMock()
+    invoker.services.latents = latents
+    referenced = {f"{SESSION_A}__cached"}
+    invoker.services.invocation_cache.references.side_effect = lambda name: name in referenced
+
+    reclaimer = DiskLatentsReclaimer(tmp_path)
+    reclaimer.start(invoker)
+    latents.save(f"{SESSION_A}__denoise", torch.zeros(4))
+    latents.save(f"{SESSION_A}__cached", torch.zeros(4))
+    latents.save(f"{SESSION_B}__denoise", torch.zeros(4))
+    reclaimer.reclaim_session(SESSION_A)
+    reclaimer.stop()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([f"{SESSION_A}__cached", f"{SESSION_B}__denoise"])
+    status = reclaimer.get_status()
+    assert status.reclaimed_latents == 2
+    assert status.retained_latents == 1
+    assert status.tracked_sessions == 1
+    assert status.directory_files == 2
+
+
+def test_status_scans_directory_at_most_once_per_interval(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    disk = DiskLatentsStorage(tmp_path)
+    disk.save(f"{SESSION_A}__denoise", torch.zeros(4))
+    reclaimer = DiskLatentsReclaimer(tmp_path, enabled=False)
+    status = reclaimer.get_status()
+    assert status.directory_files == 1
+    assert status.directory_bytes == (tmp_path / f"{SESSION_A}__denoise").stat().st_size
+
+    # The directory may hold millions of files, so the status reuses the last scan
+    disk.save(f"{SESSION_B}__denoise", torch.zeros(4))
+    assert reclaimer.get_status() == status
+
+    monkeypatch.setattr(latents_reclaimer_default, "DIRECTORY_SCAN_INTERVAL", 0.0)
+    rescanned = reclaimer.get_status()
+    assert rescanned.directory_files == 2
+    assert rescanned.directory_scanned_at >= status.directory_scanned_at
@@ -0,0 +1,156 @@
+import mmap
+from pathlib import Path
+from threading import Event
+from typing import Iterator
+from unittest.mock import MagicMock
+
+import pytest
+import torch
+
+from invokeai.app.services.latents_storage.latents_storage_base import LatentsStorageBase
+from invokeai.app.services.latents_storage.latents_storage_common import LatentsCacheStats
+from invokeai.app.services.latents_storage.latents_storage_disk import DiskLatentsStorage
+from invokeai.app.services.latents_storage.latents_storage_forward_cache import ForwardCacheLatentsStorage
+from invokeai.app.services.latents_storage.latents_storage_mmap import MmapLatentsStorage
+
+
+@pytest.fixture(params=[True, False], ids=["mapped", "read"])
+def mmap_storage(tmp_path: Path, request: pytest.FixtureRequest) -> MmapLatentsStorage:
+    # Files are read rather than mapped on Windows
+    return MmapLatentsStorage(tmp_path, map_files=request.param)
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float16, torch.bfloat16, torch.int64, torch.bool])
+def test_mmap_storage_round_trip(mmap_storage: MmapLatentsStorage, dtype: torch.dtype):
+    tensor = torch.randn(1, 4, 8, 8).to(dtype)
+    mmap_storage.save("1", tensor)
+    loaded = mmap_storage.get("1")
+    assert loaded.dtype == dtype
+    assert torch.equal(loaded, tensor)
+
+
+def test_mmap_storage_handles_empty_and_scalar_tensors(mmap_storage: MmapLatentsStorage):
+    mmap_storage.save("empty", torch.empty(0, 4))
+    mmap_storage.save("scalar", torch.tensor(3.0))
+    assert mmap_storage.get("empty").shape == (0, 4)
+    assert torch.equal(mmap_storage.get("scalar"), torch.tensor(3.0))
+
+
+def test_mmap_storage_writes_do_not_reach_file(mmap_storage: MmapLatentsStorage):
+    mmap_storage.save("1", torch.zeros(16))
+    loaded = mmap_storage.get("1")
+    loaded += 1
+    assert torch.equal(mmap_storage.get("1"), torch.zeros(16))
+
+
+def test_mmap_storage_overwrite_keeps_mapped_tensor(mmap_storage: MmapLatentsStorage):
+    mmap_storage.save("1", torch.zeros(16))
+    loaded = mmap_storage.get("1")
+    mmap_storage.save("1", torch.ones(16))
+    assert torch.equal(loaded, torch.zeros(16))
+    assert torch.equal(mmap_storage.get("1"), torch.ones(16))
+
+
+def test_mmap_storage_without_mapping_leaves_files_free(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    storage = MmapLatentsStorage(tmp_path, map_files=False)
+    storage.save("1", torch.zeros(16))
+    with monkeypatch.context() as m:
+        m.setattr(mmap, "mmap", MagicMock(side_effect=AssertionError("Files are not mapped")))
+        loaded = storage.get("1")
+    # Nothing keeps the file open, so it can be replaced and deleted while the tensor is in use
+    storage.save("1", torch.ones(16))
+    storage.delete("1")
+    assert torch.equal(loaded, torch.zeros(16))
+
+
+def test_mmap_storage_falls_back_to_torch_save_for_other_objects(mmap_storage: MmapLatentsStorage):
+    data = {"conditioning": torch.randn(2, 77, 768), "pooled": None}
+    mmap_storage.save("1", data)  # type: ignore
+    loaded = mmap_storage.get("1")
+    assert torch.equal(loaded["conditioning"], data["conditioning"])  # type: ignore
+
+
+def test_mmap_storage_reads_files_from_disk_storage(tmp_path: Path):
+    tensor = torch.randn(1, 4, 8, 8)
+    DiskLatentsStorage(tmp_path).save("1", tensor)
+    assert torch.equal(MmapLatentsStorage(tmp_path).get("1"), tensor)
+
+
+class BlockingLatentsStorage(LatentsStorageBase):
+    """In-memory storage whose writes wait until `unblock` is set"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.items: dict[str, torch.Tensor] = {}
+        self.unblock = Event()
+
+    def get(self, name: str) -> torch.Tensor:
+        return self.items[name]
+
+    def save(self, name: str, data: torch.Tensor) -> None:
+        self.unblock.wait()
+        self.items[name] = data
+
+    def delete(self, name: str) -> None:
+        if name not in self.items:
+            raise FileNotFoundError(name)
+        del self.items[name]
+
+
+def test_forward_cache_evicts_least_recently_used_by_size():
+    underlying = BlockingLatentsStorage()
+    underlying.unblock.set()
+    stats = LatentsCacheStats()
+    storage = ForwardCacheLatentsStorage(underlying, max_cache_size=48)
+    storage.collect_cache_stats(stats)
+    storage.save("1", torch.zeros(4))  # 16 bytes
+    storage.save("2", torch.zeros(4))
+    storage.get("1")  # "2" is now the least recently used
+    storage.save("3", torch.zeros(8))  # 32 bytes, must evict "2" only
+    underlying.items.clear()
+    storage.get("1")
+    storage.get("3")
+    with pytest.raises(KeyError):
+        storage.get("2")
+    assert stats.evicted == 1
+    assert stats.hits == 3
+    assert stats.misses == 1
+    assert stats.high_watermark == 48
+
+
+@pytest.fixture
+def write_behind() -> Iterator[tuple[ForwardCacheLatentsStorage, BlockingLatentsStorage]]:
+    underlying = BlockingLatentsStorage()
+    storage = ForwardCacheLatentsStorage(underlying, max_cache_size=16, write_behind=True)
+    storage.start(MagicMock())
+    yield storage, underlying
+    underlying.unblock.set()
+    storage.stop(MagicMock())
+
+
+def test_write_behind_serves_pending_writes_from_memory(write_behind):
+    storage, underlying = write_behind
+    first = torch.zeros(4)
+    storage.save("1", first)
+    storage.save("2", torch.ones(4))  # evicts "1" from the cache, but its write is still pending
+    assert "1" not in underlying.items
+    assert storage.get("1") is first
+
+
+def test_write_behind_flushes_on_stop(write_behind):
+    storage, underlying = write_behind
+    storage.save("1", torch.zeros(4))
+    underlying.unblock.set()
+    storage.stop(MagicMock())
+    assert torch.equal(underlying.items["1"], torch.zeros(4))
+
+
+def test_write_behind_delete_cancels_pending_write(write_behind):
+    storage, underlying = write_behind
+    storage.save("1", torch.zeros(4))
+    storage.save("2", torch.zeros(4))
+    storage.delete("2")
+    underlying.unblock.set()
+    storage.flush()
+    assert "1" in underlying.items
+    assert "2" not in underlying.items
@@ -0,0 +1,62 @@
+import time
+from unittest.mock import MagicMock
+
+from invokeai.app.invocations.model import LoraLoaderInvocation, LoRAModelField, MainModelField
+from invokeai.app.invocations.primitives import StringInvocation
+from invokeai.app.invocations.sdxl import SDXLModelLoaderInvocation
+from invokeai.app.services.model_prefetcher.model_prefetcher_common import PrefetchModel, get_graph_models
+from invokeai.app.services.model_prefetcher.model_prefetcher_default import DefaultModelPrefetcher
+from invokeai.app.services.shared.graph import Graph
+from invokeai.backend.model_management.models import BaseModelType, ModelType, SubModelType
+
+SDXL = BaseModelType.StableDiffusionXL
+
+
+def create_graph(lora_name: str) -> Graph:
+    graph = Graph()
+    graph.add_node(
+        SDXLModelLoaderInvocation(
+            id="model", model=MainModelField(model_name="sdxl", base_model=SDXL, model_type=ModelType.Main)
+        )
+    )
+    graph.add_node(LoraLoaderInvocation(id="lora", lora=LoRAModelField(model_name=lora_name, base_model=SDXL)))
+    graph.add_node(StringInvocation(id="prompt", value="Banana sushi"))
+    return graph
+
+
+def test_get_graph_models():
+    assert get_graph_models(create_graph("lora_1")) == [
+        PrefetchModel("sdxl", SDXL, ModelType.Main, SubModelType.UNet),
+        PrefetchModel("sdxl", SDXL, ModelType.Main, SubModelType.TextEncoder),
+        PrefetchModel("sdxl", SDXL, ModelType.Main, SubModelType.TextEncoder2),
+        PrefetchModel("sdxl", SDXL, ModelType.Main, SubModelType.Vae),
+        PrefetchModel("lora_1", SDXL, ModelType.Lora),
+    ]
+
+
+def test_prefetches_pending_items_models_once():
+    invoker = MagicMock()
+    invoker.services.session_queue.get_pending_graphs.return_value = [create_graph("lora_1"), create_graph("lora_2")]
+    # A model that fails to load does not stop the others from being prefetched
+    invoker.services.model_manager.prefetch_model.side_effect = [True, Exception("Not found"), True, True, True, True]
+
+    prefetcher = DefaultModelPrefetcher(lookahead=2)
+    prefetcher.start(invoker)
+    prefetcher.prefetch()
+    deadline = time.time() + 5
+    while invoker.services.model_manager.prefetch_model.call_count < 6 and time.time() < deadline:
+        time.sleep(0.01)
+    prefetcher.stop()
+
+    invoker.services.session_queue.get_pending_graphs.assert_called_once_with(2)
+    prefetched = [c.kwargs["model_name"] for c in invoker.services.model_manager.prefetch_model.call_args_list]
+    assert prefetched == ["sdxl"] * 4 + ["lora_1", "lora_2"]
+
+
+def test_does_not_prefetch_without_lookahead():
+    invoker = MagicMock()
+    prefetcher = DefaultModelPrefetcher(lookahead=0)
+    prefetcher.start(invoker)
+    prefetcher.prefetch()
+    prefetcher.stop()
+    invoker.services.session_queue.get_pending_graphs.assert_not_called()
@@ -17,6 +17,7 @@ from invokeai.app.services.shared.graph import (
     Edge,
     EdgeConnection,
     Graph,
+    GraphExecutionState,
     GraphInvocation,
     InvalidEdgeError,
     IterateInvocation,
@@ -176,6 +177,25 @@ def test_graph_adds_edge():
     assert e in g.edges
 
 
+def test_graph_deletes_edge():
+    g = Graph()
+    n1 = TextToImageTestInvocation(id="1", prompt="Banana sushi")
+    n2 = ESRGANInvocation(id="2")
+    g.add_node(n1)
+    g.add_node(n2)
+    e = create_edge(n1.id, "image", n2.id, "image")
+    g.add_edge(e)
+
+    g.delete_edge(e)
+
+    assert e not in g.edges
+    assert g._get_input_edges(n2.id, "image") == []
+    assert g._get_output_edges(n1.id, "image") == []
+    # The destination field can be connected again
+    g.add_edge(e)
+    assert g._get_input_edges(n2.id, "image") == [e]
+
+
 def test_graph_fails_to_add_edge_with_cycle():
     g = Graph()
     n1 = ESRGANInvocation(id="1")
@@ -582,6 +602,53 @@ def test_graph_gets_networkx_graph():
     assert ("1", "2") in nxg.edges
 
 
+def test_graph_networkx_graphs_follow_changes():
+    g = Graph()
+    n1 = GraphInvocation(id="1")
+    n1.graph = Graph()
+    n1.graph.add_node(AddInvocation(id="1", a=1, b=2))
+    g.add_node(n1)
+    g.add_node(AddInvocation(id="2", b=5))
+    assert set(g.nx_graph_flat().nodes) == set(["1.1", "2"])
+
+    e = create_edge("1.1", "value", "2", "a")
+    g.add_edge(e)
+    assert set(g.nx_graph().edges) == set([("1.1", "2")])
+    assert set(g.nx_graph_flat().edges) == set([("1.1", "2")])
+
+    g.delete_edge(e)
+    assert set(g.nx_graph_flat().edges) == set()
+
+    # Changes to subgraphs are seen by the graph containing them
+    g.get_node("1").graph.add_node(SubtractInvocation(id="2", b=3))
+    assert set(g.nx_graph_flat().nodes) == set(["1.1", "1.2", "2"])
+    g.delete_node("1.1")
+    assert set(g.nx_graph_flat().nodes) == set(["1.2", "2"])
+
+
+def test_graph_networkx_graphs_follow_changes_to_copies():
+    g = Graph()
+    n1 = GraphInvocation(id="1")
+    n1.graph = Graph()
+    n1.graph.add_node(AddInvocation(id="1", a=1, b=2))
+    g.add_node(n1)
+
+    # An execution state keeps the graph it is given, so it sees the changes made through it
+    state = GraphExecutionState(graph=g)
+    assert set(state.graph.nx_graph_flat().nodes) == set(["1.1"])
+    g.add_node(AddInvocation(id="2", b=5))
+    assert set(state.graph.nx_graph_flat().nodes) == set(["1.1", "2"])
+
+    # Copies derive their own graphs, which follow their own changes only
+    deep_copy = g.copy(deep=True)
+    deep_copy.get_node("1").graph.add_node(SubtractInvocation(id="2", b=3))
+    assert set(deep_copy.nx_graph_flat().nodes) == set(["1.1", "1.2", "2"])
+    shallow_copy = g.copy()
+    shallow_copy.add_node(SubtractInvocation(id="3", b=3))
+    assert set(shallow_copy.nx_graph_flat().nodes) == set(["1.1", "2", "3"])
+    assert set(g.nx_graph_flat().nodes) == set(["1.1", "2"])
+
+
 # TODO: Graph serializes and deserializes
 def test_graph_can_serialize():
     g = Graph()
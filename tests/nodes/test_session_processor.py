@@ -0,0 +1,135 @@
+from typing import Optional
+from unittest.mock import MagicMock
+
+import pytest
+
+from invokeai.app.services.invocation_processor.invocation_processor_default import DefaultInvocationProcessor
+from invokeai.app.services.invocation_queue.invocation_queue_common import InvocationQueueItem
+from invokeai.app.services.session_processor.session_processor_default import POLLING_INTERVAL, DefaultSessionProcessor
+from invokeai.app.services.session_queue.session_queue_common import SessionQueueItem
+from invokeai.app.services.shared.graph import Graph, GraphExecutionState
+
+from .test_nodes import wait_until
+
+
+def create_queue_item(item_id: int) -> SessionQueueItem:
+    session = GraphExecutionState(graph=Graph())
+    return SessionQueueItem(
+        item_id=item_id,
+        batch_id="batch",
+        queue_id="default",
+        session_id=session.id,
+        session=session,
+        created_at="",
+        updated_at="",
+        started_at=None,
+        completed_at=None,
+    )
+
+
+def create_invocation_queue_item(queue_item: SessionQueueItem) -> InvocationQueueItem:
+    return InvocationQueueItem(
+        graph_execution_state_id=queue_item.session_id,
+        invocation_id="1",
+        session_queue_id=queue_item.queue_id,
+        session_queue_item_id=queue_item.item_id,
+        session_queue_batch_id=queue_item.batch_id,
+    )
+
+
+@pytest.fixture
+def queue_items() -> list[SessionQueueItem]:
+    return [create_queue_item(1), create_queue_item(2)]
+
+
+@pytest.fixture
+def invoker(queue_items: list[SessionQueueItem]) -> MagicMock:
+    invoker = MagicMock()
+    invoker.services.processor = DefaultInvocationProcessor()
+    pending = list(queue_items)
+
+    def dequeue(cpu_only: bool = False) -> Optional[SessionQueueItem]:
+        return pending.pop(0) if pending else None
+
+    invoker.services.session_queue.dequeue.side_effect = dequeue
+    return invoker
+
+
+@pytest.fixture
+def session_processor(invoker: MagicMock):
+    session_processor = DefaultSessionProcessor()
+    session_processor.start(invoker)
+    yield session_processor
+    session_processor.stop()
+    session_processor._poll_now()
+
+
+def test_next_item_starts_when_session_completes(invoker, session_processor, queue_items):
+    wait_until(lambda: invoker.invoke.call_count == 1, timeout=POLLING_INTERVAL)
+    session = queue_items[0].session
+    invoker.services.processor._on_session_complete(create_invocation_queue_item(queue_items[0]), session)
+    invoker.services.session_queue.complete_queue_item.assert_called_once_with(1)
+
+    # The next item starts well within the polling interval
+    wait_until(lambda: invoker.invoke.call_count == 2, timeout=POLLING_INTERVAL / 2)
+    assert invoker.invoke.call_args.kwargs["session_queue_item_id"] == 2
+    status = session_processor.get_status()
+    assert status.items_started == 2
+    assert 0 < status.last_idle_time == status.max_idle_time == status.idle_time < POLLING_INTERVAL / 2
+
+
+def test_session_with_errors_fails_queue_item(invoker, session_processor, queue_items):
+    wait_until(lambda: invoker.invoke.call_count == 1, timeout=POLLING_INTERVAL)
+    session = queue_items[0].session
+    session.errors["1"] = "Traceback"
+    invoker.services.processor._on_session_complete(create_invocation_queue_item(queue_items[0]), session)
+    invoker.services.session_queue.fail_queue_item.assert_called_once_with(1, "Traceback")
+
+
+def test_late_events_do_not_finish_the_next_item(invoker, session_processor, queue_items):
+    wait_until(lambda: invoker.invoke.call_count == 1, timeout=POLLING_INTERVAL)
+    invoker.services.processor._on_session_complete(
+        create_invocation_queue_item(queue_items[0]), queue_items[0].session
+    )
+    wait_until(lambda: invoker.invoke.call_count == 2, timeout=POLLING_INTERVAL)
+    # The first item's events are handled after the second item started
+    assert not session_processor._finish_queue_item(1)
+    assert session_processor.get_status().is_processing
+
+
+def test_workers_process_items_concurrently(invoker, queue_items):
+    queue_items.append(create_queue_item(3))
+    pending = list(queue_items)
+    invoker.services.session_queue.dequeue.side_effect = lambda cpu_only: pending.pop(0) if pending else None
+    session_processor = DefaultSessionProcessor(workers=2)
+    session_processor.start(invoker)
+    try:
+        wait_until(lambda: invoker.invoke.call_count == 2, timeout=POLLING_INTERVAL)
+        status = session_processor.get_status()
+        assert sorted(worker.queue_item_id for worker in status.workers) == [1, 2]
+
+        # Completing one item only frees its own worker
+        invoker.services.processor._on_session_complete(
+            create_invocation_queue_item(queue_items[1]), queue_items[1].session
+        )
+        wait_until(lambda: invoker.invoke.call_count == 3, timeout=POLLING_INTERVAL / 2)
+        status = session_processor.get_status()
+        assert sorted(worker.queue_item_id for worker in status.workers) == [1, 3]
+        assert status.items_started == 3
+    finally:
+        session_processor.stop()
+        session_processor._poll_now()
+
+
+def test_cpu_only_workers_dequeue_cpu_only_items(invoker, queue_items):
+    cpu_item = create_queue_item(3)
+    invoker.services.session_queue.dequeue.side_effect = lambda cpu_only: cpu_item if cpu_only else queue_items[0]
+    session_processor = DefaultSessionProcessor(workers=1, cpu_workers=1)
+    session_processor.start(invoker)
+    try:
+        wait_until(lambda: invoker.invoke.call_count == 2, timeout=POLLING_INTERVAL)
+        status = session_processor.get_status()
+        assert [(worker.cpu_only, worker.queue_item_id) for worker in status.workers] == [(False, 1), (True, 3)]
+    finally:
+        session_processor.stop()
+        session_processor._poll_now()
@@ -1,17 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
 import pytest
 from pydantic import ValidationError, parse_raw_as
 
+from invokeai.app.invocations.image import ImageBlurInvocation
+from invokeai.app.invocations.model import MainModelField, MainModelLoaderInvocation
+from invokeai.app.invocations.noise import NoiseInvocation
+from invokeai.app.invocations.primitives import StringInvocation
+from invokeai.app.services.config.config_default import InvokeAIAppConfig
 from invokeai.app.services.session_queue.session_queue_common import (
     Batch,
     BatchDataCollection,
     BatchDatum,
+    BatchIdExistsError,
     NodeFieldValue,
+    SessionQueueCurrentItem,
     calc_session_count,
+    create_session,
     create_session_nfv_tuples,
+    plan_batch,
     populate_graph,
     prepare_values_to_insert,
+    uses_execution_device,
 )
-from invokeai.app.services.shared.graph import Graph, GraphExecutionState, GraphInvocation
+from invokeai.app.services.session_queue.session_queue_sqlite import SqliteSessionQueue
+from invokeai.app.services.shared.graph import Graph, GraphInvocation
+from invokeai.app.services.shared.sqlite import SqliteDatabase
+from invokeai.backend.model_management.models import BaseModelType, ModelType
+from invokeai.backend.util.logging import InvokeAILogger
 from tests.nodes.test_nodes import PromptTestInvocation
 
 
@@ -145,22 +162,60 @@ def test_calc_session_count(batch_data_collection, batch_graph):
     assert calc_session_count(batch=b) == 8
 
 
+def test_calc_session_count_matches_created_sessions(batch_data_collection, batch_graph):
+    b = Batch(graph=batch_graph, data=batch_data_collection, runs=3)
+    assert calc_session_count(b) == len(list(create_session_nfv_tuples(b, 1000))) == 12
+    assert calc_session_count(Batch(graph=batch_graph, runs=3)) == 3
+    assert calc_session_count(Batch(graph=batch_graph, data=[[]])) == 0
+
+
+def test_calc_session_count_does_not_create_product(batch_graph):
+    # 1000 ** 3 * 100 sessions would not fit in memory
+    items = list(range(1000))
+    b = Batch(
+        graph=batch_graph,
+        data=[[BatchDatum(node_path=node_path, field_name="prompt", items=items)] for node_path in ("1", "2", "3")],
+        runs=100,
+    )
+    assert calc_session_count(b) == 1000**3 * 100
+
+
+def test_plan_batch(batch_data_collection, batch_graph):
+    b = Batch(graph=batch_graph, data=batch_data_collection, runs=2)
+    plan = plan_batch(b, max_new_queue_items=100)
+    assert plan.requested == plan.accepted == 8
+    assert plan.sessions_per_run == 4
+    assert plan.batch_data_sizes == [2, 2]
+    assert plan.accepted_runs == 2
+    assert not plan.truncated
+
+    plan = plan_batch(b, max_new_queue_items=5)
+    assert plan.requested == 8
+    assert plan.accepted == 5
+    assert plan.accepted_runs == 1
+    assert plan.truncated
+
+    assert plan_batch(b, max_new_queue_items=-1).accepted == 0
+
+
 def test_prepare_values_to_insert(batch_data_collection, batch_graph):
     b = Batch(graph=batch_graph, data=batch_data_collection, runs=2)
     values = prepare_values_to_insert(queue_id="default", batch=b, priority=0, max_new_queue_items=1000)
     assert len(values) == 8
 
-    # graph should be serialized
-    ges = parse_raw_as(GraphExecutionState, values[0].session)
+    # sessions are created at dequeue, from the batch's graph and the field values
+    assert all(v.session is None for v in values)
+    field_values = parse_raw_as(list[NodeFieldValue], values[0].field_values)
+    ges = create_session(b.graph, values[0].session_id, field_values)
 
     # graph values should be populated
+    assert ges.id == values[0].session_id
     assert ges.graph.get_node("1").prompt == "Banana sushi"
     assert ges.graph.get_node("2").prompt == "Strawberry sushi"
     assert ges.graph.get_node("3").prompt == "Orange sushi"
     assert ges.graph.get_node("4").prompt == "Nissan"
-
-    # session ids should match deserialized graph
-    assert [v.session_id for v in values] == [parse_raw_as(GraphExecutionState, v.session).id for v in values]
+    # the batch's graph is left untouched
+    assert b.graph.get_node("1").prompt == "Chevy"
 
     # should unique session ids
     sids = [v.session_id for v in values]
@@ -168,7 +223,7 @@ def test_prepare_values_to_insert(batch_data_collection, batch_graph):
 
     # should have 3 node field values
     assert type(values[0].field_values) is str
-    assert len(parse_raw_as(list[NodeFieldValue], values[0].field_values)) == 3
+    assert len(field_values) == 3
 
     # should have batch id and priority
     assert all(v.batch_id == b.batch_id for v in values)
@@ -253,3 +308,255 @@ def test_cannot_create_bad_batch_fields_exist(
                 ],
             ],
         )
+
+
+@pytest.fixture
+def db() -> SqliteDatabase:
+    return SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+
+
+@pytest.fixture
+def session_queue(db: SqliteDatabase) -> SqliteSessionQueue:
+    invoker = MagicMock()
+    invoker.services.configuration.get_config.return_value = InvokeAIAppConfig(max_queue_size=100)
+    session_queue = SqliteSessionQueue(db=db)
+    session_queue.start(invoker)
+    return session_queue
+
+
+def test_sessions_are_created_at_dequeue(db, session_queue):
+    # Sessions are parsed back from the database, so this needs nodes from the app rather than the test nodes
+    graph = Graph()
+    for node_id in ("1", "2", "3"):
+        graph.add_node(StringInvocation(id=node_id, value=""))
+    b = Batch(
+        graph=graph,
+        data=[
+            [
+                BatchDatum(node_path="1", field_name="value", items=["Banana sushi", "Grape sushi"]),
+                BatchDatum(node_path="2", field_name="value", items=["Strawberry sushi", "Blueberry sushi"]),
+            ],
+            [BatchDatum(node_path="3", field_name="value", items=["Orange sushi", "Apple sushi"])],
+        ],
+        runs=2,
+    )
+    result = session_queue.enqueue_batch(queue_id="default", batch=b, prepend=False)
+    assert result.enqueued == 8
+    assert db.conn.execute("SELECT COUNT(*) FROM session_queue WHERE session IS NULL").fetchone()[0] == 8
+    assert db.conn.execute("SELECT COUNT(*) FROM session_queue_batches").fetchone()[0] == 1
+
+    queue_item = session_queue.dequeue()
+    assert queue_item is not None
+    assert queue_item.status == "in_progress"
+    assert queue_item.session.id == queue_item.session_id
+    assert queue_item.session.graph.get_node("1").value == "Banana sushi"
+    assert queue_item.session.graph.get_node("3").value == "Orange sushi"
+    # the session is stored once it has been created
+    assert db.conn.execute("SELECT COUNT(*) FROM session_queue WHERE session IS NULL").fetchone()[0] == 7
+    assert session_queue.get_queue_item(queue_item.item_id).session == queue_item.session
+    # pending items get their session when they are read
+    next_item = session_queue.get_next("default")
+    assert next_item is not None
+    assert next_item.session.graph.get_node("3").value == "Apple sushi"
+
+    session_queue.clear("default")
+    assert db.conn.execute("SELECT COUNT(*) FROM session_queue_batches").fetchone()[0] == 0
+
+
+def test_enqueue_batch_with_the_same_id(session_queue):
+    graph = Graph()
+    graph.add_node(StringInvocation(id="1", value="Banana sushi"))
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(batch_id="batch", graph=graph), prepend=False)
+    # The same graph only adds queue items
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(batch_id="batch", graph=graph), prepend=False)
+
+    other_graph = Graph()
+    other_graph.add_node(StringInvocation(id="1", value="Grape sushi"))
+    with pytest.raises(BatchIdExistsError):
+        session_queue.enqueue_batch(queue_id="default", batch=Batch(batch_id="batch", graph=other_graph), prepend=False)
+    # The queued items keep their graph
+    items = [session_queue.dequeue(), session_queue.dequeue()]
+    assert [item.session.graph.get_node("1").value for item in items if item is not None] == ["Banana sushi"] * 2
+    assert session_queue.dequeue() is None
+
+    # Once no queue item is created from the graph, it can be replaced
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(batch_id="batch", graph=other_graph), prepend=False)
+    item = session_queue.dequeue()
+    assert item is not None
+    assert item.session.graph.get_node("1").value == "Grape sushi"
+
+
+def test_session_column_is_migrated_to_nullable(db):
+    db.conn.execute(
+        """
+        CREATE TABLE session_queue (
+            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            batch_id TEXT NOT NULL,
+            queue_id TEXT NOT NULL,
+            session_id TEXT NOT NULL UNIQUE,
+            field_values TEXT,
+            session TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            priority INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
+            updated_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW')),
+            started_at DATETIME,
+            completed_at DATETIME
+        );
+        """
+    )
+    db.conn.execute(
+        "INSERT INTO session_queue (batch_id, queue_id, session_id, session) VALUES ('b', 'default', 's', '{}')"
+    )
+    SqliteSessionQueue(db=db)
+    columns = {row["name"]: row for row in db.conn.execute("PRAGMA table_info(session_queue)")}
+    assert not columns["session"]["notnull"]
+    assert [tuple(row) for row in db.conn.execute("SELECT session_id, session FROM session_queue")] == [("s", "{}")]
+
+
+def test_enqueue_batch_is_truncated_as_planned(session_queue, batch_data_collection, batch_graph):
+    session_queue._SqliteSessionQueue__invoker.services.configuration.get_config.return_value = InvokeAIAppConfig(
+        max_queue_size=5
+    )
+    b = Batch(graph=batch_graph, data=batch_data_collection, runs=2)
+    plan = session_queue.plan_batch(queue_id="default", batch=b)
+    assert (plan.requested, plan.accepted) == (8, 5)
+    result = session_queue.enqueue_batch(queue_id="default", batch=b, prepend=False)
+    assert (result.requested, result.enqueued) == (8, 5)
+    assert session_queue.plan_batch(queue_id="default", batch=b).accepted == 0
+
+
+def test_single_column_indices_are_replaced(db):
+    SqliteSessionQueue(db=db)
+    db.conn.execute("CREATE INDEX idx_session_queue_created_status ON session_queue(status);")
+    SqliteSessionQueue(db=db)
+    indices = {row[0] for row in db.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "idx_session_queue_created_status" not in indices
+    assert "idx_session_queue_status_priority" in indices
+    plan = db.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT item_id FROM session_queue WHERE status = 'pending' ORDER BY priority DESC, item_id"
+    ).fetchall()
+    assert "USING COVERING INDEX idx_session_queue_status_priority" in plan[0][3]
+
+
+def test_dequeue_follows_priority_then_order(session_queue):
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=Graph(), runs=2), prepend=False)
+    prepended = session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=Graph()), prepend=True)
+    first = session_queue.dequeue()
+    assert first is not None and first.batch_id == prepended.batch.batch_id
+    second = session_queue.dequeue()
+    third = session_queue.dequeue()
+    assert second is not None and third is not None and second.item_id < third.item_id
+    assert session_queue.dequeue() is None
+
+
+def test_concurrent_dequeues_claim_different_items(session_queue):
+    session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=Graph(), runs=8), prepend=False)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        queue_items = list(executor.map(lambda _: session_queue.dequeue(), range(10)))
+    item_ids = [queue_item.item_id for queue_item in queue_items if queue_item is not None]
+    assert len(item_ids) == len(set(item_ids)) == 8
+
+
+def test_list_queue_items_cursor_stays_in_queue(session_queue):
+    session_queue.enqueue_batch(queue_id="a", batch=Batch(graph=Graph(), runs=3), prepend=False)
+    session_queue.enqueue_batch(queue_id="b", batch=Batch(graph=Graph(), runs=3), prepend=False)
+    page = session_queue.list_queue_items(queue_id="a", limit=1, priority=0, status="pending")
+    next_page = session_queue.list_queue_items(
+        queue_id="a", limit=10, priority=0, cursor=page.items[0].item_id, status="pending"
+    )
+    assert [item.queue_id for item in next_page.items] == ["a", "a"]
+
+
+def test_get_pending_graphs(session_queue):
+    graph = Graph()
+    graph.add_node(StringInvocation(id="1", value=""))
+    b = Batch(
+        graph=graph,
+        data=[[BatchDatum(node_path="1", field_name="value", items=["Banana sushi", "Grape sushi", "Apple sushi"])]],
+    )
+    session_queue.enqueue_batch(queue_id="default", batch=b, prepend=False)
+    session_queue.dequeue()
+    # Items that were dequeued are not pending, and pending items' graphs are created from their batch's graph
+    graphs = session_queue.get_pending_graphs(limit=5)
+    assert [g.get_node("1").value for g in graphs] == ["Grape sushi", "Apple sushi"]
+    assert len(session_queue.get_pending_graphs(limit=1)) == 1
+
+
+@pytest.mark.parametrize("cancel_by", ["batch_ids", "queue_id"])
+def test_cancel_stops_every_session_in_progress(session_queue, cancel_by):
+    batch = session_queue.enqueue_batch(queue_id="default", batch=Batch(graph=Graph(), runs=3), prepend=False).batch
+    # Two session processor workers each executing an item
+    in_progress = [session_queue.dequeue(), session_queue.dequeue()]
+    status = session_queue.get_queue_status("default")
+    assert status.in_progress == 2
+    assert status.current_items == [
+        SessionQueueCurrentItem(item_id=item.item_id, batch_id=item.batch_id, session_id=item.session_id)
+        for item in in_progress
+    ]
+
+    if cancel_by == "batch_ids":
+        result = session_queue.cancel_by_batch_ids("default", [batch.batch_id])
+    else:
+        result = session_queue.cancel_by_queue_id("default")
+    assert result.canceled == 3
+
+    services = session_queue._SqliteSessionQueue__invoker.services
+    canceled = [c.args[0] for c in services.queue.cancel.call_args_list]
+    assert sorted(canceled) == sorted(item.session_id for item in in_progress)
+    assert services.events.emit_session_canceled.call_count == 2
+    assert session_queue.get_in_progress("default") == []
+    assert session_queue.get_queue_status("default").current_items == []
+
+
+def create_model_graph() -> Graph:
+    graph = Graph()
+    graph.add_node(
+        MainModelLoaderInvocation(
+            id="model",
+            model=MainModelField(
+                model_name="sd-1", base_model=BaseModelType.StableDiffusion1, model_type=ModelType.Main
+            ),
+        )
+    )
+    return graph
+
+
+def test_uses_execution_device():
+    assert uses_execution_device(create_model_graph())
+    image_graph = Graph()
+    image_graph.add_node(ImageBlurInvocation(id="blur"))
+    assert not uses_execution_device(image_graph)
+    # Nodes that use the device directly, and nodes in subgraphs, count too
+    image_graph.add_node(NoiseInvocation(id="noise"))
+    assert uses_execution_device(image_graph)
+    assert uses_execution_device(Graph(nodes={"graph": GraphInvocation(id="graph", graph=create_model_graph())}))
+
+
+def test_cpu_only_dequeue_skips_sessions_using_the_device(session_queue):
+    session_queue.enqueue_graph(queue_id="default", graph=create_model_graph(), prepend=False)
+    image_graph = Graph()
+    image_graph.add_node(StringInvocation(id="1", value="Banana sushi"))
+    session_queue.enqueue_graph(queue_id="default", graph=image_graph, prepend=False)
+
+    cpu_item = session_queue.dequeue(cpu_only=True)
+    assert cpu_item is not None and cpu_item.session.graph.get_node("1").value == "Banana sushi"
+    assert session_queue.dequeue(cpu_only=True) is None
+    device_item = session_queue.dequeue()
+    assert device_item is not None and device_item.session.graph.get_node("model").type == "main_model_loader"
+
+
+def test_batches_are_migrated_to_cpu_only(db):
+    db.conn.execute(
+        """
+        CREATE TABLE session_queue_batches (
+            batch_id TEXT NOT NULL PRIMARY KEY,
+            graph TEXT NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT(STRFTIME('%Y-%m-%d %H:%M:%f', 'NOW'))
+        );
+        """
+    )
+    db.conn.execute("INSERT INTO session_queue_batches (batch_id, graph) VALUES ('b', '{}')")
+    SqliteSessionQueue(db=db)
+    assert [tuple(row) for row in db.conn.execute("SELECT batch_id, cpu_only FROM session_queue_batches")] == [("b", 0)]
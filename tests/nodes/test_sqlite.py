@@ -1,3 +1,8 @@
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import pytest
 from pydantic import BaseModel, Field
 
@@ -132,3 +137,60 @@ def test_sqlite_service_can_search_with_pagination_and_offset(db: SqliteItemStor
     assert results.per_page == 2
     assert results.total == 3
     assert results.items == [TestModel(id="3", name="Test")]
+
+
+def test_file_database_reads_do_not_wait_for_writer(tmp_path: Path):
+    sqlite_db = SqliteDatabase(InvokeAIAppConfig(root=tmp_path, db_read_connections=1), InvokeAILogger.get_logger())
+    assert sqlite_db.conn.execute("PRAGMA journal_mode;").fetchone()[0] == "wal"
+    storage = SqliteItemStorage[TestModel](db=sqlite_db, table_name="test", id_field="id")
+    storage.set(TestModel(id="1", name="Test"))
+
+    with sqlite_db.lock:
+        # An uncommitted write on the read-write connection is not visible to readers, and doesn't block them
+        sqlite_db.conn.execute("""DELETE FROM test;""")
+        with sqlite_db.read() as conn:
+            assert conn.execute("""SELECT COUNT(*) FROM test;""").fetchone()[0] == 1
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("""DELETE FROM test;""")
+        sqlite_db.conn.rollback()
+
+
+def test_memory_database_reads_use_read_write_connection():
+    sqlite_db = SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+    with sqlite_db.read() as conn:
+        assert conn is sqlite_db.conn
+        assert sqlite_db.lock.locked()
+    assert not sqlite_db.lock.locked()
+
+
+def test_queued_writes_are_batched_and_isolated():
+    sqlite_db = SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+    sqlite_db.conn.execute("""CREATE TABLE test (id TEXT PRIMARY KEY);""")
+
+    def insert(id: str):
+        sqlite_db.write(lambda cursor: cursor.execute("""INSERT INTO test (id) VALUES (?);""", (id,)))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        with sqlite_db.lock:
+            # Writes queue up behind the lock, and are committed together once it is released
+            futures = [executor.submit(insert, str(i)) for i in range(8)]
+            futures.append(executor.submit(insert, "0"))
+            time.sleep(0.1)
+        errors = [f.exception() for f in futures]
+
+    # Only the duplicate failed, and it didn't roll back the other writes
+    assert sum(isinstance(e, sqlite3.IntegrityError) for e in errors) == 1
+    assert sqlite_db.conn.execute("""SELECT COUNT(*) FROM test;""").fetchone()[0] == 8
+    status = sqlite_db.get_status()
+    assert status.writes == 9
+    assert status.write_batches < 9
+
+
+def test_lock_records_stats_per_call_site():
+    sqlite_db = SqliteDatabase(InvokeAIAppConfig(use_memory_db=True), InvokeAILogger.get_logger())
+    storage = SqliteItemStorage[TestModel](db=sqlite_db, table_name="test", id_field="id")
+    storage.set(TestModel(id="1", name="Test"))
+    stats = {s.call_site: s for s in sqlite_db.get_status().lock_stats}
+    assert stats["item_storage_sqlite._create_table"].acquisitions == 1
+    assert stats["sqlite._write_batch"].acquisitions == 1
+    assert stats["sqlite._write_batch"].hold_time > 0